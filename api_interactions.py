@@ -3,6 +3,8 @@ import yaml
 import logging
 from typing import Dict, Any, Optional, List, Tuple
 import json
+import re
+import tracing
 
 class GNS3ApiError(Exception):
     """Custom exception for GNS3 API errors."""
@@ -28,41 +30,45 @@ class GNS3ApiClient:
     
     def _request(self, method: str, endpoint: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Make a request to the GNS3 API."""
-        url = f"{self.base_url}/{endpoint}"
-        self.logger.info(f"Making {method} request to {url}")
-    
-        try:
-            if method.lower() == 'get':
-                self.logger.info(f"GET Request to {url}")
-                self.logger.debug(f"Headers: {self.session.headers}")
-                self.logger.debug(f"Body: {json.dumps(data, indent=2)}")
-                self.logger.debug(f"Data: {data}")
-                self.logger.debug(f"URL: {url}")
-                response = self.session.get(url)
-            elif method.lower() == 'post':
-                self.logger.info(f"POST Request to {url}")
-                self.logger.debug(f"Headers: {self.session.headers}")
-                self.logger.debug(f"Body: {json.dumps(data, indent=2)}")
-                self.logger.debug(f"Data: {data}")
-                self.logger.debug(f"URL: {url}")
-                response = self.session.post(url, json=data)
-            elif method.lower() == 'put':
-                self.logger.info(f"PUT Request to {url}")
-                self.logger.debug(f"Headers: {self.session.headers}")
-                self.logger.debug(f"Body: {json.dumps(data, indent=2)}")
-                self.logger.debug(f"Data: {data}")
-                self.logger.debug(f"URL: {url}")
-                response = self.session.put(url, json=data)
-            elif method.lower() == 'delete':
-                response = self.session.delete(url)
-            else:
-                raise GNS3ApiError(f"Unsupported HTTP method: {method}")
-    
-            response.raise_for_status()
-            return response.json() if response.content else {}
-        except requests.exceptions.RequestException as e:
-            self.logger.error(f"API request failed: {str(e)}")
-            raise GNS3ApiError(f"API request failed: {str(e)}")
+        # IDs are replaced so requests to the same route can be aggregated
+        route = re.sub(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', '{id}', endpoint)
+        with tracing.span("gns3_api", method=method.upper(), route=route) as request_span:
+            url = f"{self.base_url}/{endpoint}"
+            self.logger.info(f"Making {method} request to {url}")
+    
+            try:
+                if method.lower() == 'get':
+                    self.logger.info(f"GET Request to {url}")
+                    self.logger.debug(f"Headers: {self.session.headers}")
+                    self.logger.debug(f"Body: {json.dumps(data, indent=2)}")
+                    self.logger.debug(f"Data: {data}")
+                    self.logger.debug(f"URL: {url}")
+                    response = self.session.get(url)
+                elif method.lower() == 'post':
+                    self.logger.info(f"POST Request to {url}")
+                    self.logger.debug(f"Headers: {self.session.headers}")
+                    self.logger.debug(f"Body: {json.dumps(data, indent=2)}")
+                    self.logger.debug(f"Data: {data}")
+                    self.logger.debug(f"URL: {url}")
+                    response = self.session.post(url, json=data)
+                elif method.lower() == 'put':
+                    self.logger.info(f"PUT Request to {url}")
+                    self.logger.debug(f"Headers: {self.session.headers}")
+                    self.logger.debug(f"Body: {json.dumps(data, indent=2)}")
+                    self.logger.debug(f"Data: {data}")
+                    self.logger.debug(f"URL: {url}")
+                    response = self.session.put(url, json=data)
+                elif method.lower() == 'delete':
+                    response = self.session.delete(url)
+                else:
+                    raise GNS3ApiError(f"Unsupported HTTP method: {method}")
+    
+                request_span.set_attribute("status_code", response.status_code)
+                response.raise_for_status()
+                return response.json() if response.content else {}
+            except requests.exceptions.RequestException as e:
+                self.logger.error(f"API request failed: {str(e)}")
+                raise GNS3ApiError(f"API request failed: {str(e)}")
     
     def get_projects(self) -> List[Dict[str, Any]]:
         """Get all projects."""
@@ -171,5 +177,20 @@ class GNS3ApiClient:
         """Update cloud node"""
         return self._request('put', f'projects/{project_id}/nodes/{node_id}', data)
     
+    def write_node_file(self, project_id: str, node_id: str, path: str, content: bytes) -> None:
+        """Write a file into the node directory on the GNS3 server."""
+        url = f"{self.base_url}/projects/{project_id}/nodes/{node_id}/files/{path}"
+        self.logger.info(f"POST Request to {url}")
+
+        with tracing.span("gns3_api", method="POST", route="projects/{id}/nodes/{id}/files/" + path,
+                          bytes=len(content)) as request_span:
+            try:
+                response = self.session.post(url, data=content)
+                request_span.set_attribute("status_code", response.status_code)
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                self.logger.error(f"API request failed: {str(e)}")
+                raise GNS3ApiError(f"API request failed: {str(e)}")
+
     def start_nodes(self, project_id):
         return self._request('post', f'projects/{project_id}/nodes/start')
\ No newline at end of file
@@ -0,0 +1,118 @@
+from typing import Dict, Any, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from data_model import Device, DeviceResult
+from weos_web import WeOSSessionPool, WeOSWebError
+import logging
+import tracing
+import math
+import time
+
+def rollout_groups(devices: List[Device], connection_data: Dict[str, Any]) -> List[List[Device]]:
+    """
+    Order devices into rollout groups by hop distance from the management station, furthest first,
+    so a device is never reconfigured before the devices behind it.
+    connection_data is the conn_dict of the physical project, where the 'cloud' entry is the
+    device WeConfig was connected to. Devices without a known path form the first group.
+    """
+    neighbours: Dict[str, set] = {}
+    for conn_id, conn_data in connection_data.items():
+        if conn_id == 'cloud':
+            continue
+        source = conn_data.get('SourceDeviceId')
+        target = conn_data.get('TargetDeviceId')
+        if source and target:
+            neighbours.setdefault(source, set()).add(target)
+            neighbours.setdefault(target, set()).add(source)
+
+    distance: Dict[str, int] = {}
+    root = connection_data.get('cloud', {}).get('TargetDeviceId')
+    if root:
+        distance[root] = 0
+        queue = deque([root])
+        while queue:
+            current = queue.popleft()
+            for neighbour in neighbours.get(current, ()):
+                if neighbour not in distance:
+                    distance[neighbour] = distance[current] + 1
+                    queue.append(neighbour)
+
+    groups: Dict[int, List[Device]] = {}
+    for device in devices:
+        groups.setdefault(distance.get(device.id, math.inf), []).append(device)
+    return [groups[hops] for hops in sorted(groups, reverse=True)]
+
+class ApplyExecutor:
+    """Applies NDT configurations to physical devices over their web interface in parallel."""
+
+    def __init__(self, session_pool: WeOSSessionPool, config: Optional[Dict[str, Any]] = None):
+        """Initialize the executor. config is the apply section of config.yaml."""
+        self.session_pool = session_pool
+        config = config or {}
+        self.max_workers = config.get('max_workers', 4)
+        self.device_timeout = config.get('device_timeout', 300)
+        self.rollout_order = config.get('rollout_order', 'furthest_first')
+        self.logger = logging.getLogger(__name__)
+
+    @tracing.traced("apply_device")
+    def apply_device(self, device: Device, config_file: str) -> DeviceResult:
+        """Restore config_file on a single physical device, giving up after device_timeout seconds without an answer."""
+        report = DeviceResult(device_id=device.id, name=device.name, details={'config_file': config_file})
+        start_time = time.perf_counter()
+
+        try:
+            self.session_pool.restore(f"https://{device.ip_address}", config_file, timeout=self.device_timeout)
+            report.success = True
+        except (WeOSWebError, OSError) as e:
+            report.error = str(e)
+
+        report.duration = time.perf_counter() - start_time
+        return report
+
+    def apply_all(self, jobs: List[Tuple[Device, str]],
+                  connection_data: Optional[Dict[str, Any]] = None) -> List[DeviceResult]:
+        """
+        Apply every (device, config file) job and return one result per device.
+        Rollout groups run one after another, devices within a group run in parallel.
+        If any device of a group fails, the groups closer to the management station are not
+        applied, as reconfiguring them could cut the path to the devices left in a bad state.
+        """
+        config_files = {device.id: config_file for device, config_file in jobs}
+        devices = [device for device, _ in jobs]
+        if self.rollout_order == 'furthest_first' and connection_data:
+            groups = rollout_groups(devices, connection_data)
+        else:
+            groups = [devices]
+
+        results: Dict[str, DeviceResult] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for index, group in enumerate(groups):
+                self.logger.info(f"Applying rollout group {index + 1}/{len(groups)}: "
+                                 f"{', '.join(str(device.name) for device in group)}")
+                # Every request of apply_device times out on its own, so the whole group finishes
+                futures = [executor.submit(tracing.propagate(self.apply_device), device, config_files[device.id])
+                           for device in group]
+                for future in futures:
+                    result = future.result()
+                    results[result.device_id] = result
+
+                failed = [device for device in group if not results[device.id].success]
+                for device in group:
+                    result = results[device.id]
+                    if result.success:
+                        self.logger.info(f"Applied configuration to {device.name} in {result.duration:.4f}s")
+                    else:
+                        self.logger.error(f"Failed to apply configuration to {device.name}: {result.error}")
+
+                if failed and index + 1 < len(groups):
+                    skipped = [device for later in groups[index + 1:] for device in later]
+                    self.logger.error(f"Stopping the rollout after group {index + 1}/{len(groups)}, "
+                                      f"{len(failed)} devices failed; not applying to "
+                                      f"{', '.join(str(device.name) for device in skipped)}")
+                    for device in skipped:
+                        results[device.id] = DeviceResult(
+                            device_id=device.id, name=device.name,
+                            error=f"Not applied, rollout stopped after {', '.join(str(d.name) for d in failed)} failed")
+                    break
+
+        return [results[device.id] for device in devices]
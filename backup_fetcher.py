@@ -0,0 +1,94 @@
+from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from data_model import DeviceResult
+from weos_web import WeOSSessionPool, WeOSWebError
+from backup_manifest import BACKUP_DIR, BACKUP_TIMESTAMP_FORMAT
+import argparse
+import logging
+import json
+import time
+import sys
+import os
+
+class BackupFetcher:
+    """
+    Fetches configuration backups from a known list of devices over the WeOS web API.
+    Backups are written as "Configuration Backups/<device-id>/<timestamp>.json",
+    the same layout WeConfig uses, so get_newest_file and build_manifest can read them.
+    """
+
+    def __init__(self, session_pool: WeOSSessionPool, max_workers: int = 8):
+        """Initialize the fetcher."""
+        self.session_pool = session_pool
+        self.max_workers = max_workers
+        self.logger = logging.getLogger(__name__)
+
+    def fetch_device(self, device_id: str, address: str, output_dir: str) -> DeviceResult:
+        """Fetch the backup of a single device."""
+        report = DeviceResult(device_id=device_id, name=address)
+        start_time = time.perf_counter()
+
+        device_dir = os.path.join(output_dir, BACKUP_DIR, device_id)
+        filename = datetime.now(timezone.utc).strftime(BACKUP_TIMESTAMP_FORMAT)
+        file_path = os.path.join(device_dir, filename)
+        # Written under a name that does not parse as a backup until it is complete
+        partial_path = file_path + ".part"
+
+        try:
+            os.makedirs(device_dir, exist_ok=True)
+            self.session_pool.backup(address, partial_path)
+            os.replace(partial_path, file_path)
+            report.success = True
+            report.details['file'] = file_path
+        except (WeOSWebError, OSError) as e:
+            report.error = str(e)
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+        report.duration = time.perf_counter() - start_time
+        if report.success:
+            self.logger.info(f"Fetched backup of {device_id} from {address} in {report.duration:.4f}s")
+        else:
+            self.logger.error(f"Failed to fetch backup of {device_id} from {address}: {report.error}")
+        return report
+
+    def fetch(self, devices: Dict[str, str], output_dir: str) -> List[DeviceResult]:
+        """Fetch backups of all devices (device ID -> web address) in parallel."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self.fetch_device, device_id, address, output_dir)
+                       for device_id, address in devices.items()]
+            return [future.result() for future in futures]
+
+if __name__ == "__main__":
+    # Also run on the GNS3 server, where the NDT devices are reachable
+    parser = argparse.ArgumentParser(description='Fetch WeOS configuration backups in parallel')
+    parser.add_argument('-o', '--output', type=str, required=True,
+                        help='Directory to write "Configuration Backups" into')
+    parser.add_argument('-d', '--device', action='append', default=[], metavar='ID=ADDRESS',
+                        help='Device ID and web address, i.e 6f57a661-...=https://1.2.3.4')
+    parser.add_argument('-u', '--username', type=str, default='admin')
+    parser.add_argument('-p', '--password', type=str, default='admin')
+    parser.add_argument('--password-stdin', action='store_true',
+                        help='Read the password from the first line of stdin, keeping it out of the process list')
+    parser.add_argument('-w', '--workers', type=int, default=8,
+                        help='Concurrent fetches (default: 8)')
+    parser.add_argument('-t', '--timeout', type=float, default=30,
+                        help='Seconds before a web request is given up (default: 30)')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.password_stdin:
+        args.password = sys.stdin.readline().rstrip('\n')
+
+    devices = dict(device.split('=', 1) for device in args.device)
+    session_pool = WeOSSessionPool(args.username, args.password, timeout=args.timeout)
+    fetcher = BackupFetcher(session_pool, args.workers)
+    results = fetcher.fetch(devices, args.output)
+    session_pool.close()
+
+    # Machine readable report on stdout, logs go to stderr
+    print(json.dumps([result.__dict__ for result in results]))
+    sys.exit(0 if all(result.success for result in results) else 1)
@@ -0,0 +1,84 @@
+from typing import Dict, Iterable, Optional
+from datetime import datetime
+import logging
+import os
+import shlex
+import zipfile
+
+# WeConfig stores backups as "Configuration Backups/<device-id>/<timestamp>.json"
+BACKUP_DIR = "Configuration Backups"
+BACKUP_TIMESTAMP_FORMAT = "%Y-%m-%dT%H_%M_%SZ.json"
+
+logger = logging.getLogger(__name__)
+
+def parse_backup_timestamp(filename: str) -> Optional[datetime]:
+    """Return the timestamp encoded in a backup file name, or None if it is not a backup."""
+    try:
+        return datetime.strptime(filename, BACKUP_TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+
+def newest_backup(filenames: Iterable[str]) -> Optional[str]:
+    """Return the newest backup file name out of filenames, or None if there is none."""
+    newest_file = None
+    newest_timestamp = None
+
+    for filename in filenames:
+        timestamp = parse_backup_timestamp(filename)
+        # Skip files that do not match the expected format
+        if timestamp is None:
+            continue
+        if newest_timestamp is None or timestamp > newest_timestamp:
+            newest_file = filename
+            newest_timestamp = timestamp
+
+    return newest_file
+
+def get_newest_file(directory: str) -> str:
+    """Returns the filename (as a string) of the newest file in the directory"""
+    newest_file = newest_backup(os.listdir(directory))
+
+    # Check if we found any valid files
+    if newest_file is None:
+        raise FileNotFoundError(f"No valid timestamped files found in {directory}")
+
+    return newest_file
+
+def build_manifest(source: str) -> Dict[str, str]:
+    """
+    Find the newest backup per device ID in an extracted project folder or a zipped .nprj.
+    Returns a dictionary of device ID -> path relative to the project root.
+    """
+    backups: Dict[str, list] = {}
+
+    if os.path.isdir(source):
+        backup_root = os.path.join(source, BACKUP_DIR)
+        if os.path.isdir(backup_root):
+            for device_id in os.listdir(backup_root):
+                device_dir = os.path.join(backup_root, device_id)
+                if os.path.isdir(device_dir):
+                    backups[device_id] = os.listdir(device_dir)
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source, 'r') as zip_ref:
+            for name in zip_ref.namelist():
+                # Archives written on Windows may use backslashes
+                parts = name.replace('\\', '/').split('/')
+                if len(parts) == 3 and parts[0] == BACKUP_DIR:
+                    backups.setdefault(parts[1], []).append(parts[2])
+    else:
+        raise FileNotFoundError(f"No project folder or archive at {source}")
+
+    manifest = {}
+    for device_id, filenames in backups.items():
+        newest_file = newest_backup(filenames)
+        if newest_file is None:
+            logger.warning(f"No valid timestamped backups for device {device_id}")
+            continue
+        manifest[device_id] = f"{BACKUP_DIR}/{device_id}/{newest_file}"
+
+    logger.debug(f"Manifest of {source}: {manifest}")
+    return manifest
+
+def remote_backup_path(folder_name: str, relative_path: str) -> str:
+    """Shell-safe path of a manifest entry inside ~/NDT/project_files on the GNS3 server."""
+    return "~/" + shlex.quote(f"NDT/project_files/{folder_name}/{relative_path}")
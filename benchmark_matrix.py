@@ -0,0 +1,284 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime
+from run_benchmark import run_main, run_in_process, AbandonedRunError, METADATA_FIELDS
+from main import NetworkDigitalTwin, setup_logging
+from results_store import ResultsStore, DEFAULT_DB, collect_environment, current_commit
+from metrics import MetricsExporter
+import benchmark_stats
+import itertools
+import argparse
+import copy
+import time
+import yaml
+import os
+
+class BenchmarkError(Exception):
+    """Custom exception for benchmark matrix errors."""
+    pass
+
+@dataclass
+class Scenario:
+    name: str
+    # Merged over the base config.yaml
+    overrides: Dict[str, Any] = field(default_factory=dict)
+    iterations: int = 10
+    warmup: int = 1
+
+def deep_merge(base: Dict[str, Any], overrides: Dict[str, Any]) -> Dict[str, Any]:
+    """Return base with overrides merged in, nested sections are merged key by key."""
+    merged = copy.deepcopy(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+def expand_matrix(axes: Dict[str, Dict[str, Dict[str, Any]]]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Cartesian product of named axes, each mapping a value name to its config overrides."""
+    names = list(axes)
+    scenarios = []
+    for values in itertools.product(*(list(axes[name].items()) for name in names)):
+        overrides: Dict[str, Any] = {}
+        for _, value_overrides in values:
+            overrides = deep_merge(overrides, value_overrides or {})
+        label = ",".join(f"{axis}={value_name}" for axis, (value_name, _) in zip(names, values))
+        scenarios.append((label, overrides))
+    return scenarios
+
+def load_matrix(path: str) -> Tuple[Dict[str, Any], List[Scenario]]:
+    """Load the benchmark settings and scenarios from a matrix file."""
+    try:
+        with open(path, 'r') as file:
+            matrix = yaml.safe_load(file) or {}
+    except Exception as e:
+        raise BenchmarkError(f"Failed to load benchmark matrix: {str(e)}")
+
+    settings = {
+        'iterations': matrix.get('iterations', 10),
+        'warmup': matrix.get('warmup', 1),
+        'timeout': matrix.get('timeout', 600),
+        'success_delay': matrix.get('success_delay', 60),
+        'failure_delay': matrix.get('failure_delay', 5),
+        'order': matrix.get('order', 'interleaved'),
+        # A new main.py process per run instead of one NetworkDigitalTwin per scenario
+        'cold': matrix.get('cold', False),
+    }
+
+    named = list((matrix.get('scenarios') or {}).items())
+    if matrix.get('matrix'):
+        named += expand_matrix(matrix['matrix'])
+    if not named:
+        named = [("baseline", {})]
+
+    scenarios = []
+    for name, overrides in named:
+        overrides = dict(overrides or {})
+        # Per-scenario run counts may sit next to the overrides
+        iterations = overrides.pop('iterations', settings['iterations'])
+        warmup = overrides.pop('warmup', settings['warmup'])
+        scenarios.append(Scenario(name=name, overrides=overrides, iterations=iterations, warmup=warmup))
+    return settings, scenarios
+
+class BenchmarkMatrix:
+    """
+    Runs main.py for every scenario of a matrix file and records one result per run.
+    Runs are interleaved across scenarios by default, so drift in the physical network
+    or the GNS3 server affects every scenario alike instead of biasing the later ones.
+    """
+
+    def __init__(self, matrix_path: str, base_config: str = "config.yaml",
+                 db_path: str = DEFAULT_DB, work_dir: str = "benchmark_runs"):
+        """Initialize the harness."""
+        self.settings, self.scenarios = load_matrix(matrix_path)
+        self.base_config = base_config
+        self.db_path = db_path
+        self.work_dir = work_dir
+        # Warm mode keeps one twin per scenario, its clients are reused across iterations
+        self.twins: Dict[str, NetworkDigitalTwin] = {}
+        # Shared by the twins, one exporter per twin would count the spans of every scenario
+        self.metrics: Optional[MetricsExporter] = None
+
+    def write_config(self, scenario: Scenario) -> str:
+        """Write the merged configuration of a scenario and return its path."""
+        with open(self.base_config, 'r') as file:
+            base = yaml.safe_load(file)
+        os.makedirs(self.work_dir, exist_ok=True)
+        path = os.path.join(self.work_dir, f"{scenario.name}.yaml")
+        with open(path, 'w') as file:
+            yaml.safe_dump(deep_merge(base, scenario.overrides), file, sort_keys=False)
+        return path
+
+    def schedule(self) -> List[Tuple[Scenario, int, bool]]:
+        """(scenario, iteration, warmup) for every run, in the order they are run."""
+        runs = {scenario.name: [(scenario, index, index < scenario.warmup)
+                                for index in range(scenario.warmup + scenario.iterations)]
+                for scenario in self.scenarios}
+        if self.settings['order'] == 'sequential':
+            return [run for scenario in self.scenarios for run in runs[scenario.name]]
+        rounds = max((len(scenario_runs) for scenario_runs in runs.values()), default=0)
+        return [runs[scenario.name][index] for index in range(rounds)
+                for scenario in self.scenarios if index < len(runs[scenario.name])]
+
+    def run(self) -> None:
+        commit = current_commit()
+        config_paths = {scenario.name: self.write_config(scenario) for scenario in self.scenarios}
+        schedule = self.schedule()
+        print(f"Running {len(schedule)} runs of {len(self.scenarios)} scenarios at commit {commit}")
+        print(f"Results will be saved to {self.db_path}")
+
+        if not self.settings['cold']:
+            setup_logging()
+            with open(self.base_config, 'r') as file:
+                self.metrics = MetricsExporter.from_config((yaml.safe_load(file) or {}).get('metrics', {}))
+            if self.metrics is not None:
+                self.metrics.start()
+        try:
+            with ResultsStore(self.db_path) as store:
+                for number, (scenario, iteration, warmup) in enumerate(schedule, start=1):
+                    print(f"\nRun {number}/{len(schedule)}")
+                    run_successful = self.run_one(store, scenario, iteration, warmup, commit,
+                                                  config_paths[scenario.name])
+                    if number < len(schedule):
+                        time.sleep(self.settings['success_delay'] if run_successful
+                                   else self.settings['failure_delay'])
+        except AbandonedRunError as e:
+            print(f"{e}. Stopping the matrix, restart it or set cold: true")
+        finally:
+            for twin in self.twins.values():
+                twin.close()
+            self.twins.clear()
+            if self.metrics is not None:
+                self.metrics.close()
+                self.metrics = None
+
+    def run_one(self, store: ResultsStore, scenario: Scenario, iteration: int, warmup: bool,
+                commit: Optional[str], config_path: str) -> bool:
+        """Run main.py once for a scenario and store the result. Returns whether the run succeeded."""
+        kind = "warmup" if warmup else f"iteration {iteration - scenario.warmup + 1}/{scenario.iterations}"
+        print(f"{scenario.name}, {kind}")
+
+        run_id = f"{scenario.name}-{iteration}"
+        started_at = datetime.now().isoformat(timespec='seconds')
+        trace_dir = os.path.join("benchmark_traces", scenario.name)
+        # Scenarios turn on profiling through their profiling overrides
+        profile_dir = os.path.join("benchmark_profiles", scenario.name)
+        try:
+            if self.settings['cold']:
+                timing_data, run_successful = run_main(run_id, self.settings['timeout'], config_path, trace_dir,
+                                                       profile_dir=profile_dir)
+            else:
+                if scenario.name not in self.twins:
+                    self.twins[scenario.name] = NetworkDigitalTwin(config_path, self.metrics)
+                timing_data, run_successful = run_in_process(self.twins[scenario.name], run_id,
+                                                             self.settings['timeout'], trace_dir, profile_dir)
+            error = timing_data.get('error')
+        except AbandonedRunError as e:
+            # The stuck run shares the GNS3 server with every scenario, so the matrix stops
+            store.add_run(False, {}, scenario=scenario.name, error=str(e), commit=commit,
+                          started_at=started_at, warmup=warmup, iteration=iteration,
+                          environment=dict(collect_environment(config_path), mode="warm"))
+            raise
+        except Exception as e:
+            print(f"Error during run {run_id}: {e}")
+            timing_data, run_successful, error = {}, False, str(e)
+
+        timings = {name: value for name, value in timing_data.items() if name not in METADATA_FIELDS}
+        store.add_run(run_successful, timings, scenario=scenario.name, error=error, commit=commit,
+                      started_at=started_at, warmup=warmup, iteration=iteration,
+                      trace_file=os.path.join(trace_dir, f"run_{run_id}.jsonl"),
+                      environment=dict(collect_environment(config_path),
+                                       mode="cold" if self.settings['cold'] else "warm"))
+        return run_successful
+
+def group_results(results: List[Dict[str, Any]], by: str = "scenario") -> Dict[str, List[Dict[str, Any]]]:
+    """Group run records by scenario, by commit, or by both as scenario@commit."""
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for record in results:
+        if by == "commit":
+            key = str(record.get('commit'))
+        elif by == "both":
+            key = f"{record['scenario']}@{record.get('commit')}"
+        else:
+            key = record['scenario']
+        groups.setdefault(key, []).append(record)
+    return groups
+
+def print_summary(results: List[Dict[str, Any]], by: str = "scenario", stages: Optional[List[str]] = None) -> None:
+    """Print success rate and per-stage percentiles with a 95% CI of the median for every group."""
+    for group, runs in group_results(results, by).items():
+        successes = sum(1 for run in runs if run.get('success'))
+        rate, low, high = benchmark_stats.success_rate(successes, len(runs))
+        print(f"\n{group}: {successes}/{len(runs)} successful runs, "
+              f"success rate {rate:.0%} (95% CI {low:.0%} - {high:.0%})")
+        print(f"  {'stage':<32}{'n':>4}{'p50':>10}{'p90':>10}{'p99':>10}{'median 95% CI':>24}")
+        for stage, values in benchmark_stats.stage_values(runs).items():
+            if stages and stage not in stages:
+                continue
+            summary = benchmark_stats.summarize(values, stage)
+            print(f"  {stage:<32}{summary.n:>4}{summary.p50:>10.3f}{summary.p90:>10.3f}{summary.p99:>10.3f}"
+                  f"{f'{summary.ci_low:.3f} - {summary.ci_high:.3f}':>24}")
+
+def print_comparison(results: List[Dict[str, Any]], group_a: str, group_b: str, by: str = "scenario",
+                     stages: Optional[List[str]] = None) -> bool:
+    """Compare two groups stage by stage. Returns True if any stage differs significantly."""
+    groups = group_results(results, by)
+    for group in (group_a, group_b):
+        if group not in groups:
+            raise BenchmarkError(f"No runs for {group}, known: {', '.join(groups)}")
+    values_a = benchmark_stats.stage_values(groups[group_a])
+    values_b = benchmark_stats.stage_values(groups[group_b])
+
+    print(f"{group_a} -> {group_b} (Mann-Whitney U, 95% bootstrap CI of the median difference)")
+    print(f"  {'stage':<32}{'median a':>10}{'median b':>10}{'change':>9}{'difference 95% CI':>24}{'p':>8}")
+    any_significant = False
+    for stage in values_a:
+        if stage not in values_b or (stages and stage not in stages):
+            continue
+        comparison = benchmark_stats.compare(values_a[stage], values_b[stage], stage)
+        marker = " *" if comparison.significant else ""
+        any_significant = any_significant or comparison.significant
+        print(f"  {stage:<32}{comparison.median_a:>10.3f}{comparison.median_b:>10.3f}{comparison.change:>9.1%}"
+              f"{f'{comparison.ci_low:.3f} - {comparison.ci_high:.3f}':>24}{comparison.p_value:>8.3f}{marker}")
+    print("* p < 0.05 and the confidence interval excludes zero")
+    return any_significant
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run and analyse a matrix of main.py benchmark scenarios')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Run every scenario of a matrix file')
+    run_parser.add_argument('matrix', type=str, help='Matrix file, i.e benchmark_matrix.yaml')
+    run_parser.add_argument('-c', '--config', type=str, default="config.yaml",
+                            help='Base configuration the scenarios are merged over (default: config.yaml)')
+    run_parser.add_argument('-d', '--db', type=str, default=DEFAULT_DB,
+                            help=f'Results database (default: {DEFAULT_DB})')
+
+    for name, help_text in (('summary', 'Per-stage percentiles and success rate'),
+                            ('compare', 'Significance test between two scenarios or commits')):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument('-d', '--db', type=str, default=DEFAULT_DB,
+                         help=f'Results database (default: {DEFAULT_DB})')
+        sub.add_argument('--since', type=str, default=None,
+                         help='Only runs started on or after this ISO date, i.e 2025-05-01')
+        sub.add_argument('--commit', type=str, default=None,
+                         help='Only runs made at this commit')
+        sub.add_argument('-b', '--by', choices=['scenario', 'commit', 'both'], default='scenario',
+                         help='Group runs by scenario, commit or scenario@commit (default: scenario)')
+        sub.add_argument('-s', '--stage', action='append', default=None,
+                         help='Only this stage, can be repeated')
+        if name == 'compare':
+            sub.add_argument('a', type=str, help='Baseline group')
+            sub.add_argument('b', type=str, help='Group compared to the baseline')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        BenchmarkMatrix(args.matrix, args.config, args.db).run()
+    else:
+        with ResultsStore(args.db) as store:
+            results = store.runs(commit=args.commit, since=args.since)
+        if args.command == 'summary':
+            print_summary(results, args.by, args.stage)
+        else:
+            print_comparison(results, args.a, args.b, args.by, args.stage)
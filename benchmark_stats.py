@@ -0,0 +1,205 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from collections import Counter
+import statistics
+import random
+import math
+
+@dataclass
+class StageSummary:
+    stage: str
+    n: int
+    mean: float
+    p50: float
+    p90: float
+    p99: float
+    # Bootstrap confidence interval of the median
+    ci_low: float
+    ci_high: float
+
+@dataclass
+class Comparison:
+    stage: str
+    n_a: int
+    n_b: int
+    median_a: float
+    median_b: float
+    # Relative change of the median from a to b, negative is faster
+    change: float
+    # Bootstrap confidence interval of median_b - median_a
+    ci_low: float
+    ci_high: float
+    # Two-sided Mann-Whitney U test
+    p_value: float
+
+    @property
+    def significant(self) -> bool:
+        return self.p_value < 0.05 and not (self.ci_low <= 0.0 <= self.ci_high)
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """p-th percentile (0-100) with linear interpolation between closest ranks."""
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    lower = math.floor(rank)
+    upper = math.ceil(rank)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+def bootstrap_ci(values: Sequence[float], statistic: Callable[[Sequence[float]], float] = statistics.median,
+                 confidence: float = 0.95, resamples: int = 2000,
+                 seed: Optional[int] = 0) -> Tuple[float, float]:
+    """Percentile bootstrap confidence interval of statistic."""
+    if len(values) < 2:
+        value = statistic(values) if values else math.nan
+        return value, value
+    rng = random.Random(seed)
+    estimates = sorted(statistic(rng.choices(values, k=len(values))) for _ in range(resamples))
+    alpha = (1 - confidence) / 2
+    return percentile(estimates, alpha * 100), percentile(estimates, (1 - alpha) * 100)
+
+def bootstrap_difference_ci(a: Sequence[float], b: Sequence[float], confidence: float = 0.95,
+                            resamples: int = 2000, seed: Optional[int] = 0) -> Tuple[float, float]:
+    """Percentile bootstrap confidence interval of median(b) - median(a)."""
+    if len(a) < 2 or len(b) < 2:
+        difference = statistics.median(b) - statistics.median(a) if a and b else math.nan
+        return difference, difference
+    rng = random.Random(seed)
+    estimates = sorted(statistics.median(rng.choices(b, k=len(b))) - statistics.median(rng.choices(a, k=len(a)))
+                       for _ in range(resamples))
+    alpha = (1 - confidence) / 2
+    return percentile(estimates, alpha * 100), percentile(estimates, (1 - alpha) * 100)
+
+def ranks(values: Sequence[float]) -> List[float]:
+    """Ranks starting at 1, tied values share the average of their ranks."""
+    order = sorted(range(len(values)), key=lambda index: values[index])
+    result = [0.0] * len(values)
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+            j += 1
+        for k in range(i, j + 1):
+            result[order[k]] = (i + j) / 2 + 1
+        i = j + 1
+    return result
+
+def mann_whitney_u(a: Sequence[float], b: Sequence[float]) -> float:
+    """
+    Two-sided p-value of the Mann-Whitney U test, normal approximation with tie correction.
+    Stage timings are skewed and have outliers, so ranks are used instead of a t-test.
+    """
+    n_a, n_b = len(a), len(b)
+    if n_a == 0 or n_b == 0:
+        return math.nan
+
+    combined = list(a) + list(b)
+    rank_sum_a = sum(ranks(combined)[:n_a])
+    tie_term = sum(ties ** 3 - ties for ties in Counter(combined).values())
+
+    u = rank_sum_a - n_a * (n_a + 1) / 2
+    n = n_a + n_b
+    variance = n_a * n_b / 12 * ((n + 1) - tie_term / (n * (n - 1))) if n > 1 else 0.0
+    if variance <= 0:
+        return 1.0
+    # Continuity correction
+    z = (abs(u - n_a * n_b / 2) - 0.5) / math.sqrt(variance)
+    return min(1.0, math.erfc(max(z, 0.0) / math.sqrt(2)))
+
+def pettitt(values: Sequence[float], min_segment: int = 1) -> Tuple[int, float]:
+    """
+    Pettitt's test for a single shift in the level of a series.
+    Returns the number of values before the most likely change and the approximate p-value.
+    Both segments are at least min_segment long.
+    """
+    n = len(values)
+    if n < 2 * min_segment or n < 2:
+        return 0, 1.0
+    rank_sum = 0.0
+    best_index, best_u = 0, 0.0
+    for index, rank in enumerate(ranks(values)[:n - min_segment], start=1):
+        rank_sum += rank
+        # Mann-Whitney statistic of the first index values against the rest, centred on zero
+        u = 2 * rank_sum - index * (n + 1)
+        if index >= min_segment and abs(u) > abs(best_u):
+            best_index, best_u = index, u
+    if best_index == 0:
+        return 0, 1.0
+    p_value = 2 * math.exp(-6 * best_u ** 2 / (n ** 3 + n ** 2))
+    return best_index, min(1.0, p_value)
+
+def change_points(values: Sequence[float], alpha: float = 0.01, min_segment: int = 5) -> List[Tuple[int, float]]:
+    """
+    Indexes where the level of a series shifts, found by binary segmentation with Pettitt's test.
+    Returns (index of the first value after the change, p-value) in series order.
+    """
+    found: List[Tuple[int, float]] = []
+
+    def split(start: int, end: int) -> None:
+        if end - start < 2 * min_segment:
+            return
+        index, p_value = pettitt(values[start:end], min_segment)
+        if index == 0 or p_value >= alpha:
+            return
+        found.append((start + index, p_value))
+        split(start, start + index)
+        split(start + index, end)
+
+    split(0, len(values))
+    return sorted(found)
+
+def success_rate(successes: int, total: int) -> Tuple[float, float, float]:
+    """Success rate with its 95% Wilson score interval."""
+    if total == 0:
+        return math.nan, math.nan, math.nan
+    z = 1.96
+    rate = successes / total
+    denominator = 1 + z ** 2 / total
+    center = (rate + z ** 2 / (2 * total)) / denominator
+    margin = z * math.sqrt(rate * (1 - rate) / total + z ** 2 / (4 * total ** 2)) / denominator
+    return rate, max(0.0, center - margin), min(1.0, center + margin)
+
+def summarize(values: Sequence[float], stage: str = "") -> StageSummary:
+    """Percentiles and median confidence interval of the timings of one stage."""
+    ci_low, ci_high = bootstrap_ci(values)
+    return StageSummary(stage=stage, n=len(values), mean=statistics.fmean(values) if values else math.nan,
+                        p50=percentile(values, 50), p90=percentile(values, 90), p99=percentile(values, 99),
+                        ci_low=ci_low, ci_high=ci_high)
+
+def compare(a: Sequence[float], b: Sequence[float], stage: str = "") -> Comparison:
+    """Compare the timings of one stage between two sets of runs."""
+    median_a = statistics.median(a) if a else math.nan
+    median_b = statistics.median(b) if b else math.nan
+    ci_low, ci_high = bootstrap_difference_ci(a, b)
+    change = (median_b - median_a) / median_a if median_a else math.nan
+    return Comparison(stage=stage, n_a=len(a), n_b=len(b), median_a=median_a, median_b=median_b,
+                      change=change, ci_low=ci_low, ci_high=ci_high, p_value=mann_whitney_u(a, b))
+
+def variance_contribution(values: Sequence[float], totals: Sequence[float]) -> float:
+    """
+    Share of the variance of totals that moves with values, cov(values, totals) / var(totals).
+    For stages that add up to the total the shares sum to 1, stages running alongside
+    the critical path get a share near 0 however much they vary themselves.
+    """
+    n = len(values)
+    if n < 2 or n != len(totals):
+        return math.nan
+    mean_values = statistics.fmean(values)
+    mean_totals = statistics.fmean(totals)
+    variance = sum((total - mean_totals) ** 2 for total in totals) / (n - 1)
+    if variance == 0:
+        return math.nan
+    covariance = sum((value - mean_values) * (total - mean_totals)
+                     for value, total in zip(values, totals)) / (n - 1)
+    return covariance / variance
+
+def stage_values(runs: List[Dict[str, float]], successful_only: bool = True) -> Dict[str, List[float]]:
+    """Collect the timings of every stage over a list of runs (each with 'success' and 'timings')."""
+    values: Dict[str, List[float]] = {}
+    for run in runs:
+        if successful_only and not run.get('success'):
+            continue
+        for stage, value in run.get('timings', {}).items():
+            if value is not None:
+                values.setdefault(stage, []).append(float(value))
+    return values
@@ -1,9 +1,19 @@
+from results_store import ResultsStore, DEFAULT_DB
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
+import argparse
 
-# Load the CSV file
-df = pd.read_csv('benchmark_results.csv')
+parser = argparse.ArgumentParser(description='Box plots of the stage times of the stored benchmark runs')
+parser.add_argument('-d', '--db', type=str, default=DEFAULT_DB,
+                    help=f'Results database (default: {DEFAULT_DB})')
+parser.add_argument('-s', '--scenario', type=str, default=None, help='Only runs of this scenario')
+parser.add_argument('--since', type=str, default=None, help='Only runs started on or after this ISO date')
+args = parser.parse_args()
+
+# Load the runs from the results store, one column per stage
+with ResultsStore(args.db) as store:
+    df = pd.DataFrame(store.wide_rows(scenario=args.scenario, since=args.since))
 
 # Filter rows where success is True
 df_success = df[df['success'] == True]
@@ -0,0 +1,186 @@
+from typing import Dict, Any, List, Optional, Tuple, Union, Pattern
+from concurrent.futures import ThreadPoolExecutor
+from data_model import DeviceResult
+from ssh_manager import SSHConnectionManager, SSHError
+import logging
+import tracing
+import select
+import time
+import re
+
+class CliError(Exception):
+    """Custom exception for interactive CLI errors."""
+    pass
+
+class CliTimeoutError(CliError):
+    """Raised when an expected pattern does not appear before its deadline."""
+    pass
+
+class ExpectSession:
+    """
+    Expect-style driver for an interactive paramiko channel.
+    Waits on the channel with select, so it wakes as soon as data arrives
+    instead of sleeping between polls.
+    """
+
+    def __init__(self, channel, default_timeout: float = 30):
+        """Initialize the session on an already opened shell channel."""
+        self.channel = channel
+        self.default_timeout = default_timeout
+        self.buffer = ""
+        self.logger = logging.getLogger(__name__)
+
+    def send(self, text: str) -> None:
+        """Send raw text to the channel."""
+        self.logger.debug(f"Sending: {text!r}")
+        self.channel.sendall(text.encode('utf-8'))
+
+    def sendline(self, line: str) -> None:
+        """Send a line of text followed by a newline."""
+        self.send(f"{line}\n")
+
+    def expect(self, patterns: List[Union[str, Pattern]], timeout: Optional[float] = None) -> Tuple[int, str]:
+        """
+        Wait until one of the regular expressions in patterns appears in the output.
+        Returns the index of the matched pattern and the output up to and including the match.
+        Raises CliTimeoutError if nothing matches before the deadline.
+        """
+        compiled = [re.compile(pattern) if isinstance(pattern, str) else pattern for pattern in patterns]
+        timeout = self.default_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            # Pick the match that appears first in the buffer
+            best = None
+            for index, pattern in enumerate(compiled):
+                match = pattern.search(self.buffer)
+                if match and (best is None or match.start() < best[1].start()):
+                    best = (index, match)
+            if best:
+                index, match = best
+                output = self.buffer[:match.end()]
+                self.buffer = self.buffer[match.end():]
+                self.logger.debug(f"Matched {compiled[index].pattern!r}")
+                return index, output
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise CliTimeoutError(f"Timed out after {timeout}s waiting for {[p.pattern for p in compiled]}, "
+                                      f"last output: {self.buffer[-200:]!r}")
+
+            readable, _, _ = select.select([self.channel], [], [], remaining)
+            if readable:
+                chunk = self.channel.recv(8192)
+                if not chunk:
+                    raise CliError(f"Channel closed while waiting for {[p.pattern for p in compiled]}")
+                text = chunk.decode('utf-8', errors='ignore')
+                self.logger.debug(f"Received output: {text}")
+                self.buffer += text
+
+    def close(self) -> None:
+        """Close the underlying channel."""
+        self.channel.close()
+
+class WeOSCliSession:
+    """Logs in to a WeOS device CLI through the GNS3 server and runs commands."""
+
+    PROMPT = r":/#>"
+    PASSWORD = r"(?i)password:"
+    CONFIRM_HOST_KEY = r"Are you sure you want to continue connecting"
+    HOST_KEY_CHANGED = r"WARNING: REMOTE HOST IDENTIFICATION HAS CHANGED"
+    KEY_REMOVE_COMMAND = re.compile(r"ssh-keygen -f .* -R .*")
+
+    def __init__(self, ssh_manager: SSHConnectionManager, hostname: str):
+        """Initialize the session with CLI settings from the connection manager's configuration."""
+        self.ssh_manager = ssh_manager
+        self.hostname = hostname
+        configuration = ssh_manager.config.get('configuration', {})
+        self.username = configuration.get('username', 'admin')
+        self.password = configuration.get('password', 'admin')
+        cli_config = ssh_manager.config.get('cli', {})
+        self.login_timeout = cli_config.get('login_timeout', 60)
+        self.command_timeout = cli_config.get('command_timeout', 30)
+        self.session: Optional[ExpectSession] = None
+        self.logger = logging.getLogger(__name__)
+
+    def login(self) -> None:
+        """Open a shell on the GNS3 server and SSH from there into the device."""
+        self.session = ExpectSession(self.ssh_manager.open_shell(), self.login_timeout)
+        self.logger.debug(f"Starting SSH connection to {self.hostname}")
+        self.session.sendline(f"ssh {self.username}@{self.hostname}")
+
+        retried = False
+        while True:
+            index, output = self.session.expect([self.HOST_KEY_CHANGED, self.CONFIRM_HOST_KEY,
+                                                 self.PASSWORD, self.PROMPT])
+            if index == 0:
+                if retried:
+                    raise CliError(f"Host key for {self.hostname} still rejected after removal")
+                # The full warning, including the ssh-keygen hint, ends with the failed connection
+                _, output = self.session.expect([r"(?i)host key verification failed"])
+                match = self.KEY_REMOVE_COMMAND.search(output)
+                if not match:
+                    raise CliError("Could not find key removal command in error message")
+                self.logger.debug("Host key has changed. Removing old key and retrying.")
+                self.session.sendline(match.group(0).strip())
+                self.session.sendline(f"ssh {self.username}@{self.hostname}")
+                retried = True
+            elif index == 1:
+                self.logger.debug("Host key verification prompt detected, sending 'yes'")
+                self.session.sendline("yes")
+            elif index == 2:
+                self.logger.debug("Password prompt detected, sending password")
+                self.session.sendline(self.password)
+            else:
+                self.logger.debug(f"Logged in to {self.hostname}")
+                return
+
+    def run(self, command: str, timeout: Optional[float] = None) -> str:
+        """Run a CLI command and return its output once the prompt comes back."""
+        if self.session is None:
+            raise CliError("Not logged in")
+        self.session.sendline(command)
+        _, output = self.session.expect([self.PROMPT], timeout or self.command_timeout)
+        return output
+
+    def close(self) -> None:
+        """Close the session."""
+        if self.session:
+            self.session.close()
+            self.session = None
+
+    def __enter__(self):
+        self.login()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def run_cli_commands(ssh_manager: SSHConnectionManager, jobs: Dict[str, List[str]],
+                     max_workers: Optional[int] = None) -> List[DeviceResult]:
+    """
+    Run a list of CLI commands on many devices concurrently.
+    jobs maps device hostnames to the commands to run, in order.
+    """
+    logger = logging.getLogger(__name__)
+    max_workers = max_workers or ssh_manager.config.get('cli', {}).get('max_concurrent_sessions', 8)
+
+    @tracing.traced("cli_session")
+    def run_job(hostname: str, commands: List[str]) -> DeviceResult:
+        report = DeviceResult(device_id=hostname, name=hostname)
+        start_time = time.perf_counter()
+        try:
+            with WeOSCliSession(ssh_manager, hostname) as session:
+                report.details['output'] = [session.run(command) for command in commands]
+            report.success = True
+        except (CliError, SSHError, OSError) as e:
+            report.error = str(e)
+            logger.error(f"CLI session on {hostname} failed: {report.error}")
+        report.duration = time.perf_counter() - start_time
+        return report
+
+    if not jobs:
+        return []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(tracing.propagate(run_job), hostname, commands) for hostname, commands in jobs.items()]
+        return [future.result() for future in futures]
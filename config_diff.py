@@ -0,0 +1,88 @@
+from dataclasses import dataclass, field
+from typing import Any, Iterable, List, Optional
+import hashlib
+import json
+
+# Fields of the backup's metadata header that change between two backups of the same
+# configuration, as dotted paths from the root. Keys with the same name deeper down, such as
+# the "time" (NTP) section, are configuration and are compared.
+DEFAULT_VOLATILE_PATHS = ["timestamp", "date", "created", "modified", "uptime", "generated"]
+
+@dataclass
+class ConfigDiff:
+    changed: bool
+    ndt_hash: str
+    physical_hash: Optional[str] = None
+    differences: List[str] = field(default_factory=list)
+
+def normalize_config(data: Any, volatile_paths: Iterable[str], path: str = "") -> Any:
+    """
+    Return a copy of a WeOS JSON backup without the volatile fields.
+    A field is volatile if its full dotted path, i.e "header.created", is in volatile_paths.
+    List items share the path of their list.
+    """
+    volatile = {volatile_path.lower() for volatile_path in volatile_paths}
+    if isinstance(data, dict):
+        normalized = {}
+        for key, value in data.items():
+            key_path = f"{path}.{key}" if path else str(key)
+            if key_path.lower() not in volatile:
+                normalized[key] = normalize_config(value, volatile, key_path)
+        return normalized
+    if isinstance(data, list):
+        return [normalize_config(item, volatile, path) for item in data]
+    return data
+
+def config_hash(data: Any) -> str:
+    """SHA-256 of the canonical JSON form of a normalized configuration."""
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def diff_configs(old: Any, new: Any, path: str = "") -> List[str]:
+    """List the paths that differ between two normalized configurations."""
+    if isinstance(old, dict) and isinstance(new, dict):
+        differences = []
+        for key in sorted(set(old) | set(new), key=str):
+            key_path = f"{path}.{key}" if path else str(key)
+            if key not in old:
+                differences.append(f"{key_path}: added {json.dumps(new[key])}")
+            elif key not in new:
+                differences.append(f"{key_path}: removed")
+            else:
+                differences.extend(diff_configs(old[key], new[key], key_path))
+        return differences
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        differences = []
+        for index, (old_item, new_item) in enumerate(zip(old, new)):
+            differences.extend(diff_configs(old_item, new_item, f"{path}[{index}]"))
+        return differences
+    if old != new:
+        return [f"{path or '<root>'}: {json.dumps(old)} -> {json.dumps(new)}"]
+    return []
+
+class ConfigDiffer:
+    """Compares NDT backups against the last backup of the physical device."""
+
+    def __init__(self, volatile_paths: Optional[Iterable[str]] = None):
+        """Initialize the differ with the paths of the fields to ignore."""
+        self.volatile_paths = list(volatile_paths if volatile_paths is not None else DEFAULT_VOLATILE_PATHS)
+
+    def load(self, config_file: str) -> Any:
+        """Load and normalize a JSON backup."""
+        with open(config_file, 'r', encoding='utf-8') as f:
+            return normalize_config(json.load(f), self.volatile_paths)
+
+    def compare(self, ndt_file: str, physical_file: Optional[str]) -> ConfigDiff:
+        """Compare an NDT backup with the physical backup. A missing physical backup counts as changed."""
+        ndt_config = self.load(ndt_file)
+        ndt_hash = config_hash(ndt_config)
+        if physical_file is None:
+            return ConfigDiff(changed=True, ndt_hash=ndt_hash, differences=["no physical backup"])
+
+        physical_config = self.load(physical_file)
+        physical_hash = config_hash(physical_config)
+        if physical_hash == ndt_hash:
+            return ConfigDiff(changed=False, ndt_hash=ndt_hash, physical_hash=physical_hash)
+
+        return ConfigDiff(changed=True, ndt_hash=ndt_hash, physical_hash=physical_hash,
+                          differences=diff_configs(physical_config, ndt_config))
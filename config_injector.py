@@ -0,0 +1,67 @@
+from typing import Dict, Any, List
+from api_interactions import GNS3ApiClient, GNS3ApiError
+import logging
+import yaml
+import zipfile
+import io
+
+class ConfigInjector:
+    """Places device configurations on the config disk of GNS3 nodes before they boot."""
+
+    # GNS3 unpacks config.zip from the node directory onto the QEMU config disk at start
+    CONFIG_ARCHIVE = "config.zip"
+
+    def __init__(self, api_client=None, config_path: str = "config.yaml"):
+        """Initialize the config injector."""
+        self.api_client = api_client or GNS3ApiClient(config_path)
+        self.config = self._load_config(config_path)
+        self.logger = logging.getLogger(__name__)
+
+    def _load_config(self, config_path: str) -> Dict[str, Any]:
+        """Load configuration from a YAML file."""
+        try:
+            with open(config_path, 'r') as file:
+                return yaml.safe_load(file)
+        except Exception as e:
+            self.logger.error(f"Failed to load configuration: {str(e)}")
+            raise ValueError(f"Failed to load configuration: {str(e)}")
+
+    def _build_config_archive(self, config_file: str) -> bytes:
+        """Pack a device configuration into the archive GNS3 copies to the config disk."""
+        filename = self.config.get('configuration', {}).get('boot_config_filename', 'startup-config.json')
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.write(config_file, arcname=filename)
+        return buffer.getvalue()
+
+    def inject(self, project_id: str, node_mapping: Dict[str, str], config_files: Dict[str, str]) -> List[str]:
+        """
+        Write each device's configuration to its node before start_nodes is called.
+        config_files maps device IDs to local backup files. Returns the IDs of configured devices.
+        """
+        configured = []
+
+        for device_id, config_file in config_files.items():
+            node_id = node_mapping.get(device_id)
+            if not node_id:
+                self.logger.warning(f"Skipping device {device_id}: Device not found in node mapping")
+                continue
+
+            try:
+                archive = self._build_config_archive(config_file)
+                self.api_client.write_node_file(project_id, node_id, self.CONFIG_ARCHIVE, archive)
+
+                # Ask GNS3 to attach a config disk built from config.zip when the node starts
+                self.api_client.update_node(project_id, node_id, {
+                    "properties": {
+                        "create_config_disk": True
+                    }
+                })
+
+                configured.append(device_id)
+                self.logger.info(f"Injected configuration for device {device_id} from {config_file}")
+            except (GNS3ApiError, OSError) as e:
+                self.logger.error(f"Failed to inject configuration for device {device_id}: {str(e)}")
+
+        return configured
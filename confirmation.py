@@ -0,0 +1,137 @@
+from typing import Dict, Any, Callable, Iterable, Optional
+from concurrent.futures import ThreadPoolExecutor
+from ssh_manager import SSHConnectionManager, SSHError
+import threading
+import logging
+import tracing
+import json
+import time
+
+# Dotted paths of the system hostname in a WeOS JSON backup, tried in order. Only these are
+# read, since syslog, NTP and RADIUS entries have hostname keys of their own.
+HOSTNAME_PATHS = [
+    "ietf-system:system.hostname",
+    "system.hostname",
+    "config.ietf-system:system.hostname",
+    "config.system.hostname",
+    "hostname",
+    "config.hostname",
+]
+
+def config_hostname(config_file: str, paths: Iterable[str] = HOSTNAME_PATHS) -> Optional[str]:
+    """Return the system hostname stored in a WeOS JSON backup, or None if it has none."""
+    with open(config_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    for path in paths:
+        node = data
+        for key in path.split('.'):
+            node = node.get(key) if isinstance(node, dict) else None
+        if isinstance(node, str) and node:
+            return node
+    return None
+
+class ChangeConfirmer:
+    """
+    Waits until each device proves that a pending change is applied,
+    by polling it from the GNS3 server until it answers under its expected name.
+    """
+
+    def __init__(self, ssh_manager: SSHConnectionManager):
+        """Initialize the confirmer with settings from the connection manager's configuration."""
+        self.ssh_manager = ssh_manager
+        self.config = ssh_manager.config.get('confirmation', {})
+        self.interval = self.config.get('interval', 1)
+        self.max_workers = self.config.get('max_concurrent_checks', 8)
+        self.logger = logging.getLogger(__name__)
+
+    def mdns_reachable(self, hostname: str) -> bool:
+        """Check whether hostname resolves over mDNS and answers a ping from the GNS3 server."""
+        try:
+            return self.ssh_manager.exec_command(f"ping -c 1 -W 1 {hostname}").exit_status == 0
+        except SSHError as e:
+            self.logger.debug(f"Check of {hostname} failed: {str(e)}")
+            return False
+
+    def reload_check(self, hostname: str, drop_timeout: float) -> Callable[[], Optional[bool]]:
+        """
+        Check for a name the device already answered to before the change. It passes once the
+        name has stopped answering and answers again, and gives up (None) if the name never
+        stops answering within drop_timeout seconds, since then nothing proves the change.
+        """
+        deadline = time.perf_counter() + drop_timeout
+        dropped = threading.Event()
+
+        def check() -> Optional[bool]:
+            reachable = self.mdns_reachable(hostname)
+            if not reachable:
+                dropped.set()
+                return False
+            if dropped.is_set():
+                return True
+            return None if time.perf_counter() >= deadline else False
+        return check
+
+    def wait_for(self, checks: Dict[str, Callable[[], Optional[bool]]], timeout: float,
+                 check_name: str = "reachable") -> Dict[str, Optional[float]]:
+        """
+        Run every check until it passes or the deadline expires. A check returning None gives up.
+        Returns the seconds until each key was confirmed, or None if it never was.
+        Each outcome is recorded in the trace as a readiness event named after the check.
+        """
+        start_time = time.perf_counter()
+        deadline = start_time + timeout
+        pending = dict(checks)
+        confirmed: Dict[str, Optional[float]] = {key: None for key in checks}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending:
+                round_start = time.perf_counter()
+                futures = {key: executor.submit(tracing.propagate(check)) for key, check in pending.items()}
+                for key, future in futures.items():
+                    result = future.result()
+                    if result:
+                        confirmed[key] = time.perf_counter() - start_time
+                        del pending[key]
+                        self.logger.debug(f"Confirmed {key} after {confirmed[key]:.4f}s")
+                    elif result is None:
+                        del pending[key]
+                        self.logger.warning(f"{key} cannot be confirmed, its check gave up")
+
+                if not pending or time.perf_counter() >= deadline:
+                    break
+                time.sleep(max(0, min(self.interval - (time.perf_counter() - round_start),
+                                      deadline - time.perf_counter())))
+
+        for key in pending:
+            self.logger.warning(f"{key} not confirmed within {timeout}s")
+        for key, seconds in confirmed.items():
+            tracing.event("node_ready", "readiness", check=check_name, node=key, seconds=seconds)
+        return confirmed
+
+    def wait_for_hostnames(self, hostnames: Iterable[str], timeout: Optional[float] = None) -> Dict[str, Optional[float]]:
+        """Wait until every hostname answers over mDNS."""
+        timeout = timeout or self.config.get('hostname_timeout', 60)
+        checks = {hostname: (lambda hostname=hostname: self.mdns_reachable(hostname)) for hostname in hostnames}
+        return self.wait_for(checks, timeout, "hostname")
+
+    def wait_for_configuration(self, expected_hostnames: Dict[str, str],
+                               previous_hostnames: Optional[Dict[str, str]] = None,
+                               timeout: Optional[float] = None) -> Dict[str, Optional[float]]:
+        """
+        Wait until each restored device answers under the hostname of its configuration.
+        expected_hostnames maps device IDs to the mDNS name of the restored backup,
+        previous_hostnames to the name each device answered to before the restore.
+        A device expected under the name it already had, such as the default <family>-<mac>
+        name, answers at once, so it has to drop off and come back before it counts.
+        """
+        timeout = timeout or self.config.get('configuration_timeout', 120)
+        drop_timeout = self.config.get('reload_drop_timeout', 30)
+        previous_hostnames = previous_hostnames or {}
+        checks: Dict[str, Callable[[], Optional[bool]]] = {}
+        for device_id, hostname in expected_hostnames.items():
+            if hostname.lower() == previous_hostnames.get(device_id, "").lower():
+                checks[device_id] = self.reload_check(hostname, drop_timeout)
+            else:
+                checks[device_id] = lambda hostname=hostname: self.mdns_reachable(hostname)
+        return self.wait_for(checks, timeout, "configuration")
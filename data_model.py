@@ -32,3 +32,17 @@ class Device:
     #net_mask: Optional[str] = None
     ports: Dict[str, Port] = field(default_factory=dict)
     vlans: Optional[Dict[str, Vlan]] = field(default_factory=dict)
+
+    def mdns_hostname(self) -> str:
+        """Default WeOS mDNS name, <family>-<last three MAC octets>.local"""
+        mac_suffix = "-".join(self.base_mac.split(":")[-3:])
+        return f"{self.family}-{mac_suffix}.local"
+
+@dataclass
+class DeviceResult:
+    device_id: str
+    name: Optional[str] = None
+    success: bool = False
+    duration: float = 0.0
+    error: Optional[str] = None
+    details: Dict[str, Any] = field(default_factory=dict)
@@ -0,0 +1,140 @@
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from weconfig import run_scan
+import xml.etree.ElementTree as ET
+import logging
+import zipfile
+import socket
+import shutil
+import json
+import time
+import os
+
+@dataclass
+class DiscoveredDevice:
+    id: str
+    mac: Optional[str] = None
+    ip: Optional[str] = None
+    firmware: Optional[str] = None
+    family: Optional[str] = None
+
+def devices_from_project(project_path: str) -> List[DiscoveredDevice]:
+    """Read the identity of every discovered device from a .nprj project."""
+    with zipfile.ZipFile(project_path, 'r') as zip_ref:
+        with zip_ref.open("Project.xml") as project_xml:
+            root = ET.parse(project_xml).getroot()
+
+    devices = []
+    for child in root.iter():
+        if 'Family' not in child.attrib:
+            continue
+        device = DiscoveredDevice(id=child.attrib.get('Id'),
+                                  firmware=child.attrib.get('FirmwareVersion'),
+                                  family=child.attrib.get('Family'))
+        for info in child.iter():
+            if 'ManagementIpAddress' in info.tag:
+                device.ip = info.text
+            if 'ChassisId' in info.tag:
+                device.mac = info.text
+        devices.append(device)
+    return devices
+
+class DiscoveryCache:
+    """
+    Incremental physical discovery.
+    Keeps the device set of the last full WeConfig discover and, on later runs, only checks
+    that those devices still answer with the same identity. A full discover runs when the
+    check finds a change or when full_scan_interval has passed. New devices are therefore
+    only picked up by the scheduled full discover.
+    """
+
+    STATE_FILE = "devices.json"
+    PROJECT_FILE = "project.nprj"
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """Initialize the cache. config is the physical_scan section of config.yaml."""
+        config = config or {}
+        self.cache_dir = config.get('cache_dir', '.discovery_cache')
+        self.full_scan_interval = config.get('full_scan_interval', 3600)
+        self.probe_timeout = config.get('probe_timeout', 2)
+        self.probe_port = config.get('probe_port', 443)
+        self.fingerprint = config.get('fingerprint', 'mdns')
+        self.logger = logging.getLogger(__name__)
+
+    def _state_path(self) -> str:
+        return os.path.join(self.cache_dir, self.STATE_FILE)
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Return the cached state, or None if there is no usable cache."""
+        try:
+            with open(self._state_path(), 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(os.path.join(self.cache_dir, self.PROJECT_FILE)):
+            return None
+        state['devices'] = [DiscoveredDevice(**device) for device in state['devices']]
+        return state
+
+    def save(self, project_path: str) -> None:
+        """Store the device set and project of a full discover."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        shutil.copyfile(project_path, os.path.join(self.cache_dir, self.PROJECT_FILE))
+        state = {
+            'scanned_at': time.time(),
+            'devices': [asdict(device) for device in devices_from_project(project_path)]
+        }
+        with open(self._state_path(), 'w') as f:
+            json.dump(state, f, indent=2)
+
+    def probe(self, device: DiscoveredDevice) -> bool:
+        """Check that a known device is alive at its address and still is the same device."""
+        if not device.ip:
+            return False
+        try:
+            with socket.create_connection((device.ip, self.probe_port), timeout=self.probe_timeout):
+                pass
+        except OSError:
+            self.logger.debug(f"Device {device.id} does not answer on {device.ip}:{self.probe_port}")
+            return False
+
+        if self.fingerprint == 'mdns' and device.mac and device.family:
+            # WeOS announces <family>-<last three MAC octets>.local, which ties the address to the MAC
+            hostname = f"{device.family}-{'-'.join(device.mac.split(':')[-3:])}.local"
+            try:
+                addresses = {info[4][0] for info in socket.getaddrinfo(hostname, None, socket.AF_INET)}
+            except OSError:
+                self.logger.debug(f"Could not resolve {hostname}")
+                return False
+            if device.ip not in addresses:
+                self.logger.debug(f"{hostname} moved from {device.ip} to {addresses}")
+                return False
+        return True
+
+    def scan(self, project_path: str, adapter: str,
+             discover: Optional[Callable[[str, str], Any]] = None) -> bool:
+        """
+        Produce a discovered project at project_path, with a full discover only when needed.
+        discover(project_path, adapter) runs the full discover and defaults to run_scan.
+        Returns True if a full discover was run.
+        """
+        state = self.load()
+        if state is None:
+            self.logger.info("No discovery cache, running full discover")
+        elif time.time() - state['scanned_at'] > self.full_scan_interval:
+            self.logger.info("Scheduled full discover")
+            state = None
+        else:
+            devices = state['devices']
+            with ThreadPoolExecutor(max_workers=max(1, min(len(devices), 16))) as executor:
+                alive = list(executor.map(self.probe, devices))
+            if devices and all(alive):
+                shutil.copyfile(os.path.join(self.cache_dir, self.PROJECT_FILE), project_path)
+                self.logger.info(f"All {len(devices)} known devices confirmed, reusing cached discovery")
+                return False
+            self.logger.info(f"{alive.count(False)} of {len(devices)} known devices changed, running full discover")
+
+        (discover or run_scan)(project_path, adapter)
+        self.save(project_path)
+        return True
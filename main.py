@@ -1,12 +1,10 @@
-from typing import Dict, Any, Type, Set
+from typing import Dict, Any, Optional, Type, Set
 from data_model import Device, Port, Vlan
-from dataclasses import fields
-from scp import SCPClient
+from dataclasses import dataclass, field, fields
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import paramiko
 
 import json
-import time
 import subprocess
 import os
 import zipfile
@@ -15,29 +13,43 @@ import platform
 import random
 import shutil
 import logging
+import sys
 
 from xmlTranslate import xml_info as xml_info
 from link_builder import LinkBuilder
 from connections import connections
 from api_interactions import GNS3ApiClient
 from topology_builder import TopologyBuilder
-from win_restore import restore_backup
+from config_injector import ConfigInjector
+from ssh_manager import SSHConnectionManager, SSHError
+from restore_executor import RestoreExecutor
+from backup_manifest import build_manifest, get_newest_file, BACKUP_DIR
+from weconfig import run_scan, run_backup, run_targeted_backup
+from discovery_cache import DiscoveryCache
+from streaming_discovery import StreamingDiscovery
+from project_synthesizer import synthesize_project
+from project_transfer import ProjectTransfer
+from cli_session import run_cli_commands
+from confirmation import ChangeConfirmer, config_hostname
+from apply_executor import ApplyExecutor
+from config_diff import ConfigDiffer
+from weos_web import WeOSSessionPool
+from pipeline import Pipeline, PipelineError, OK, critical_path, time_on_path
+from profiling import StageProfiler
+from resource_sampler import ResourceSampler
+from metrics import MetricsExporter
+import tracing
 
 import randomname   
 
 
-# On Oskar's computer, the path to the new WeConfig is:
-# ~\AppData\Local\WeConfig-dev-cli\current\WeConfig.exe
-
-# On the server, the path to the new WeConfig is the same
-
-def cleanup_all_files():
+def cleanup_all_files(ssh_manager):
     logger.debug("=== cleaning up files ===")
     cleanup_files("./topologies", "./test.nprj")
     logger.debug("deleting files in topologies")
     cleanup_files("./gns3_backups", "./output.nprj")
     logger.debug("deleting files in gns3_backups")
-    cleanup_files_vm()
+    cleanup_files_vm(ssh_manager)
     logger.debug("deleting files in vm")
 
 def find_matching_devices_by_mac(list1, list2):
@@ -92,24 +104,16 @@ def cleanup_files(topologies_path, test_file):
     except Exception as e:
         logger.error(f"Error during cleanup: {str(e)}")
         
-def cleanup_files_vm():
-    ssh_vm = paramiko.SSHClient()
-    ssh_vm.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh_vm.load_system_host_keys()
-    
+def cleanup_files_vm(ssh_manager):
     try:
-        logger.debug(f"Connecting to GNS3-server:")
-        ssh_vm.connect(hostname='10.2.100.235', username='it')
-    except Exception as e:
+        ssh_manager.exec_command("rm -f ~/output.nprj")
+        logger.debug("Removed ~/output.nprj")
+        ssh_manager.exec_command("rm -rf ~/NDT/project_files/*")
+        logger.debug("Removed all files in ~/NDT/project_files/")
+        ssh_manager.exec_command("rm -rf ~/NDT/ndt_backups")
+        logger.debug("Removed ~/NDT/ndt_backups")
+    except SSHError as e:
         logger.error(f"Failed to connect to SSH server: {str(e)}")
-        return
-    
-    ssh_vm.exec_command("rm ~/output.nprj")
-    logger.debug("Removed ~/output.nprj")
-    ssh_vm.exec_command("rm -rf ~/NDT/project_files/*")
-    logger.debug("Removed all files in ~/NDT/project_files/")
-    
-    ssh_vm.close()
      
 def validate_dict_keys(data_dict: Dict[str, Any], dataclass_type: Type, exclude_fields: list = None) -> bool:
     """
@@ -125,27 +129,48 @@ def validate_dict_keys(data_dict: Dict[str, Any], dataclass_type: Type, exclude_
     
     return True
 
-def run_scan(path, adapterNameorId = "Wi-Fi"):
-    if os.name == 'posix':
-        subprocess.run(["../Publish/WeConfig", "dicover", "--adapterNameOrId",\
-                         adapterNameorId, "--useMdns", "--useIpConfig", "-p", path])
-    elif os.name == 'nt':
-        subprocess.run(['..\Publish\WeConfig.exe', "discover", "--adapterNameOrId",\
-                         adapterNameorId, "--useMdns", "--useIpConfig", "-p", path])
-        #Command to run weconfig in windows! 
-
-def run_backup(path, ip):
-    if os.name == 'posix':
-        subprocess.run(["../Publish/WeConfig", "backup", "-s", ip, "-p", path])
-    elif os.name == 'nt':
-        subprocess.run(['../Publish/WeConfig.exe', "backup", "-s", ip, "-p", path])
-        #Command to run weconfig in windows!
-
-def transfer_file(ssh_client, folder_path):
+def create_device(device_data: Dict[str, Any], validate: bool = True) -> Device:
+    """
+    Create a Device with its ports and VLANs from an xml_info device entry.
+    Raises ValueError if validate is set and the keys don't match the dataclasses.
+    """
+    # Extract ports data for separate handling
+    # pop() removes the key from the dictionary
+    ports_data = device_data.pop("ports", {})
+    vlans_data = device_data.pop("vlans", {})
+    
+    try:
+        # validate dictionary keys
+        if validate:
+            validate_dict_keys(device_data, Device, ["ports", "vlans"])
+        device = Device(**device_data)
+
+        # Process ports
+        for port_id, port_data in ports_data.items():
+            # validate dictionary keys
+            if validate:
+                validate_dict_keys(port_data, Port)
+            port = Port(**port_data)
+            device.ports[port_id] = port
+
+        # Process vlans
+        for vlan_id, vlan_data in vlans_data.items():
+            # validate dictionary keys
+            if validate:
+                validate_dict_keys(vlan_data, Vlan)
+            vlan = Vlan(**vlan_data)
+            device.vlans[vlan_id] = vlan
+        
+        return device
+    finally:
+        # Put ports back in device_data for future reference
+        device_data["ports"] = ports_data
+
+def transfer_file(ssh_manager, folder_path):
     """Transfer a folder to the remote server using SCP."""
     logger.info(f"Transferring folder {folder_path} via SCP")
     try:
-        scp = SCPClient(ssh_client.get_transport())
+        scp = ssh_manager.scp()
         scp.put(f'{folder_path}', recursive=True, remote_path='~/NDT/project_files/')
         scp.close()
         logger.info(f"Successfully transferred {folder_path}")
@@ -153,10 +178,10 @@ def transfer_file(ssh_client, folder_path):
         logger.error(f"Failed to transfer {folder_path}: {str(e)}")
         raise
 
-def get_file(ssh_client, file_path):
+def get_file(ssh_manager, file_path):
     logger.info(f"Transferring file {file_path} via SCP")
     try:
-        scp = SCPClient(ssh_client.get_transport())
+        scp = ssh_manager.scp()
         scp.get(remote_path=file_path, local_path='./')
         scp.close()
         logger.info(f"Successfully transferred {file_path}")
@@ -164,47 +189,42 @@ def get_file(ssh_client, file_path):
         logger.error(f"Failed to transfer {file_path}: {str(e)}")
         raise
 
-def set_config(folder_path, device, ssh_client):
-    """Set device configuration using the newest backup file"""
-    remote_path = f"~/NDT/project_files/{folder_path}/Configuration\ Backups/{device.id}/"
-    
-    # Execute command to find newest file on remote server
-    stdin, stdout, stderr = ssh_client.exec_command(f"ls -t {remote_path}*.json | head -1")
-    error = stderr.read().decode('utf-8').strip()
-    if error:
-        logger.error(f"Error finding config file: {error}")
-        return
-    
-    config_file = stdout.read().decode('utf-8').strip()
-    if not config_file:
-        logger.error(f"No config file found in {remote_path}")
-        return
-    
-    # Extract just the filename from the full path
-    config_filename = os.path.basename(config_file)
-    
-    # Build and execute restore command
-    mac_parts = device.base_mac.split(":")
-    last_three_octets = mac_parts[-3:]
-    mac_suffix = "-".join(last_three_octets)
-    device_hostname = f"{device.family}-{mac_suffix}.local"
-    command = f'~/restore.sh admin admin {device_hostname} {remote_path}{config_filename}'
-    logger.debug(f'Executing command: {command}')
-    
-    # Execute the command
-    stdin, stdout, stderr = ssh_client.exec_command(command)
-    
-    # Get both outputs
-    output = stdout.read().decode('utf-8')
-    stderr_output = stderr.read().decode('utf-8')
-    
+# Files needed to run backup_fetcher.py on the GNS3 server
+REMOTE_TOOLS = ["backup_fetcher.py", "weos_web.py", "backup_manifest.py", "data_model.py"]
+NDT_BACKUP_DIR = "ndt_backups"
+
+def fetch_ndt_backups(ssh_manager, hostnames, max_workers=8):
+    """Run backup_fetcher.py on the GNS3 server against the NDT devices (device ID -> hostname)."""
+    ssh_manager.exec_command("mkdir -p ~/NDT/tools")
+    scp = ssh_manager.scp()
+    scp.put(REMOTE_TOOLS, remote_path='NDT/tools/')
+    scp.close()
+
+    configuration = ssh_manager.config.get('configuration', {})
+    device_args = " ".join(f"--device {device_id}=https://{hostname}" for device_id, hostname in hostnames.items())
+    # The password goes over stdin, so it is neither logged nor in the remote process list
+    command = (f"cd ~/NDT/tools && python3 backup_fetcher.py -o ~/NDT/{NDT_BACKUP_DIR} -w {max_workers} "
+               f"-u {configuration.get('username', 'admin')} --password-stdin {device_args}")
+    result = ssh_manager.exec_command(command, input=f"{configuration.get('password', 'admin')}\n".encode('utf-8'))
+
+    try:
+        for report in json.loads(result.stdout):
+            if not report['success']:
+                logger.error(f"Failed to fetch NDT backup of {report['device_id']}: {report['error']}")
+    except ValueError:
+        logger.error(f"Backup fetcher failed: {result.stderr.strip()}")
+
+def get_ndt_backups(ssh_manager, local_path):
+    """Copy the backups fetched by backup_fetcher.py from the GNS3 server."""
+    logger.info("Transferring fetched NDT backups via SCP")
+    scp = ssh_manager.scp()
+    # Relative to the home directory, the path is quoted so ~ would not expand
+    scp.get(remote_path=f"NDT/{NDT_BACKUP_DIR}/{BACKUP_DIR}", local_path=local_path, recursive=True)
+    scp.close()
+
 def get_hostname(device):
     """Get the hostname of the device"""
-    mac_parts = device.base_mac.split(":")
-    last_three_octets = mac_parts[-3:]
-    mac_suffix = "-".join(last_three_octets)
-    device_hostname = f"{device.family}-{mac_suffix}.local"
-    return device_hostname
+    return device.mdns_hostname()
 
 def extract_zip(zip_path, extract_to):
     """
@@ -239,619 +259,701 @@ def create_folder(folder_path, name):
     logger.debug(f'Created fodler {folder_path}')
     return folder_path
 
-def get_newest_file(directory: str) -> str:
-    """Returns the filename (as a string) of the newest file in the directory"""
-    # Initialize variables to keep track of the newest file and its timestamp
-    newest_file = None
-    newest_timestamp = None
-   
-    # Iterate over each file in the directory
-    for file in os.listdir(directory):
-        # Extract timestamp from file name if it matches the expected format
-        try:
-            timestamp = datetime.strptime(file, "%Y-%m-%dT%H_%M_%SZ.json")
-           
-            # Update newest file and timestamp if current file is newer
-            if newest_timestamp is None or timestamp > newest_timestamp:
-                newest_file = file
-                newest_timestamp = timestamp
-        except ValueError:
-            # Skip files that do not match the expected format
-            continue
-   
-    # Check if we found any valid files
-    if newest_file is None:
-        raise FileNotFoundError(f"No valid timestamped files found in {directory}")
-        
-    return newest_file
-
-def change_hostname(hostname, new_name):
-    ssh1 = paramiko.SSHClient()
-    ssh1.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh1.load_system_host_keys()
-    
-    try:
-        logger.debug(f"Connecting to GNS3-server:")
-        ssh1.connect(hostname='10.2.100.235', username='it')
-        logger.debug("Successfully connected to SSH server")
-        
-        # Create an interactive shell session
-        channel = ssh1.invoke_shell()
-        channel.settimeout(None)  # No timeout
-        
-        # Function to wait for output continuously with optional timeout
-        def wait_and_log_output(check_for=None, respond_with=None, timeout=None):
-            """
-            Wait for output and log it.
-            If timeout is None, wait indefinitely until output is received.
-            """
-            buffer = ""
-            start_time = time.time()
-            
-            while True:
-                # Check timeout only if specified
-                if timeout is not None and (time.time() - start_time > timeout):
-                    logger.debug(f"Timeout after {timeout} seconds")
-                    return buffer
-                
-                # Small sleep to avoid CPU spinning
-                time.sleep(0.5)
-                
-                if channel.recv_ready():
-                    chunk = channel.recv(8192).decode('utf-8', errors='ignore')
-                    if chunk:
-                        buffer += chunk
-                        logger.debug(f"Received output: {chunk}")
-                        
-                        # If we're checking for specific text and it's found
-                        if check_for and check_for in buffer:
-                            logger.debug(f"Found expected text: '{check_for}'")
-                            if respond_with:
-                                logger.debug(f"Sending response: '{respond_with}'")
-                                channel.send(respond_with)
-                            return buffer
-                
-                # If we're not checking for specific text, return once we have some output
-                # and there's no more output ready for a moment
-                if not check_for and buffer and not channel.recv_ready():
-                    # Small additional wait to ensure no more immediate output
-                    time.sleep(1)
-                    if not channel.recv_ready():
-                        return buffer
-        
-        # Clear initial output
-        initial_output = wait_and_log_output()
-        logger.debug(f"Initial SSH server output: {initial_output}")
-        
-        # Flag to track if we need to retry due to host key change
-        retry_needed = False
-        
-        # Try SSH connection (with potential retry)
-        for attempt in range(2):  # At most 2 attempts
-            if attempt > 0:
-                logger.debug(f"Retry attempt {attempt} for SSH connection")
-            
-            # Send the SSH command
-            logger.debug(f"Starting SSH connection to {hostname}")
-            channel.send(f"ssh admin@{hostname}\n")
-            
-            # Wait for first response - NO TIMEOUT here
-            ssh_response = wait_and_log_output()
-            
-            # Check for host key verification failure
-            if "WARNING: REMOTE HOST IDENTIFICATION HAS CHANGED" in ssh_response:
-                logger.debug("Host key has changed. Removing old key and will retry.")
-                
-                # Extract the command to remove the key from the message
-                key_remove_cmd = None
-                for line in ssh_response.splitlines():
-                    if "ssh-keygen -f" in line and "-R" in line:
-                        key_remove_cmd = line.strip()
-                        break
-                
-                if key_remove_cmd:
-                    logger.debug(f"Running command: {key_remove_cmd}")
-                    channel.send(f"{key_remove_cmd}\n")
-                    
-                    # Wait for command completion - NO TIMEOUT
-                    key_remove_output = wait_and_log_output()
-                    logger.debug(f"Key removal output: {key_remove_output}")
-                    
-                    # We need to retry the SSH connection
-                    retry_needed = True
-                    continue
-                else:
-                    logger.error("Could not find key removal command in error message")
-                    return False
-            
-            # No key error or already retried, proceed with normal connection
-            break
-        
-        # Continue with normal connection process
-        output = ssh_response
-        
-        # Check for different prompts and respond accordingly
-        while True:
-            if "Are you sure you want to continue connecting" in output:
-                logger.debug("Host key verification prompt detected, sending 'yes'")
-                channel.send("yes\n")
-                
-                # Wait for password prompt after sending yes - NO TIMEOUT
-                passwd_output = wait_and_log_output()
-                output += passwd_output
-            
-            if "password:" in output:
-                logger.debug("Password prompt detected, sending password")
-                channel.send("admin\n")
-                break
-            
-            # If we haven't seen either prompt yet, wait for more output - NO TIMEOUT
-            logger.debug("Waiting for verification or password prompt...")
-            more_output = wait_and_log_output()
-            output += more_output
-        
-        # Wait for login to complete (command prompt) - NO TIMEOUT
-        login_output = ""
-        while True:
-            new_output = wait_and_log_output()
-            login_output += new_output
-            
-            if ":/#>" in login_output:
-                logger.debug("Successfully logged in, prompt detected")
-                break
-            
-            # If we don't see the prompt yet, continue waiting
-            logger.debug("Still waiting for login prompt...")
-        
-        # Send hostname change command
-        logger.debug(f"Sending command to change hostname to {new_name}")
-        hostname_command = f"config hostname {new_name} le\n"
-        channel.send(hostname_command)
-        
-        time.sleep(10)
-        
-        save_command = "copy run start\n"
-        logger.debug(f"Sending command to save configuration: {save_command}")
-        channel.send(save_command)
-        
-        time.sleep(10)
-        
-        # Wait for command completion - reasonable timeout ok here (30 sec)
-        #cmd_output = wait_and_log_output(timeout=30)
-        #logger.debug(f"Output after hostname change: {cmd_output}")
-        
-        ssh1.close()
-        
-    except Exception as e:
-        logger.error(f"Failed in change_hostname: {str(e)}")
-        import traceback
-        logger.error(traceback.format_exc())
-        if 'ssh1' in locals() and ssh1:
-            ssh1.close()
-        return False
+def change_hostnames(ssh_manager, new_names):
+    """Change the hostnames of several devices concurrently. new_names maps hostname -> new name."""
+    jobs = {hostname: [f"config hostname {new_name} le", "copy run start"]
+            for hostname, new_name in new_names.items()}
+    results = run_cli_commands(ssh_manager, jobs)
+    for result in results:
+        if result.success:
+            logger.debug(f"Changed hostname of {result.name} to {new_names[result.name]} in {result.duration:.4f}s")
+        else:
+            logger.error(f"Failed to change hostname of {result.name}: {result.error}")
+    return results
     
 def random_new_name():
     """Generate a random hostname using the randomname library."""
     name = randomname.generate(('names/codenames/intel'))
     return name
 
-
-# setup logging
-# level alternatives: CRITICAL, ERROR, WARNING, INFO, DEBUG
-logging.basicConfig(level=logging.INFO, 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
 logger = logging.getLogger(__name__)
 
 # logger level for this module
 logger.setLevel(logging.DEBUG)
 
-# logging level for other modules 
+# logging level for other modules
 logging_level = logging.ERROR
 
-# set paramiko logging level
-logging.getLogger("paramiko").setLevel(logging_level)
-
-cleanup_all_files()
-
-start_time_stamp_1 = time.perf_counter()
-logger.info("=== Step 1/7: Scanning network ===")
-project = "test.nprj"
-run_scan(project, "Ethernet 5") # ensure this is correct adapter name
-run_backup(project, "169.254.1.1/16")
-end_time_stamp_1 = time.perf_counter() #Scan network
-
-# for debugging purposes
-project = "test.nprj"
-
-start_time_stamp_2 = time.perf_counter() #Creating folder and extracting 
-unique_folder = create_unique_folder("./topologies", "project")
-logger.debug(f"extracting to: {unique_folder}")
-extract_zip(project, unique_folder)
-print(f"Extracted project to {unique_folder}")
-logger.info("=== Step 2/7: Parsing device information ===")
-unique_folder_without_top = unique_folder.split("\\")[1]
-logger.debug(f"unique_folder_without_top: {unique_folder_without_top}")
-logger.debug(f"unique_folder: {unique_folder}")
-end_time_stamp_2 = time.perf_counter() #Creating folder and extracting 
-
-start_time_stamp_3 = time.perf_counter() #XML parsing & validation
-# list to store devices
-device_list: list[Device] = []
-xml_path = os.path.join(unique_folder, "Project.xml")
-xml = xml_info(xml_path)
-xml.findDevices()
-devices_dict = xml.device_list
-devices_dict["cloud"] = {"name": "cloud", 
-                         "id": "cloud", 
-                         "family": "cloud", 
-                         "ports": {"virbr0": {}}}
-
-# Iterate through the dictionary and create Device objects
-for device_id, device_data in devices_dict.items():
-    # Extract ports data for separate handling
-    # pop() removes the key from the dictionary
-    ports_data = device_data.pop("ports", {})
-    vlans_data = device_data.pop("vlans", {})
-    
-    try:
-        # validate dictionary keys
-        if device_id != "cloud":
-            validate_dict_keys(device_data, Device, ["ports", "vlans"])
-        device = Device(**device_data)
-
-        # Process ports
-        for port_id, port_data in ports_data.items():
-            # validate dictionary keys
-            if device_id != "cloud":
-                validate_dict_keys(port_data, Port)
-            port = Port(**port_data)
-            device.ports[port_id] = port
-
-        # Process vlans
-        for vlan_id, vlan_data in vlans_data.items():
-            # validate dictionary keys
-            if device_id != "cloud":
-                validate_dict_keys(vlan_data, Vlan)
-            vlan = Vlan(**vlan_data)
-            device.vlans[vlan_id] = vlan
-        
-        # Add the device to our list
-        device_list.append(device)
-        
-    except Exception as e:
-        logger.error(f"Error creating device {device_id}: {e}")
-    finally:
-        # Put ports back in device_data for future reference
-        device_data["ports"] = ports_data
-
-# Print device details
-if logging_level == logging.DEBUG:
-    for device in device_list:
-        logger.debug(f"Device Details for: {device.name}")
-        for attr, value in device.__dict__.items():
-            if attr != "ports" and attr != "vlans":  # Handle port and separately
-                logger.debug(f"{attr}: {value}")
-        
-        logger.debug("VLANs:")
-        for vlan_id, vlan in device.vlans.items():
-            for vlan_attr, vlan_value in vlan.__dict__.items():
-                logger.debug(f"    {vlan_attr}: {vlan_value}")
-end_time_stamp_3 = time.perf_counter() #XML parsing & validation
-
-
-
-
-logger.info("=== Step 3/7: Building GNS3 topology ===")
-
-
-
-start_time_stamp_4 = time.perf_counter() #Checking existing project, delete if it exists
-api_client = GNS3ApiClient()
-
-# set logger level in api_client
-# logger level levels: CRITICAL, ERROR, WARNING, INFO, DEBUG
-api_client.logger.setLevel(logging_level)
-
-projects = api_client.get_projects()
-logger.info(f"Connection successful! Found {len(projects)} projects.")
-
-for dict in projects:
-    if dict["name"] == "auto_1":
-        id = dict["project_id"]
-        api_client.delete_project(id)
-        logger.info("Deleted project auto_1")
-end_time_stamp_4 = time.perf_counter() #Checking existing project, delete if it exists
-
-
-
-
-
-#logger.info("Building network topology in GNS3...")
-
-
-
-start_time_stamp_5 = time.perf_counter() #Building topology
-# Create or get project and build devices
-topology_builder = TopologyBuilder()
-
-# List available templates to help with configuration
-#topology_builder.list_available_templates()
-
-# set logger level in topology_builder
-# logger level levels: CRITICAL, ERROR, WARNING, INFO, DEBUG
-topology_builder.logger.setLevel(logging_level)
-
-# BUILD DEVICES
-try:
-    node_mapping = topology_builder.build_topology(device_list)
-    
-    #logger.info(f"Successfully created topology with {len(node_mapping)} devices")
-    
-    # Save node mapping for link creation (secondary goal)
-    with open("node_mapping.json", "w") as f:
-        json.dump(node_mapping, f, indent=2)
-        
-except Exception as e:
-    logger.error(f"Error building topology: {str(e)}")
-end_time_stamp_5 = time.perf_counter() #Building topology
-
-logger.info("=== Step 4/7: Creating links between devices ===")
-
-
-
-
-start_time_stamp_6 = time.perf_counter() #Creating links
-# Parse connections from XML
-conn = connections(f"{unique_folder}\Project.xml")
-conn.getConnections()
-connection_data = conn.conn_dict
-
-# Create link builder
-link_builder = LinkBuilder(api_client=topology_builder.api_client)
-
-# set logger level in link_builder
-# logger level levels: CRITICAL, ERROR, WARNING, INFO, DEBUG
-link_builder.logger.setLevel(logging_level)
-
-try:
-    # Get project ID (reuse the same project)
-    project_id = topology_builder.create_or_get_project()
-    
-    # Build links
-    links = link_builder.build_links(project_id, connection_data, node_mapping)
-    
-    logger.info(f"Successfully created {len(links)} links")
-    
-except Exception as e:
-    logger.error(f"Error building links: {str(e)}")
-end_time_stamp_6 = time.perf_counter() #Creating links
-
-
-
-
-logger.info("=== Step 5/7: Transferring configuration files ===")
-
-
-
-
-start_time_stamp_7 = time.perf_counter() #Connecting to server
-ssh = paramiko.SSHClient()
-ssh.load_system_host_keys()
-try:
-    ssh.connect(hostname='10.2.100.235', username='it')
-    logger.info("Successfully connected to SSH server")
-except Exception as e:
-    logger.error(f"Failed to connect to SSH server: {str(e)}")
-end_time_stamp_7 = time.perf_counter() #Connecting to server
-
-
-
-logger.debug(f"unique_folder: {unique_folder}")
-
-
-
-
-start_time_stamp_8 = time.perf_counter() #Transfering files
-logger.info("Transferring files to server...")
-logger.debug(f"Transferring folder {unique_folder} via SCP")
-transfer_file(ssh, unique_folder)
-end_time_stamp_8 = time.perf_counter() #Transfering files
-
-logger.info("=== Step 6/7: Starting devices ===")
+@dataclass
+class RunResult:
+    success: bool
+    # Duration of every stage that completed and the delays derived from them, in seconds
+    timings: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+    critical_path: str = ""
 
+class NetworkDigitalTwin:
+    """
+    Builds the digital twin of the physical network in GNS3 and applies its changes back.
+    The SSH, GNS3 API and WeOS clients are created once and kept between runs, so run()
+    can be called repeatedly in one process. Dropped connections are reopened on demand.
+    """
 
+    def __init__(self, config_path: str = "config.yaml", metrics: Optional[MetricsExporter] = None):
+        """
+        Initialize the clients. Nothing is connected until the first run.
+        metrics is an exporter shared with other twins of the process, by default the twin
+        creates its own from the metrics section. Span listeners are process-wide, so two
+        exporters in one process would each count the spans of both twins.
+        """
+        self.config_path = config_path
+
+        self.ssh_manager = SSHConnectionManager(config_path)
+        self.ssh_manager.logger.setLevel(logging_level)
+
+        self.api_client = GNS3ApiClient(config_path)
+        # set logger level in api_client
+        # logger level levels: CRITICAL, ERROR, WARNING, INFO, DEBUG
+        self.api_client.logger.setLevel(logging_level)
+        self.config = self.api_client.config
+
+        # Create or get project and build devices
+        self.topology_builder = TopologyBuilder(config_path)
+        # List available templates to help with configuration
+        #self.topology_builder.list_available_templates()
+        self.topology_builder.logger.setLevel(logging_level)
+
+        self.configuration_mode = self.config.get('configuration', {}).get('mode', 'restore')
+        logger.debug(f"Configuration mode: {self.configuration_mode}")
+
+        self.ndt_backup_config = self.config.get('ndt_backup', {})
+        self.ndt_backup_mode = self.ndt_backup_config.get('mode', 'weconfig')
+        # "synthesize" builds output.nprj from the known NDT state instead of discovering it
+        self.ndt_project_mode = self.ndt_backup_config.get('project', 'discover')
+        if self.ndt_project_mode == "synthesize":
+            # The synthesized project needs the backups of the known devices
+            self.ndt_backup_mode = "fetcher"
+
+        self.weos_pool = WeOSSessionPool.from_config(config_path)
+
+        self.change_confirmer = ChangeConfirmer(self.ssh_manager)
+        self.change_confirmer.logger.setLevel(logging_level)
+
+        self.physical_scan_config = self.config.get('physical_scan', {})
+        self.apply_config = self.config.get('apply', {})
+        self.profiler = StageProfiler.from_config(self.config.get('profiling', {}))
+        self.resource_sampling_config = self.config.get('resource_sampling', {})
+        self.pipeline: Optional[Pipeline] = None
+
+        # Kept for the lifetime of the twin, so the counters accumulate over all runs
+        self._owns_metrics = metrics is None
+        self.metrics = MetricsExporter.from_config(self.config.get('metrics', {})) if metrics is None else metrics
+        if self.metrics is not None and self._owns_metrics:
+            self.metrics.logger.setLevel(logging_level)
+            self.metrics.start()
+
+    def build_pipeline(self) -> Pipeline:
+        """A new pipeline of all stages. Stages run as soon as the stages producing their inputs are done."""
+        pipeline = Pipeline(self.config.get('pipeline', {}), self.profiler)
+        pipeline.logger.setLevel(logging_level)
+
+        if self.physical_scan_config.get('streaming', False):
+            pipeline.add_stage("scanning_physical_network", self.scan_physical_network_streaming,
+                               inputs=["project_id"], outputs=["project", "prebuilt_nodes"])
+        else:
+            pipeline.add_stage("scanning_physical_network", self.scan_physical_network,
+                               outputs=["project", "prebuilt_nodes"])
+        pipeline.add_stage("creating_folder_and_unzipping", self.create_folder_and_unzip, inputs=["project"],
+                           outputs=["unique_folder", "unique_folder_without_top"])
+        pipeline.add_stage("parsing_xml_and_validating", self.parse_xml_and_validate, inputs=["unique_folder"],
+                           outputs=["device_list", "backup_manifest"])
+        # Independent of the physical network, runs while it is scanned
+        pipeline.add_stage("checking_existing_project", self.check_existing_project, outputs=["project_id"])
+        pipeline.add_stage("building_topology", self.build_topology,
+                           inputs=["device_list", "project_id", "prebuilt_nodes"], outputs=["node_mapping"])
+        pipeline.add_stage("creating_links", self.create_links,
+                           inputs=["unique_folder", "project_id", "node_mapping"], outputs=["connection_data"])
+        pipeline.add_stage("connecting_to_server", self.connect_to_server)
+        # Runs while the nodes are created
+        pipeline.add_stage("transferring_files", self.transfer_files,
+                           inputs=["unique_folder", "unique_folder_without_top", "backup_manifest"],
+                           after=["connecting_to_server"])
+        pipeline.add_stage("injecting_configuration", self.inject_configuration,
+                           inputs=["device_list", "backup_manifest", "unique_folder", "project_id", "node_mapping"])
+        # GNS3 adds links to running nodes, so the nodes start while the links are created.
+        # The ping in start_devices only succeeds once the cloud link is in place.
+        pipeline.add_stage("starting_devices", self.start_devices,
+                           inputs=["project_id", "device_list", Pipeline.CANCEL_EVENT],
+                           after=["injecting_configuration", "connecting_to_server"])
+        pipeline.add_stage("setting_configuration", self.set_configuration,
+                           inputs=["unique_folder_without_top", "device_list", "backup_manifest"],
+                           outputs=["restore_results"],
+                           after=["starting_devices", "creating_links", "transferring_files"])
+        pipeline.add_stage("resolving_ndt_hostnames", self.resolve_ndt_hostnames,
+                           inputs=["device_list", "unique_folder", "backup_manifest"], outputs=["ndt_hostnames"])
+        pipeline.add_stage("confirming_configuration", self.confirm_configuration,
+                           inputs=["restore_results", "ndt_hostnames", "device_list"])
+        pipeline.add_stage("changing_hostnames", self.change_device_hostnames,
+                           inputs=["device_list", "ndt_hostnames"], outputs=["new_hostnames", "current_hostnames"],
+                           after=["confirming_configuration"])
+        pipeline.add_stage("confirming_hostnames", self.confirm_hostnames, inputs=["new_hostnames"])
+        pipeline.add_stage("scanning_virtual_network", self.scan_virtual_network, after=["confirming_hostnames"])
+        pipeline.add_stage("backup_ndt", self.backup_ndt, inputs=["current_hostnames"],
+                           after=["scanning_virtual_network"])
+        pipeline.add_stage("transferring_backup_file", self.transfer_backup_file, after=["backup_ndt"])
+        pipeline.add_stage("extracting_backup_file", self.extract_backup_file,
+                           inputs=["unique_folder", "unique_folder_without_top", "current_hostnames"],
+                           outputs=["gns3_folder"], after=["transferring_backup_file"])
+        pipeline.add_stage("parsing_ndt_xml", self.parse_ndt_xml, inputs=["gns3_folder"],
+                           outputs=["device_list_gns3"])
+        pipeline.add_stage("matching_devices", self.match_devices, inputs=["device_list", "device_list_gns3"],
+                           outputs=["matches"])
+        pipeline.add_stage("diffing_configs", self.diff_configs,
+                           inputs=["matches", "gns3_folder", "unique_folder", "backup_manifest"],
+                           outputs=["apply_jobs"])
+        pipeline.add_stage("applying_config", self.apply_config_to_devices,
+                           inputs=["apply_jobs", "connection_data"], outputs=["apply_results"])
+        return pipeline
+
+    def run(self, profile_dir: Optional[str] = None) -> RunResult:
+        """
+        Run every stage once and return the timings. Stage failures are reported in the result.
+        Profiles of the profiled stages go to profile_dir, see StageProfiler.begin_run.
+        """
+        # Only the commands of this run
+        self.ssh_manager.command_timings.clear()
+        self.profiler.begin_run(profile_dir)
+        cleanup_all_files(self.ssh_manager)
+
+        self.pipeline = pipeline = self.build_pipeline()
+        sampler = self.start_resource_sampler()
+        error = None
+        try:
+            pipeline.run()
+        except PipelineError as e:
+            logger.error(f"Run aborted: {str(e)}")
+            error = str(e)
+        finally:
+            if sampler is not None:
+                sampler.stop()
+
+        # Standard format logging for timing information, only for stages that completed
+        stage_timings = pipeline.timings()
+        timings = {}
+        for stage_name, result in pipeline.results.items():
+            if result.status == OK:
+                timings[stage_name] = stage_timings[stage_name]
+                logger.info(f"{stage_name}:{stage_timings[stage_name]:.4f}")
+
+        results = pipeline.results
+        def stage_ok(stage_name):
+            return stage_name in results and results[stage_name].status == OK
+
+        if stage_ok("setting_configuration"):
+            # Time from the start of the run until the NDT holds the physical configuration,
+            # without booting the nodes. Before the stages ran concurrently the whole
+            # starting_devices duration was subtracted; now only the part of it that delayed
+            # setting_configuration is, which is the same in a serial run.
+            time_to_start_nodes = time_on_path(results, critical_path(results, "setting_configuration"),
+                                               "starting_devices", pipeline.start_time)
+            physical_to_ndt_delay = results["setting_configuration"].end - pipeline.start_time - time_to_start_nodes
+            timings["physical_to_ndt_delay"] = physical_to_ndt_delay
+            logger.info(f"physical_to_ndt_delay:{physical_to_ndt_delay:.4f}")
+            tracing.metric("physical_to_ndt_delay", physical_to_ndt_delay)
+
+            if stage_ok("applying_config"):
+                ndt_to_physical_delay = results["applying_config"].end - results["scanning_virtual_network"].start
+                timings["ndt_to_physical_delay"] = ndt_to_physical_delay
+                logger.info(f"ndt_to_physical_delay:{ndt_to_physical_delay:.4f}")
+                tracing.metric("ndt_to_physical_delay", ndt_to_physical_delay)
+
+                round_trip_time = physical_to_ndt_delay + ndt_to_physical_delay
+                timings["round_trip_time"] = round_trip_time
+                logger.info(f"round_trip_time:{round_trip_time:.4f}")
+                tracing.metric("round_trip_time", round_trip_time)
+
+        path_report = pipeline.critical_path_report()
+        logger.info(path_report)
+
+        for timing in self.ssh_manager.command_timings:
+            logger.debug(f"SSH command '{timing.command}' took {timing.duration:.4f}s (exit {timing.exit_status})")
+
+        cleanup_all_files(self.ssh_manager)
+        if self.metrics is not None:
+            self.metrics.write_textfile()
+        return RunResult(success=error is None, timings=timings, error=error, critical_path=path_report)
+
+    def start_resource_sampler(self) -> Optional[ResourceSampler]:
+        """Start sampling the GNS3 server if resource_sampling is enabled. A failure to start does not stop the run."""
+        if not self.resource_sampling_config.get('enabled', False):
+            return None
+        sampler = ResourceSampler(self.ssh_manager, self.resource_sampling_config.get('interval', 2.0))
+        sampler.logger.setLevel(logging_level)
+        try:
+            sampler.start()
+        except Exception as e:
+            logger.error(f"Failed to start resource sampling: {str(e)}")
+            return None
+        return sampler
+
+    def cancel(self) -> None:
+        """Cancel the current run. Running stages that take the cancel event stop early."""
+        if self.pipeline is not None:
+            self.pipeline.cancel()
+
+    def disconnect(self) -> None:
+        """Close all connections. The next run reconnects."""
+        self.ssh_manager.close()
+        self.weos_pool.close()
+
+    def close(self) -> None:
+        """Close all connections and the metrics exporter, unless it was passed in."""
+        self.disconnect()
+        if self.metrics is not None and self._owns_metrics:
+            self.metrics.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def scan_and_back_up(self, project, discover=None):
+        """Discover the physical network into project and back up the devices found."""
+        adapter = self.physical_scan_config.get('adapter', "Ethernet 5") # ensure this is correct adapter name
+        if self.physical_scan_config.get('incremental', False):
+            discovery_cache = DiscoveryCache(self.physical_scan_config)
+            discovery_cache.logger.setLevel(logging_level)
+            discovery_cache.scan(project, adapter, discover)
+        else:
+            (discover or run_scan)(project, adapter)
+        physical_backup_config = self.config.get('physical_backup', {})
+        if physical_backup_config.get('mode', 'subnet') == "targeted":
+            # Only the devices run_scan just found, one WeConfig process per device
+            run_targeted_backup(project,
+                                max_workers=physical_backup_config.get('max_workers', 4),
+                                timeout=physical_backup_config.get('device_timeout', 60))
+        else:
+            run_backup(project, "169.254.1.1/16")
+
+    def scan_physical_network_streaming(self, project_id):
+        """Create nodes for devices as WeConfig reports them, while the scan and backup go on."""
+        logger.info("=== Step 1/7: Scanning network ===")
+        project = "test.nprj"
+        node_futures = {}
+        with ThreadPoolExecutor(max_workers=self.physical_scan_config.get('build_workers', 4)) as builder:
+            def discover(project_path, adapter):
+                discovery = StreamingDiscovery(project_path, adapter,
+                                               self.physical_scan_config.get('poll_interval', 0.5))
+                discovery.logger.setLevel(logging_level)
+                for device_id, device_data in discovery.devices():
+                    try:
+                        device = create_device(device_data)
+                    except Exception as e:
+                        logger.error(f"Error creating device {device_id}: {e}")
+                        continue
+                    node_futures[device_id] = builder.submit(tracing.propagate(self.topology_builder.build_device),
+                                                             device, project_id)
+
+            self.scan_and_back_up(project, discover)
+
+        prebuilt_nodes = {}
+        for device_id, future in node_futures.items():
+            try:
+                prebuilt_nodes[device_id] = future.result()
+            except Exception as e:
+                # building_topology tries again
+                logger.error(f"Failed to create node for device {device_id} during scan: {str(e)}")
+        logger.info(f"Created {len(prebuilt_nodes)} nodes during the scan")
+        return project, prebuilt_nodes
+
+    def scan_physical_network(self):
+        logger.info("=== Step 1/7: Scanning network ===")
+        project = "test.nprj"
+        self.scan_and_back_up(project)
+        return project, {}
+
+    def create_folder_and_unzip(self, project):
+        unique_folder = create_unique_folder("./topologies", "project")
+        logger.debug(f"extracting to: {unique_folder}")
+        extract_zip(project, unique_folder)
+        print(f"Extracted project to {unique_folder}")
+        unique_folder_without_top = unique_folder.split("\\")[1]
+        logger.debug(f"unique_folder_without_top: {unique_folder_without_top}")
+        logger.debug(f"unique_folder: {unique_folder}")
+        return unique_folder, unique_folder_without_top
+
+    def parse_xml_and_validate(self, unique_folder):
+        logger.info("=== Step 2/7: Parsing device information ===")
+        # list to store devices
+        device_list: list[Device] = []
+        xml_path = os.path.join(unique_folder, "Project.xml")
+        xml = xml_info(xml_path)
+        xml.findDevices()
+        devices_dict = xml.device_list
+        devices_dict["cloud"] = {"name": "cloud",
+                                 "id": "cloud",
+                                 "family": "cloud",
+                                 "ports": {"virbr0": {}}}
+
+        # Iterate through the dictionary and create Device objects
+        for device_id, device_data in devices_dict.items():
+            try:
+                # Add the device to our list
+                device_list.append(create_device(device_data, validate=device_id != "cloud"))
+            except Exception as e:
+                logger.error(f"Error creating device {device_id}: {e}")
+
+        # Newest backup per device, looked up once instead of per device on the server
+        backup_manifest = build_manifest(unique_folder)
+
+        # Print device details
+        if logging_level == logging.DEBUG:
+            for device in device_list:
+                logger.debug(f"Device Details for: {device.name}")
+                for attr, value in device.__dict__.items():
+                    if attr != "ports" and attr != "vlans":  # Handle port and separately
+                        logger.debug(f"{attr}: {value}")
+
+                logger.debug("VLANs:")
+                for vlan_id, vlan in device.vlans.items():
+                    for vlan_attr, vlan_value in vlan.__dict__.items():
+                        logger.debug(f"    {vlan_attr}: {vlan_value}")
+        return device_list, backup_manifest
+
+    def check_existing_project(self):
+        logger.info("=== Step 3/7: Building GNS3 topology ===")
+        projects = self.api_client.get_projects()
+        logger.info(f"Connection successful! Found {len(projects)} projects.")
+
+        for project in projects:
+            if project["name"] == "auto_1":
+                self.api_client.delete_project(project["project_id"])
+                logger.info("Deleted project auto_1")
+
+        # Get project ID (reused by the topology and the links)
+        return self.topology_builder.create_or_get_project()
+
+    def build_topology(self, device_list, project_id, prebuilt_nodes):
+        # BUILD DEVICES
+        node_mapping = dict(prebuilt_nodes)
+        try:
+            # Nodes already created during a streaming scan are kept
+            node_mapping.update(self.topology_builder.build_devices(
+                [device for device in device_list if device.id not in node_mapping], project_id))
 
-start_time_stamp_9 = time.perf_counter()#Start nodes, validating ping
-api_client.start_nodes(project_id)
-while True: 
-    stdin, stdout, stderr = ssh.exec_command(f"ping -c 1 {get_hostname(device_list[0])}")
-    response = stdout.read().decode()
-    logger.debug(f"Response: {response}")
-    if "1 packets transmitted, 1 received" in response:
-        break
-end_time_stamp_9 = time.perf_counter()#Start nodes, validating
+            #logger.info(f"Successfully created topology with {len(node_mapping)} devices")
 
-#input("Press enter when devices are ready")
+            # Save node mapping for link creation (secondary goal)
+            with open("node_mapping.json", "w") as f:
+                json.dump(node_mapping, f, indent=2)
 
-logger.info("Started all nodes in the project")
+        except Exception as e:
+            logger.error(f"Error building topology: {str(e)}")
+        return node_mapping
 
-logger.info("=== Step 7/7: Configuring devices ===")
+    def create_links(self, unique_folder, project_id, node_mapping):
+        logger.info("=== Step 4/7: Creating links between devices ===")
+        # Parse connections from XML
+        conn = connections(f"{unique_folder}\Project.xml")
+        conn.getConnections()
+        connection_data = conn.conn_dict
 
-start_time_stamp_10 = time.perf_counter()
-for device in device_list:
-    if device.name != "cloud":
-        set_config(unique_folder_without_top , device, ssh) 
-end_time_stamp_10 = time.perf_counter()
+        # Create link builder
+        link_builder = LinkBuilder(api_client=self.topology_builder.api_client, config_path=self.config_path)
 
-logger.info("=== Step 8/7: Printing timing info ===")
-# Standard format logging for timing information
-logger.info(f"scanning_physical_network:{end_time_stamp_1 - start_time_stamp_1:.4f}")
-logger.info(f"creating_folder_and_unzipping:{end_time_stamp_2 - start_time_stamp_2:.4f}")
-logger.info(f"parsing_xml_and_validating:{end_time_stamp_3 - start_time_stamp_3:.4f}")
-logger.info(f"checking_existing_project:{end_time_stamp_4 - start_time_stamp_4:.4f}")
-logger.info(f"building_topology:{end_time_stamp_5 - start_time_stamp_5:.4f}")
-logger.info(f"creating_links:{end_time_stamp_6 - start_time_stamp_6:.4f}")
-logger.info(f"connecting_to_server:{end_time_stamp_7 - start_time_stamp_7:.4f}")
-logger.info(f"transferring_files:{end_time_stamp_8 - start_time_stamp_8:.4f}")
-logger.info(f"starting_devices:{end_time_stamp_9 - start_time_stamp_9:.4f}")
-logger.info(f"setting_configuration:{end_time_stamp_10 - start_time_stamp_10:.4f}")
+        # set logger level in link_builder
+        # logger level levels: CRITICAL, ERROR, WARNING, INFO, DEBUG
+        link_builder.logger.setLevel(logging_level)
 
-time_to_start_nodes = end_time_stamp_9 - start_time_stamp_9
-#run_time = end_time_stamp_10 - start_time_stamp_1 - time_to_start_nodes
-#logger.info(f"run_time:{run_time:.4f}")
-#logger.info(f"physical_to_ndt_delay:{end_time_stamp_10 - start_time_stamp_1:.4f}")
-physical_to_ndt_delay = end_time_stamp_10 - start_time_stamp_1 - time_to_start_nodes
-logger.info(f"physical_to_ndt_delay:{physical_to_ndt_delay:.4f}")
+        try:
+            # Build links
+            links = link_builder.build_links(project_id, connection_data, node_mapping)
 
-#input("Press enter to continue")
-logger.info("Sleeping 40s")
-time.sleep(40)
-#TODO wait for textoutput from device before proceeding
+            logger.info(f"Successfully created {len(links)} links")
 
-logger.info("=== Step 8/7: Changing hostnames ===")
-name = random_new_name()
-logger.debug(f"Name: {name}")
-name2 = random_new_name()
-logger.debug(f"Name2: {name2}")
-while name2 == name:
-    logger.debug(f"Name2: {name2} is the same as name: {name}")
-    name2 = random_new_name()
-    logger.debug(f"name2: is now {name2}")
-logger.debug(f"Name2: {name2} is different from name: {name}")
+        except Exception as e:
+            logger.error(f"Error building links: {str(e)}")
+        return connection_data
 
-change_hostname(f"{device_list[1].name}.local", name)
+    def connect_to_server(self):
+        logger.info("=== Step 5/7: Transferring configuration files ===")
+        try:
+            # Reuses the connection opened during cleanup unless it has dropped
+            self.ssh_manager.connect()
+            logger.info("Successfully connected to SSH server")
+        except SSHError as e:
+            logger.error(f"Failed to connect to SSH server: {str(e)}")
+
+    def transfer_files(self, unique_folder, unique_folder_without_top, backup_manifest):
+        logger.debug(f"unique_folder: {unique_folder}")
+        logger.info("Transferring files to server...")
+        transfer_mode = self.config.get('transfer', {}).get('mode', 'full')
+        if transfer_mode == "minimal":
+            # Newest backup per device only, compressed and deduplicated against the server cache
+            project_transfer = ProjectTransfer(self.ssh_manager)
+            project_transfer.logger.setLevel(logging_level)
+            project_transfer.transfer(unique_folder, unique_folder_without_top, backup_manifest)
+        else:
+            logger.debug(f"Transferring folder {unique_folder} via SCP")
+            transfer_file(self.ssh_manager, unique_folder)
+
+    def inject_configuration(self, device_list, backup_manifest, unique_folder, project_id, node_mapping):
+        if self.configuration_mode == "boot":
+            logger.info("Injecting configuration before boot...")
+            config_files = {}
+            for device in device_list:
+                if device.name != "cloud":
+                    if device.id in backup_manifest:
+                        config_files[device.id] = os.path.join(unique_folder, backup_manifest[device.id])
+                    else:
+                        logger.error(f"No configuration to inject for {device.name}")
+
+            config_injector = ConfigInjector(api_client=self.api_client, config_path=self.config_path)
+            config_injector.logger.setLevel(logging_level)
+            config_injector.inject(project_id, node_mapping, config_files)
+
+    def start_devices(self, project_id, device_list, cancel_event):
+        logger.info("=== Step 6/7: Starting devices ===")
+        self.api_client.start_nodes(project_id)
+        while not cancel_event.is_set():
+            response = self.ssh_manager.exec_command(f"ping -c 1 {get_hostname(device_list[0])}").stdout
+            logger.debug(f"Response: {response}")
+            if "1 packets transmitted, 1 received" in response:
+                break
 
-change_hostname(f"{device_list[0].name}.local", name2)
+        #input("Press enter when devices are ready")
+
+        logger.info("Started all nodes in the project")
+
+    def set_configuration(self, unique_folder_without_top, device_list, backup_manifest):
+        logger.info("=== Step 7/7: Configuring devices ===")
+        restore_results = []
+        # In boot mode the nodes come up already configured
+        if self.configuration_mode != "boot":
+            restore_executor = RestoreExecutor(self.ssh_manager)
+            restore_executor.logger.setLevel(logging_level)
+            restore_results = restore_executor.restore_all(
+                unique_folder_without_top,
+                [device for device in device_list if device.name != "cloud"],
+                backup_manifest)
+            for result in restore_results:
+                status = "ok" if result.success else f"failed ({result.error})"
+                logger.info(f"Restore of {result.name} {status} after {result.duration:.4f}s")
+        return restore_results
+
+    def resolve_ndt_hostnames(self, device_list, unique_folder, backup_manifest):
+        # mDNS name each NDT device answers to once its configuration is applied
+        ndt_hostnames = {}
+        for device in device_list:
+            if device.name == "cloud":
+                continue
+            try:
+                hostname = config_hostname(os.path.join(unique_folder, backup_manifest[device.id]))
+            except (KeyError, OSError, ValueError):
+                hostname = None
+            # Without a hostname in the backup the device can only be checked for being reachable
+            ndt_hostnames[device.id] = f"{hostname}.local" if hostname else get_hostname(device)
+        return ndt_hostnames
+
+    def confirm_configuration(self, restore_results, ndt_hostnames, device_list):
+        #input("Press enter to continue")
+        if self.configuration_mode != "boot":
+            logger.info("Waiting for devices to confirm configuration")
+            expected_hostnames = {result.device_id: ndt_hostnames[result.device_id]
+                                  for result in restore_results if result.success}
+            # Before the restore the nodes answer to the default name of the physical MAC
+            previous_hostnames = {device.id: get_hostname(device) for device in device_list}
+            self.change_confirmer.wait_for_configuration(expected_hostnames, previous_hostnames)
+
+    def change_device_hostnames(self, device_list, ndt_hostnames):
+        logger.info("=== Step 8/7: Changing hostnames ===")
+        name = random_new_name()
+        logger.debug(f"Name: {name}")
+        name2 = random_new_name()
+        logger.debug(f"Name2: {name2}")
+        while name2 == name:
+            logger.debug(f"Name2: {name2} is the same as name: {name}")
+            name2 = random_new_name()
+            logger.debug(f"name2: is now {name2}")
+        logger.debug(f"Name2: {name2} is different from name: {name}")
+
+        change_hostnames(self.ssh_manager, {
+            f"{device_list[1].name}.local": name,
+            f"{device_list[0].name}.local": name2
+        })
+        current_hostnames = dict(ndt_hostnames)
+        current_hostnames[device_list[1].id] = f"{name}.local"
+        current_hostnames[device_list[0].id] = f"{name2}.local"
+        return [f"{name}.local", f"{name2}.local"], current_hostnames
+
+    def confirm_hostnames(self, new_hostnames):
+        logger.info("Waiting for devices to confirm new hostnames")
+        self.change_confirmer.wait_for_hostnames(new_hostnames)
+
+        #input("Press enter to continue")
+
+    def scan_virtual_network(self):
+        logger.info("=== Step 8/7: scan GNS3 network ===")
+        if self.ndt_project_mode != "synthesize":
+            self.ssh_manager.exec_command(f"./publish/weconfig discover --adapterNameOrId virbr0 \
+                             --useMdns --useIpConfig -p ./output.nprj")
+
+    #Backup GNS3 network -> Paramiko to start backup on server
+    def backup_ndt(self, current_hostnames):
+        logger.info("=== Step 9/7: Backup GNS3 network ===")
+        if self.ndt_backup_mode == "fetcher":
+            # Fetch from the known NDT devices instead of sweeping 169.254.0.0/16
+            fetch_ndt_backups(self.ssh_manager, current_hostnames, self.ndt_backup_config.get('max_workers', 8))
+        else:
+            self.ssh_manager.exec_command(f"./publish/weconfig backup -s 169.254.0.0/16 -p ./output.nprj")
+
+    def transfer_backup_file(self):
+        logger.info("===== Step 10/7: Transfering backup file ====")
+        #Send backup files to windows pc -> scp to send files to pc
+        if self.ndt_project_mode != "synthesize":
+            get_file(self.ssh_manager, '~/output.nprj')
+        if self.ndt_backup_mode == "fetcher":
+            get_ndt_backups(self.ssh_manager, "./gns3_backups")
+
+    def extract_backup_file(self, unique_folder, unique_folder_without_top, current_hostnames):
+        logger.info("=== Step 11/7: Extracting backup file ===")
+        #Extract nprj file
+        logger.debug(f"Unique folder without top = {unique_folder_without_top}")
+        gns3_folder = create_folder("./gns3_backups", unique_folder_without_top)
+        if self.ndt_project_mode == "synthesize":
+            # Same device IDs and MACs as the physical project, NDT addresses and fetched backups
+            synthesize_project(unique_folder, "./gns3_backups", "output.nprj", current_hostnames)
+            extract_zip("output.nprj", gns3_folder)
+        else:
+            extract_zip("output.nprj", gns3_folder)
+            if self.ndt_backup_mode == "fetcher":
+                shutil.move(os.path.join("./gns3_backups", BACKUP_DIR), os.path.join(gns3_folder, NDT_BACKUP_DIR))
+        return gns3_folder
+
+    def parse_ndt_xml(self, gns3_folder):
+        logger.info("=== Step 11/7: Parsing XML and validating keys ===")
+        device_list_gns3: list[Device] = []
+        xml_gns3_path = os.path.join(gns3_folder, "Project.xml")
+        xml_gns3 = xml_info(xml_gns3_path)
+        xml_gns3.findDevices()
+
+        devices_dict = xml_gns3.device_list
+
+        # Iterate through the dictionary and create Device objects
+        for device_id, device_data in devices_dict.items():
+            try:
+                # Add the device to our list
+                device_list_gns3.append(create_device(device_data))
+            except Exception as e:
+                logger.error(f"Error creating device {device_id}: {e}")
+        return device_list_gns3
+
+    def match_devices(self, device_list, device_list_gns3):
+        logger.info("=== Step 11/7: Matching gns3 and real world devices ===")
+        matches = find_matching_devices_by_mac(device_list, device_list_gns3)
+        logger.debug(f"Matches: {matches}")
+        return matches
+
+    def diff_configs(self, matches, gns3_folder, unique_folder, backup_manifest):
+        apply_jobs = []
+        for match in matches:
+            logger.debug(f"Match: {match[0].name} - {match[1].name}")
+            logger.debug(f"Match: {match[0].base_mac} - {match[1].base_mac}")
+            if self.ndt_backup_mode == "fetcher" and self.ndt_project_mode != "synthesize":
+                # Fetched backups are stored under the ID of the physical device the node was built from
+                backup_dir = os.path.join(gns3_folder, NDT_BACKUP_DIR, BACKUP_DIR, match[0].id)
+            else:
+                backup_dir = os.path.join(gns3_folder, BACKUP_DIR, match[1].id)
+            try:
+                path_to_conf = os.path.join(backup_dir, get_newest_file(backup_dir))
+            except (FileNotFoundError, OSError) as e:
+                logger.error(f"No NDT configuration for {match[0].name}: {str(e)}")
+                continue
+            logger.debug(f"Path to conf: {path_to_conf}")
+            apply_jobs.append((match[0], path_to_conf))
+
+        if not self.apply_config.get('skip_unchanged', True):
+            return apply_jobs
+
+        config_differ = ConfigDiffer(self.apply_config.get('volatile_paths'))
+        changed_jobs = []
+        for device, path_to_conf in apply_jobs:
+            # Last backup of the physical device, taken during the physical scan
+            physical_conf = None
+            if device.id in backup_manifest:
+                physical_conf = os.path.join(unique_folder, backup_manifest[device.id])
+            try:
+                diff = config_differ.compare(path_to_conf, physical_conf)
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not compare configuration of {device.name}: {str(e)}")
+                changed_jobs.append((device, path_to_conf))
+                continue
+            if diff.changed:
+                logger.info(f"Configuration of {device.name} changed in {len(diff.differences)} places")
+                for difference in diff.differences:
+                    logger.debug(f"  {device.name}: {difference}")
+                changed_jobs.append((device, path_to_conf))
+            else:
+                logger.info(f"Configuration of {device.name} unchanged, skipping restore")
+        return changed_jobs
+
+    def apply_config_to_devices(self, apply_jobs, connection_data):
+        logger.info("=== Step 11/7: Applying config ===")
+        apply_executor = ApplyExecutor(self.weos_pool, self.apply_config)
+        apply_executor.logger.setLevel(logging_level)
+        # Devices furthest from the management station are configured first
+        apply_results = apply_executor.apply_all(apply_jobs, connection_data)
+        for result in apply_results:
+            status = "ok" if result.success else f"failed ({result.error})"
+            logger.info(f"Apply to {result.name} {status} after {result.duration:.4f}s")
+        return apply_results
+
+#Use python version of restore.sh to restore backup on physical devices.
 
-logger.info("Sleeping 20s")
-time.sleep(20)
-#TODO wait for textoutput from device before proceeding
+#for device, gns3_device in device_list_1, device_list_2:
+    #
+    #base_mac device_list1
+    #find hostname
+
+def setup_logging():
+    # level alternatives: CRITICAL, ERROR, WARNING, INFO, DEBUG
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    # set paramiko logging level
+    logging.getLogger("paramiko").setLevel(logging_level)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a digital twin of the physical network in GNS3 and apply its changes back')
+    parser.add_argument('-c', '--config', type=str, default="config.yaml",
+                        help='Configuration file (default: config.yaml)')
+    parser.add_argument('--profile', action='append', default=[], metavar='STAGE',
+                        help='Profile this stage, can be repeated. Adds to profiling.stages')
+    parser.add_argument('--profile-mode', choices=['sampling', 'deterministic'], default=None,
+                        help='Profiler to use (default: profiling.mode)')
+    args = parser.parse_args()
+
+    setup_logging()
+
+    twin = NetworkDigitalTwin(args.config)
+    twin.profiler.stages.update(args.profile)
+    if args.profile_mode:
+        twin.profiler.mode = args.profile_mode
+
+    # Spans go to NDT_TRACE_FILE when set, otherwise to tracing.file
+    tracing_file = twin.config.get('tracing', {}).get('file')
+    if tracing_file and not os.environ.get(tracing.TRACE_FILE_ENV):
+        tracing.configure(tracing_file)
 
-#input("Press enter to continue")
-
-logger.info("=== Step 8/7: scan GNS3 network ===")
-start_time_stamp_11 = time.perf_counter()
-stdin, stdout, stderr = ssh.exec_command(f"./publish/weconfig discover --adapterNameOrId virbr0 \
-                 --useMdns --useIpConfig -p ./output.nprj")
-output = stdout.read()
-error = stderr.read()
-end_time_stamp_11 = time.perf_counter()
-
-#Backup GNS3 network -> Paramiko to start backup on server 
-logger.info("=== Step 9/7: Backup GNS3 network ===")
-start_time_stamp_12 = time.perf_counter()
-stdin, stdout, stderr = ssh.exec_command(f"./publish/weconfig backup -s 169.254.0.0/16 -p ./output.nprj")
-output = stdout.read()
-error = stderr.read()
-end_time_stamp_12 = time.perf_counter()
-
-logger.info("===== Step 10/7: Transfering backup file ====")
-start_time_stamp_13 = time.perf_counter()
-#Send backup files to windows pc -> scp to send files to pc 
-get_file(ssh, '~/output.nprj')
-end_time_stamp_13 = time.perf_counter()
-
-logger.info("=== Step 11/7: Extracting backup file ===")
-#Extract nprj file
-start_time_stamp_14 = time.perf_counter()
-unique_folder_without_top = unique_folder.split('\\')[1]
-logger.debug(f"Unique folder without top = {unique_folder_without_top}")
-gns3_folder = create_folder("./gns3_backups", unique_folder_without_top)
-extract_zip("output.nprj", gns3_folder)
-end_time_stamp_14 = time.perf_counter()
-#ssh.close()
-
-logger.info("=== Step 11/7: Parsing XML and validating keys ===")
-start_time_stamp_15 = time.perf_counter()
-device_list_gns3: list[Device] = []
-xml_gns3_path = os.path.join(gns3_folder, "Project.xml")
-xml_gns3 = xml_info(xml_gns3_path)
-xml_gns3.findDevices()
-
-devices_dict = xml_gns3.device_list
-
-# Iterate through the dictionary and create Device objects
-for device_id, device_data in devices_dict.items():
-    # Extract ports data for separate handling
-    # pop() removes the key from the dictionary
-    ports_data = device_data.pop("ports", {})
-    vlans_data = device_data.pop("vlans", {})
-    
     try:
-        # validate dictionary keys
-
-        validate_dict_keys(device_data, Device, ["ports", "vlans"])
-        device = Device(**device_data)
-
-        # Process ports
-        for port_id, port_data in ports_data.items():
-            # validate dictionary keys
-            validate_dict_keys(port_data, Port)
-            port = Port(**port_data)
-            device.ports[port_id] = port
-
-        # Process vlans
-        for vlan_id, vlan_data in vlans_data.items():
-            # validate dictionary keys
-            validate_dict_keys(vlan_data, Vlan)
-            vlan = Vlan(**vlan_data)
-            device.vlans[vlan_id] = vlan
-        
-        # Add the device to our list
-        device_list_gns3.append(device)
-        
-    except Exception as e:
-        logger.error(f"Error creating device {device_id}: {e}")
+        result = twin.run()
     finally:
-        # Put ports back in device_data for future reference
-        device_data["ports"] = ports_data
-end_time_stamp_15 = time.perf_counter()
-
-
-logger.info("=== Step 11/7: Matching gns3 and real world devices ===")
-start_time_stamp_16 = time.perf_counter() #Find matches 
-matches = find_matching_devices_by_mac(device_list, device_list_gns3)
-logger.debug(f"Matches: {matches}")
-end_time_stamp_16 = time.perf_counter()
-
-
-logger.info("=== Step 11/7: Applying config ===")
-start_time_stamp_17 = time.perf_counter() #Apply config
-for match in matches:
-    logger.debug(f"Match: {match[0].name} - {match[1].name}")
-    logger.debug(f"Match: {match[0].base_mac} - {match[1].base_mac}")
-    logger.debug(f"Match: {match[0].ip_address} - {gns3_folder}/{match[1].id}.json")
-    ip = f"https://{match[0].ip_address}"
-    path = f"{gns3_folder}/{match[1].id}.json"
-    file_to_restore = get_newest_file(f"{gns3_folder}\\Configuration Backups\\{match[1].id}")
-    logger.debug(f"File to restore: {file_to_restore}")
-    path_to_conf = os.path.join(gns3_folder, "Configuration Backups", match[1].id, file_to_restore)
-    logger.debug(f"Path to conf: {path_to_conf}")
-    restore_backup("admin", "admin", ip,  path_to_conf)
-end_time_stamp_17 = time.perf_counter()
-
-# Standard format logging for timing information - second phase
-logger.info(f"scanning_virtual_network:{end_time_stamp_11 - start_time_stamp_11:.4f}")
-logger.info(f"backup_ndt:{end_time_stamp_12 - start_time_stamp_12:.4f}")
-logger.info(f"transferring_backup_file:{end_time_stamp_13 - start_time_stamp_13:.4f}")
-logger.info(f"extracting_backup_file:{end_time_stamp_14 - start_time_stamp_14:.4f}")
-logger.info(f"parsing_ndt_xml:{end_time_stamp_15 - start_time_stamp_15:.4f}")
-logger.info(f"matching_devices:{end_time_stamp_16 - start_time_stamp_16:.4f}")
-logger.info(f"applying_config:{end_time_stamp_17 - start_time_stamp_17:.4f}")
-
-ndt_to_physical_delay = end_time_stamp_17 - start_time_stamp_11
-logger.info(f"ndt_to_physical_delay:{ndt_to_physical_delay:.4f}")
-
-round_trip_time = physical_to_ndt_delay + (end_time_stamp_17 - start_time_stamp_11)
-logger.info(f"round_trip_time:{round_trip_time:.4f}")
-
-#Use python version of restore.sh to restore backup on physical devices.  
+        twin.close()
+        tracing.get_tracer().close()
 
-#for device, gns3_device in device_list_1, device_list_2:
-    #
-    #base_mac device_list1
-    #find hostname 
-    
+    if not result.success:
+        sys.exit(1)
 
-cleanup_all_files()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from abc import ABC, abstractmethod
+from tracing import Span
+import threading
+import logging
+import tracing
+import bisect
+import math
+import time
+import os
+
+# Upper bounds in seconds, from single API calls to whole syncs
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Iterable[str], values: Iterable[Any]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Metric(ABC):
+    """A metric family with fixed label names and one series per combination of label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """The sample lines of every series."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+class Histogram(Metric):
+    """Cumulative buckets, sum and count per series, as Prometheus computes quantiles from them."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per series: observations per bucket, the last one above every bound, and their sum
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, list(counts), total[0]) for key, (counts, total) in self._series.items())
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labels + ("le",), key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """The metrics of the NDT, derived from the spans the pipeline, clients and executors already record."""
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        """Initialize the metric families. Nothing is recorded until observe() is called with spans."""
+        buckets = tuple(buckets)
+        self.syncs = Counter("ndt_syncs_total", "Pipeline runs by outcome.", ["status"])
+        self.sync_duration = Histogram("ndt_sync_duration_seconds", "Duration of whole pipeline runs.",
+                                       ["status"], buckets)
+        self.last_sync = Gauge("ndt_last_sync_timestamp_seconds", "Unix time the last pipeline run ended.",
+                               ["status"])
+        self.stage_duration = Histogram("ndt_stage_duration_seconds", "Duration of pipeline stages.",
+                                        ["stage", "status"], buckets)
+        self.delays = Histogram("ndt_delay_seconds",
+                                "Delays derived from several stages, such as round_trip_time.", ["name"], buckets)
+        self.api_requests = Counter("ndt_gns3_api_requests_total", "GNS3 API requests by route and response.",
+                                    ["method", "route", "status_code"])
+        self.api_duration = Histogram("ndt_gns3_api_request_duration_seconds", "Latency of GNS3 API requests.",
+                                      ["method", "route"], buckets)
+        self.ssh_duration = Histogram("ndt_ssh_command_duration_seconds", "Latency of SSH commands by program.",
+                                      ["program", "status"], buckets)
+        self.restores = Counter("ndt_restore_total", "Configuration restores by device and outcome.",
+                                ["device", "outcome"])
+        self.restore_duration = Histogram("ndt_restore_duration_seconds", "Duration of configuration restores.",
+                                          ["outcome"], buckets)
+        self.node_ready = Histogram("ndt_node_ready_seconds",
+                                    "Seconds until a node passed a readiness check.", ["check"], buckets)
+        self.node_not_ready = Counter("ndt_node_not_ready_total",
+                                      "Nodes that did not pass a readiness check in time.", ["check", "node"])
+        self.metrics: List[Metric] = [
+            self.syncs, self.sync_duration, self.last_sync, self.stage_duration, self.delays,
+            self.api_requests, self.api_duration, self.ssh_duration, self.restores, self.restore_duration,
+            self.node_ready, self.node_not_ready,
+        ]
+
+    def observe(self, span: Span) -> None:
+        """Update the metrics from a span that ended. Spans without a metric are ignored."""
+        attributes = span.attributes
+        kind = attributes.get('kind')
+        duration = span.duration or 0.0
+        if kind == "stage":
+            self.stage_duration.observe(duration, stage=span.name, status=span.status)
+        elif kind == "metric":
+            self.delays.observe(attributes.get('value', 0.0), name=span.name)
+        elif kind == "readiness":
+            if attributes.get('seconds') is None:
+                self.node_not_ready.inc(check=attributes.get('check'), node=attributes.get('node'))
+            else:
+                self.node_ready.observe(attributes['seconds'], check=attributes.get('check'))
+        elif span.name == "pipeline":
+            self.syncs.inc(status=span.status)
+            self.sync_duration.observe(duration, status=span.status)
+            self.last_sync.set(span.end or time.time(), status=span.status)
+        elif span.name == "gns3_api":
+            # Requests that never got a response have no status code
+            self.api_requests.inc(method=attributes.get('method'), route=attributes.get('route'),
+                                  status_code=attributes.get('status_code', "none"))
+            self.api_duration.observe(duration, method=attributes.get('method'), route=attributes.get('route'))
+        elif span.name == "ssh_command":
+            self.ssh_duration.observe(duration, program=attributes.get('program'), status=span.status)
+        elif span.name == "restore_device":
+            outcome = "success" if span.status == tracing.OK and attributes.get('success', True) else "failure"
+            self.restores.inc(device=attributes.get('device', ""), outcome=outcome)
+            self.restore_duration.observe(duration, outcome=outcome)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+class MetricsExporter:
+    """
+    Feeds every span that ends into a MetricsRegistry and exposes it in the Prometheus text
+    format, served on /metrics, written to a file for the node_exporter textfile collector, or both.
+    Counters and histograms accumulate over all runs of the process.
+    """
+
+    def __init__(self, port: Optional[int] = None, address: str = "127.0.0.1",
+                 textfile: Optional[str] = None, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        """Initialize the exporter. port None serves nothing, textfile None writes nothing."""
+        self.port = port
+        self.address = address
+        self.textfile = textfile
+        self.registry = MetricsRegistry(buckets)
+        self.logger = logging.getLogger(__name__)
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]] = None) -> Optional["MetricsExporter"]:
+        """Create an exporter from the metrics section of config.yaml, None if it is disabled."""
+        config = config or {}
+        if not config.get('enabled', False):
+            return None
+        return cls(port=config.get('port'), address=config.get('address', "127.0.0.1"),
+                   textfile=config.get('textfile'), buckets=config.get('buckets') or DEFAULT_BUCKETS)
+
+    def start(self) -> None:
+        """Start recording spans and serving /metrics if a port is set."""
+        tracing.add_listener(self.registry.observe)
+        if self.port is None:
+            return
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes every few seconds would drown the run's own log
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((self.address, self.port), Handler)
+        except OSError as e:
+            # i.e a second twin in the same process with the same config, the textfile still works
+            self.logger.error(f"Failed to serve metrics on {self.address}:{self.port}: {str(e)}")
+            return
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+        self.logger.info(f"Serving metrics on http://{self.address}:{self._server.server_port}/metrics")
+
+    def write_textfile(self) -> None:
+        """Write the metrics to textfile. Replaced in one step, so the collector never reads half a file."""
+        if not self.textfile:
+            return
+        directory = os.path.dirname(self.textfile)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.textfile}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, 'w', encoding='utf-8') as f:
+                f.write(self.registry.render())
+            os.replace(temporary, self.textfile)
+        except OSError as e:
+            self.logger.error(f"Failed to write metrics to {self.textfile}: {str(e)}")
+
+    def close(self) -> None:
+        """Stop recording spans and serving, after writing the textfile a last time."""
+        tracing.remove_listener(self.registry.observe)
+        self.write_textfile()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
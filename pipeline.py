@@ -0,0 +1,321 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from profiling import StageProfiler
+import threading
+import tracing
+import logging
+import time
+
+class PipelineError(Exception):
+    """Custom exception for pipeline definition and execution errors."""
+    pass
+
+class StageTimeoutError(PipelineError):
+    """Raised when a stage runs past its timeout."""
+    pass
+
+# Stage states
+PENDING = "pending"
+RUNNING = "running"
+OK = "ok"
+FAILED = "failed"
+TIMEOUT = "timeout"
+CANCELLED = "cancelled"
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable[..., Any]
+    inputs: List[str] = field(default_factory=list)
+    outputs: List[str] = field(default_factory=list)
+    # Stages that must finish first without passing on a value
+    after: List[str] = field(default_factory=list)
+    timeout: Optional[float] = None
+
+@dataclass
+class StageResult:
+    name: str
+    status: str = PENDING
+    start: Optional[float] = None
+    end: Optional[float] = None
+    error: Optional[str] = None
+    dependencies: List[str] = field(default_factory=list)
+
+    @property
+    def duration(self) -> float:
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+def critical_path(results: Dict[str, StageResult], end_stage: Optional[str] = None) -> List[StageResult]:
+    """
+    The chain of stages that determined the total run time, or the end of end_stage if given.
+    Walks back from the stage that finished last, each time to the dependency that finished last.
+    """
+    finished = [result for result in results.values() if result.end is not None]
+    if end_stage is not None:
+        finished = [result for result in finished if result.name == end_stage]
+    if not finished:
+        return []
+    path = [max(finished, key=lambda result: result.end)]
+    while True:
+        depends = [results[name] for name in path[-1].dependencies
+                   if name in results and results[name].end is not None]
+        if not depends:
+            break
+        path.append(max(depends, key=lambda result: result.end))
+    path.reverse()
+    return path
+
+def time_on_path(results: Dict[str, StageResult], path: List[StageResult], stage_name: str,
+                 start_time: float) -> float:
+    """
+    Seconds stage_name delayed the end of path: how long after the stage before it on the
+    path, and after the other dependencies of the stage after it, it was still running.
+    Its full duration in a serial run, zero if it is not on the path.
+    """
+    previous_end = start_time
+    for index, result in enumerate(path):
+        if result.name != stage_name:
+            previous_end = result.end
+            continue
+        ready = max(result.start, previous_end)
+        if index + 1 < len(path):
+            # The next stage could have started once its other dependencies were done
+            ready = max([ready] + [results[name].end for name in path[index + 1].dependencies
+                                   if name != stage_name and name in results and results[name].end is not None])
+        return max(0.0, result.end - ready)
+    return 0.0
+
+class Pipeline:
+    """
+    Runs stages as soon as the stages they depend on have finished.
+    A stage depends on the stages producing its inputs and on the stages listed in after.
+    Its function is called with its inputs as keyword arguments and returns its outputs:
+    nothing, a single value, or a tuple in the order of outputs.
+
+    A failing or timed out stage cancels the pipeline: nothing new is started, and running
+    stages can stop early by taking the CANCEL_EVENT input. Threads cannot be killed, so a
+    timed out stage is abandoned rather than stopped.
+    """
+
+    # Input name under which stages receive the cancellation event
+    CANCEL_EVENT = "cancel_event"
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, profiler: Optional[StageProfiler] = None):
+        """Initialize the pipeline. config is the pipeline section of config.yaml."""
+        config = config or {}
+        # Profiles the stages it is configured for
+        self.profiler = profiler
+        self.max_workers = config.get('max_workers', 4)
+        self.timeouts = config.get('timeouts') or {}
+        self.stages: Dict[str, Stage] = {}
+        self.results: Dict[str, StageResult] = {}
+        self.cancel_event = threading.Event()
+        self.start_time: Optional[float] = None
+        self.end_time: Optional[float] = None
+        self.logger = logging.getLogger(__name__)
+
+    def add_stage(self, name: str, func: Callable[..., Any], inputs: Iterable[str] = (),
+                  outputs: Iterable[str] = (), after: Iterable[str] = (),
+                  timeout: Optional[float] = None) -> Stage:
+        """Add a stage. timeout defaults to pipeline.timeouts.<name> in the configuration."""
+        if name in self.stages:
+            raise PipelineError(f"Stage {name} is defined twice")
+        stage = Stage(name=name, func=func, inputs=list(inputs), outputs=list(outputs),
+                      after=list(after), timeout=timeout if timeout is not None else self.timeouts.get(name))
+        self.stages[name] = stage
+        return stage
+
+    def stage(self, name: str, inputs: Iterable[str] = (), outputs: Iterable[str] = (),
+              after: Iterable[str] = (), timeout: Optional[float] = None):
+        """Decorator form of add_stage."""
+        def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+            self.add_stage(name, func, inputs, outputs, after, timeout)
+            return func
+        return decorator
+
+    def dependencies(self, provided: Iterable[str] = ()) -> Dict[str, Set[str]]:
+        """Resolve and validate the stage graph. provided are the names given to run() up front."""
+        provided = set(provided) | {self.CANCEL_EVENT}
+        producers: Dict[str, str] = {}
+        for stage in self.stages.values():
+            for output in stage.outputs:
+                if output in producers or output in provided:
+                    raise PipelineError(f"{output} is produced by more than one stage")
+                producers[output] = stage.name
+
+        graph: Dict[str, Set[str]] = {}
+        for stage in self.stages.values():
+            depends = set()
+            for name in stage.inputs:
+                if name in producers:
+                    depends.add(producers[name])
+                elif name not in provided:
+                    raise PipelineError(f"Stage {stage.name} needs {name}, which nothing produces")
+            for name in stage.after:
+                if name not in self.stages:
+                    raise PipelineError(f"Stage {stage.name} runs after unknown stage {name}")
+                depends.add(name)
+            graph[stage.name] = depends
+
+        # Kahn's algorithm, anything left over is part of a cycle
+        remaining = {name: set(depends) for name, depends in graph.items()}
+        while remaining:
+            ready = [name for name, depends in remaining.items() if not depends]
+            if not ready:
+                raise PipelineError(f"Dependency cycle between {', '.join(sorted(remaining))}")
+            for name in ready:
+                del remaining[name]
+            for depends in remaining.values():
+                depends.difference_update(ready)
+        return graph
+
+    def cancel(self) -> None:
+        """Stop starting new stages and signal running stages to stop."""
+        self.cancel_event.set()
+
+    def _run_stage(self, stage: Stage, context: Dict[str, Any]) -> Any:
+        result = self.results[stage.name]
+        result.start = time.perf_counter()
+        try:
+            # Dependencies let the critical path be rebuilt from a trace
+            with tracing.span(stage.name, kind="stage", dependencies=result.dependencies):
+                kwargs = {name: context[name] for name in stage.inputs}
+                if self.profiler is not None:
+                    return self.profiler.run(stage.name, stage.func, kwargs)
+                return stage.func(**kwargs)
+        finally:
+            # A timed out stage already has its end time
+            if result.status == RUNNING:
+                result.end = time.perf_counter()
+
+    def _store_outputs(self, stage: Stage, value: Any, context: Dict[str, Any]) -> None:
+        if len(stage.outputs) == 1:
+            context[stage.outputs[0]] = value
+        elif stage.outputs:
+            if not isinstance(value, (tuple, list)) or len(value) != len(stage.outputs):
+                raise PipelineError(f"Stage {stage.name} must return {len(stage.outputs)} values")
+            context.update(zip(stage.outputs, value))
+
+    def run(self, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Run all stages and return the context holding every produced value.
+        Raises PipelineError (StageTimeoutError for a timeout) once running stages have
+        finished if any stage did not succeed.
+        """
+        with tracing.span("pipeline", stages=len(self.stages)):
+            return self._run(context)
+
+    def _run(self, context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        context = dict(context or {})
+        context[self.CANCEL_EVENT] = self.cancel_event
+        graph = self.dependencies(context)
+        self.results = {name: StageResult(name=name, dependencies=sorted(depends))
+                        for name, depends in graph.items()}
+
+        pending = list(self.stages)
+        running: Dict[Future, str] = {}
+        deadlines: Dict[str, float] = {}
+        first_error: Optional[PipelineError] = None
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stage")
+        self.start_time = time.perf_counter()
+        try:
+            while True:
+                if not self.cancel_event.is_set():
+                    for name in list(pending):
+                        # Only as many as there are free workers, so a stage's timeout starts when it does
+                        if len(running) >= self.max_workers:
+                            break
+                        if all(self.results[depend].status == OK for depend in graph[name]):
+                            pending.remove(name)
+                            stage = self.stages[name]
+                            self.results[name].status = RUNNING
+                            self.logger.debug(f"Starting stage {name}")
+                            running[executor.submit(tracing.propagate(self._run_stage), stage, context)] = name
+                            if stage.timeout is not None:
+                                deadlines[name] = time.perf_counter() + stage.timeout
+                if not running:
+                    break
+
+                timed = [deadlines[name] for name in running.values() if name in deadlines]
+                wait_time = max(0.0, min(timed) - time.perf_counter()) if timed else None
+                done, _ = wait(running, timeout=wait_time, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    name = running.pop(future)
+                    stage = self.stages[name]
+                    result = self.results[name]
+                    try:
+                        self._store_outputs(stage, future.result(), context)
+                        result.status = OK
+                        self.logger.debug(f"Stage {name} finished in {result.duration:.4f}s")
+                    except Exception as e:
+                        result.status = FAILED
+                        result.error = str(e) or type(e).__name__
+                        self.logger.error(f"Stage {name} failed: {result.error}")
+                        first_error = first_error or PipelineError(f"Stage {name} failed: {result.error}")
+                        self.cancel()
+
+                now = time.perf_counter()
+                for future, name in list(running.items()):
+                    if name in deadlines and now >= deadlines[name]:
+                        # The thread keeps running, its outputs are discarded
+                        del running[future]
+                        result = self.results[name]
+                        result.status = TIMEOUT
+                        result.end = now
+                        result.error = f"Timed out after {self.stages[name].timeout}s"
+                        self.logger.error(f"Stage {name} timed out after {self.stages[name].timeout}s")
+                        first_error = first_error or StageTimeoutError(f"Stage {name} {result.error.lower()}")
+                        self.cancel()
+        finally:
+            self.end_time = time.perf_counter()
+            executor.shutdown(wait=False)
+
+        for name in pending:
+            self.results[name].status = CANCELLED
+        if pending:
+            self.logger.warning(f"Cancelled stages: {', '.join(pending)}")
+
+        if first_error is not None:
+            raise first_error
+        if pending:
+            raise PipelineError("Pipeline cancelled")
+        return context
+
+    def timings(self) -> Dict[str, float]:
+        """Duration of every stage that ran, in the order the stages were added."""
+        return {name: result.duration for name, result in self.results.items()
+                if result.start is not None and result.end is not None}
+
+    def critical_path(self) -> List[StageResult]:
+        """The chain of stages that determined the total run time."""
+        return critical_path(self.results)
+
+    def critical_path_report(self) -> str:
+        """Human readable critical path, with the time each stage waited after its dependencies."""
+        path = self.critical_path()
+        if not path:
+            return "No stages ran"
+
+        total = (self.end_time or time.perf_counter()) - self.start_time
+        on_path = sum(result.duration for result in path)
+        lines = [f"Critical path, {on_path:.4f}s of {total:.4f}s run time:"]
+        previous_end = self.start_time
+        for result in path:
+            waited = max(0.0, result.start - previous_end)
+            lines.append(f"  {result.name} ({result.duration:.4f}s, {result.status}, waited {waited:.4f}s)")
+            previous_end = result.end
+
+        # These ran alongside the critical path, speeding them up does not shorten the run
+        path_names = {result.name for result in path}
+        others = [result for result in self.results.values()
+                  if result.name not in path_names and result.end is not None]
+        if others:
+            lines.append("Off the critical path:")
+            for result in sorted(others, key=lambda result: result.start):
+                lines.append(f"  {result.name} ({result.duration:.4f}s, {result.status})")
+        return "\n".join(lines)
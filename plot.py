@@ -1,18 +1,29 @@
+from results_store import ResultsStore, DEFAULT_DB
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
+import argparse
 
-# Load data from CSV file
-df = pd.read_csv('./benchmark_results.csv')
+parser = argparse.ArgumentParser(description='Plot average stage times of the stored benchmark runs')
+parser.add_argument('-d', '--db', type=str, default=DEFAULT_DB,
+                    help=f'Results database (default: {DEFAULT_DB})')
+parser.add_argument('-s', '--scenario', type=str, default=None, help='Only runs of this scenario')
+parser.add_argument('--since', type=str, default=None, help='Only runs started on or after this ISO date')
+args = parser.parse_args()
 
-# Print column names to verify what's actually in the CSV
-print("Actual columns in CSV:", df.columns.tolist())
+# Load the runs from the results store, one column per stage
+with ResultsStore(args.db) as store:
+    df = pd.DataFrame(store.wide_rows(scenario=args.scenario, since=args.since))
+
+# Print column names to verify what's actually stored
+print("Stored columns:", df.columns.tolist())
 
 # Extract the function columns (excluding metadata columns)
-# Correct column names based on what's in the CSV file
-function_columns = ['scanning the network', 'Building topology', 'Creating links', 
-                    'Connecting to server', 'Transferring files', 'Starting devices', 
-                    'Setting configuration', 'Run time', 'Total time']
+function_columns = ['scanning_physical_network', 'building_topology', 'creating_links',
+                    'connecting_to_server', 'transferring_files', 'starting_devices',
+                    'setting_configuration', 'physical_to_ndt_delay', 'round_trip_time']
+# Runs from before a stage existed have no value for it
+function_columns = [col for col in function_columns if col in df.columns]
 
 # Calculate mean and std for each function
 means = df[function_columns].mean()
@@ -53,9 +64,9 @@ for i, bar in enumerate(bars):
 fig2, ax2 = plt.subplots(figsize=(14, 8))
 
 # Filter out the larger values for better visualization
-# We'll exclude "Starting devices" and "Total time" which are likely the largest
+# We'll exclude "starting_devices" and "round_trip_time" which are likely the largest
 small_indices = [i for i, col in enumerate(function_columns) 
-                if col not in ['Starting devices', 'Total time'] 
+                if col not in ['starting_devices', 'round_trip_time'] 
                 or means[i] < 20]  # Adjust threshold as needed
 
 small_means = [means[i] for i in small_indices]
@@ -110,9 +121,9 @@ highest_var_col = df[function_columns].var().idxmax()
 print(f"{highest_var_col}: variance = {df[highest_var_col].var():.2f}")
 
 # Calculate percentages of total time
-total_time_mean = means['Total time']
+total_time_mean = means['round_trip_time']
 print("\nPercentage of total time:")
 for col in function_columns:
-    if col != 'Total time':
+    if col != 'round_trip_time':
         percentage = (means[col] / total_time_mean) * 100
         print(f"{col}: {percentage:.2f}%")
\ No newline at end of file
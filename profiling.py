@@ -0,0 +1,179 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from datetime import datetime
+import cProfile
+import threading
+import logging
+import hashlib
+import pstats
+import tracing
+import html
+import sys
+import io
+import os
+
+# Environment variable naming the folder the profiles of a run are written to
+PROFILE_DIR_ENV = "NDT_PROFILE_DIR"
+
+SAMPLING = "sampling"
+DETERMINISTIC = "deterministic"
+
+# cProfile can only run one profiler per process from Python 3.12, where it also covers every
+# thread, so overlapping deterministic stages cannot each get their own profile
+_deterministic_lock = threading.Lock()
+
+class StackSampler:
+    """
+    Samples the stack of one thread at a fixed interval from a background thread and
+    counts the collapsed stacks. Only frames below root are kept, so the samples start
+    at the profiled function instead of the thread pool machinery above it.
+    """
+
+    def __init__(self, thread_id: int, root: Any, interval: float = 0.005):
+        """Initialize the sampler for the thread with thread_id. root is the frame sampling starts below."""
+        self.thread_id = thread_id
+        self.root = root
+        self.interval = interval
+        self.counts: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame is not self.root:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+def write_collapsed(counts: Dict[str, int], path: str) -> None:
+    """Write stacks in the collapsed format of flamegraph.pl, speedscope and inferno."""
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in sorted(counts.items()):
+            f.write(f"{stack} {count}\n")
+
+def flamegraph_svg(counts: Dict[str, int], title: str = "", width: int = 1200, row_height: int = 16) -> str:
+    """Render collapsed stacks as a flamegraph, callers at the bottom and the widest frames the hottest."""
+    # Tree of {name: [samples, children]}
+    root: Dict[str, List[Any]] = {}
+    for stack, count in counts.items():
+        level = root
+        for name in stack.split(";"):
+            node = level.setdefault(name, [0, {}])
+            node[0] += count
+            level = node[1]
+
+    def depth(level: Dict[str, List[Any]]) -> int:
+        return 1 + max((depth(node[1]) for node in level.values()), default=0) if level else 0
+
+    total = sum(counts.values()) or 1
+    height = (depth(root) + 1) * row_height + 30
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+             f'font-family="monospace" font-size="11">',
+             f'<text x="4" y="14">{html.escape(title)} ({total} samples)</text>']
+
+    def draw(level: Dict[str, List[Any]], x: float, row: int) -> None:
+        for name, (count, children) in sorted(level.items()):
+            box_width = count / total * width
+            if box_width >= 0.5:
+                y = height - (row + 1) * row_height
+                # Stable warm colour per function
+                hue = int(hashlib.md5(name.encode()).hexdigest()[:2], 16) % 50
+                label = name if len(name) * 7 < box_width else name[:max(0, int(box_width / 7) - 2)] + ".."
+                parts.append(f'<g><title>{html.escape(name)}: {count} samples ({count / total:.1%})</title>'
+                             f'<rect x="{x:.1f}" y="{y}" width="{box_width:.1f}" height="{row_height - 1}" '
+                             f'fill="hsl({hue},80%,60%)"/>'
+                             + (f'<text x="{x + 3:.1f}" y="{y + row_height - 4}">{html.escape(label)}</text>'
+                                if box_width > 21 else "") + '</g>')
+                draw(children, x, row + 1)
+            x += box_width
+
+    draw(root, 0.0, 0)
+    parts.append('</svg>')
+    return "".join(parts)
+
+class StageProfiler:
+    """
+    Profiles the stages named in the profiling section of config.yaml, every other stage
+    runs untouched. "sampling" writes <stage>.collapsed and a <stage>.svg flamegraph,
+    "deterministic" runs cProfile and writes <stage>.prof and a <stage>.txt summary.
+    Sampling profiles only the thread running the stage, not worker threads it starts.
+    cProfile profiles every thread of the process from Python 3.12, so the profile also holds
+    the stages running next to it, and a stage that overlaps another profiled one runs unprofiled.
+    """
+
+    def __init__(self, stages: Iterable[str] = (), mode: str = SAMPLING, interval: float = 0.005,
+                 output_dir: str = "profiles"):
+        """Initialize the profiler. Nothing is profiled if stages is empty."""
+        self.stages = set(stages)
+        self.mode = mode
+        self.interval = interval
+        self.output_dir = output_dir
+        self.run_dir: Optional[str] = None
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]] = None) -> "StageProfiler":
+        """Create a profiler from the profiling section of config.yaml."""
+        config = config or {}
+        return cls(stages=config.get('stages') or [], mode=config.get('mode', SAMPLING),
+                   interval=config.get('interval', 0.005), output_dir=config.get('output_dir', "profiles"))
+
+    def begin_run(self, run_dir: Optional[str] = None) -> None:
+        """
+        Start a new run, its profiles go to run_dir. Defaults to NDT_PROFILE_DIR,
+        otherwise a timestamped folder in output_dir.
+        """
+        self.run_dir = (run_dir or os.environ.get(PROFILE_DIR_ENV)
+                        or os.path.join(self.output_dir, datetime.now().strftime("%y%m%d_%H%M%S")))
+
+    def run(self, stage_name: str, func: Callable[..., Any], kwargs: Dict[str, Any]) -> Any:
+        """Call func with kwargs, profiled if stage_name is one of the profiled stages."""
+        if stage_name not in self.stages:
+            return func(**kwargs)
+        if self.run_dir is None:
+            self.begin_run()
+        os.makedirs(self.run_dir, exist_ok=True)
+        base = os.path.join(self.run_dir, stage_name)
+
+        if self.mode == DETERMINISTIC:
+            # Waiting for the lock would serialize the stages and skew the run being measured
+            if not _deterministic_lock.acquire(blocking=False):
+                self.logger.warning(f"Not profiling {stage_name}, another stage is already running under cProfile")
+                return func(**kwargs)
+            tracing.set_attribute("profile", base)
+            try:
+                profile = cProfile.Profile()
+                try:
+                    return profile.runcall(func, **kwargs)
+                finally:
+                    profile.dump_stats(f"{base}.prof")
+                    summary = io.StringIO()
+                    pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(40)
+                    with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+                        f.write(summary.getvalue())
+                    self.logger.info(f"Wrote cProfile of {stage_name} to {base}.prof")
+            finally:
+                _deterministic_lock.release()
+
+        tracing.set_attribute("profile", base)
+        sampler = StackSampler(threading.get_ident(), sys._getframe(), self.interval)
+        sampler.start()
+        try:
+            return func(**kwargs)
+        finally:
+            sampler.stop()
+            write_collapsed(sampler.counts, f"{base}.collapsed")
+            with open(f"{base}.svg", 'w', encoding='utf-8') as f:
+                f.write(flamegraph_svg(sampler.counts, stage_name))
+            self.logger.info(f"Wrote {sum(sampler.counts.values())} stack samples of {stage_name} to {base}.collapsed")
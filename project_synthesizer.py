@@ -0,0 +1,65 @@
+from typing import Dict, Optional
+from backup_manifest import BACKUP_DIR, newest_backup
+import xml.etree.ElementTree as ET
+import logging
+import zipfile
+import io
+import os
+
+logger = logging.getLogger(__name__)
+
+def _register_namespaces(xml_path: str) -> None:
+    """Keep the WeConfig namespace prefixes when the project is written back."""
+    for _, (prefix, uri) in ET.iterparse(xml_path, events=['start-ns']):
+        ET.register_namespace(prefix, uri)
+
+def synthesize_project_xml(physical_xml_path: str, hostnames: Dict[str, str]) -> bytes:
+    """
+    Build the Project.xml of the NDT from the physical project.
+    Every NDT node is a copy of a physical device with the same ID and base MAC,
+    so only the hostname changes. hostnames maps device IDs to the mDNS names of the NDT
+    nodes, i.e "foo.local". The management address is left as it is, devices are matched by MAC.
+    """
+    _register_namespaces(physical_xml_path)
+    tree = ET.parse(physical_xml_path)
+
+    for child in tree.getroot().iter():
+        if 'Family' not in child.attrib:
+            continue
+        hostname = hostnames.get(child.attrib.get('Id'))
+        if hostname is None:
+            continue
+        for info in child.iter():
+            if info.tag.endswith('Hostname'):
+                info.text = hostname[:-len(".local")] if hostname.endswith(".local") else hostname
+
+    buffer = io.BytesIO()
+    tree.write(buffer, encoding='utf-8', xml_declaration=True)
+    return buffer.getvalue()
+
+def synthesize_project(physical_project_dir: str, backups_dir: str, output_path: str,
+                       hostnames: Optional[Dict[str, str]] = None) -> str:
+    """
+    Write an .nprj for the NDT without running WeConfig discover.
+    physical_project_dir is the extracted physical project, backups_dir the directory holding
+    the fetched "Configuration Backups/<device-id>/<timestamp>.json" tree of the NDT devices.
+    Only the newest complete backup of each device is included.
+    """
+    project_xml = synthesize_project_xml(os.path.join(physical_project_dir, "Project.xml"), hostnames or {})
+
+    backup_root = os.path.join(backups_dir, BACKUP_DIR)
+    with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as project:
+        project.writestr("Project.xml", project_xml)
+        if os.path.isdir(backup_root):
+            for device_id in os.listdir(backup_root):
+                device_dir = os.path.join(backup_root, device_id)
+                # Skips partial downloads and anything else not named like a backup
+                filename = newest_backup(os.listdir(device_dir))
+                if filename is None:
+                    logger.warning(f"No complete backup of {device_id} in {device_dir}")
+                    continue
+                project.write(os.path.join(device_dir, filename),
+                              arcname=f"{BACKUP_DIR}/{device_id}/{filename}")
+
+    logger.info(f"Synthesized NDT project {output_path}")
+    return output_path
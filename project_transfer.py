@@ -0,0 +1,97 @@
+from typing import Dict, Any, Set
+from ssh_manager import SSHConnectionManager
+import hashlib
+import logging
+import shlex
+import tarfile
+import time
+import io
+import os
+
+# Remote directories, relative to the home directory of the SSH user
+REMOTE_CACHE = "NDT/cache"
+REMOTE_PROJECTS = "NDT/project_files"
+
+class TransferError(Exception):
+    """Custom exception for project transfer errors."""
+    pass
+
+class ProjectTransfer:
+    """
+    Sends only the files the remote restore needs to the GNS3 server.
+    Files are stored once in a content-addressed cache (~/NDT/cache/<sha256>)
+    and hard-linked into the project layout, so unchanged backups are never resent.
+    """
+
+    def __init__(self, ssh_manager: SSHConnectionManager):
+        """Initialize the project transfer."""
+        self.ssh_manager = ssh_manager
+        self.logger = logging.getLogger(__name__)
+
+    def _file_hash(self, path: str) -> str:
+        """Return the SHA-256 hex digest of a local file."""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _cached_hashes(self) -> Set[str]:
+        """List the content hashes already present in the remote cache."""
+        result = self.ssh_manager.exec_command(f"mkdir -p ~/{REMOTE_CACHE} && ls ~/{REMOTE_CACHE}")
+        if result.exit_status != 0:
+            raise TransferError(f"Failed to list remote cache: {result.stderr.strip()}")
+        return set(result.stdout.split())
+
+    def _build_archive(self, files: Dict[str, str]) -> bytes:
+        """Pack files (hash -> local path) into a gzip-compressed tar named by hash."""
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+            for content_hash, path in files.items():
+                archive.add(path, arcname=content_hash)
+        return buffer.getvalue()
+
+    def transfer(self, project_dir: str, folder_name: str, manifest: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Transfer the manifest entries of a local project to ~/NDT/project_files/<folder_name>.
+        Returns transfer statistics.
+        """
+        start_time = time.perf_counter()
+
+        hashes = {}
+        for relative_path in manifest.values():
+            hashes[relative_path] = self._file_hash(os.path.join(project_dir, relative_path))
+
+        cached = self._cached_hashes()
+        missing = {content_hash: os.path.join(project_dir, relative_path)
+                   for relative_path, content_hash in hashes.items()
+                   if content_hash not in cached}
+
+        archive_size = 0
+        if missing:
+            archive = self._build_archive(missing)
+            archive_size = len(archive)
+            result = self.ssh_manager.exec_command(f"tar -xzf - -C ~/{REMOTE_CACHE}", input=archive)
+            if result.exit_status != 0:
+                raise TransferError(f"Failed to unpack archive on server: {result.stderr.strip()}")
+
+        # Link cached files into the layout restore.sh expects, in a single command
+        commands = []
+        for relative_path, content_hash in hashes.items():
+            destination = shlex.quote(f"{REMOTE_PROJECTS}/{folder_name}/{relative_path}")
+            commands.append(f"mkdir -p \"$(dirname ~/{destination})\" && ln -f ~/{REMOTE_CACHE}/{content_hash} ~/{destination}")
+        if commands:
+            result = self.ssh_manager.exec_command(" && ".join(commands))
+            if result.exit_status != 0:
+                raise TransferError(f"Failed to link cached files: {result.stderr.strip()}")
+
+        stats = {
+            'files': len(hashes),
+            'sent': len(missing),
+            'cached': len(hashes) - len(missing),
+            'bytes': archive_size,
+            'duration': time.perf_counter() - start_time
+        }
+        self.logger.info(f"Transferred {stats['sent']} of {stats['files']} files "
+                         f"({stats['cached']} cached, {stats['bytes']} bytes compressed)")
+        return stats
@@ -0,0 +1,198 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from results_store import ResultsStore, DEFAULT_DB
+import benchmark_stats
+import statistics
+import argparse
+import sys
+
+# Characters of the trend line, from fastest to slowest, ASCII for Windows consoles
+TREND_LEVELS = " .:-=+*#"
+
+@dataclass
+class Shift:
+    scenario: str
+    stage: str
+    # Position in the series of the first run after the shift
+    index: int
+    # Pettitt's test on the series, confirmed by a test between the segments around the shift
+    p_value: float
+    comparison: benchmark_stats.Comparison
+    last_before: Dict[str, Any]
+    first_after: Dict[str, Any]
+    # Whether this shift set the level of the latest runs
+    latest: bool = False
+
+    @property
+    def regression(self) -> bool:
+        return self.comparison.change > 0
+
+@dataclass
+class RollingCheck:
+    scenario: str
+    stage: str
+    # Latest window runs against the baseline runs before them
+    window: int
+    baseline: int
+    comparison: benchmark_stats.Comparison
+
+    @property
+    def regression(self) -> bool:
+        return self.comparison.significant and self.comparison.change > 0
+
+def stage_series(runs: List[Dict[str, Any]]) -> Dict[str, List[Tuple[Dict[str, Any], float]]]:
+    """(run, seconds) of every stage over the successful runs, in run order."""
+    series: Dict[str, List[Tuple[Dict[str, Any], float]]] = {}
+    for run in runs:
+        if not run['success']:
+            continue
+        for stage, value in run['timings'].items():
+            if value is not None:
+                series.setdefault(stage, []).append((run, value))
+    return series
+
+def is_relevant(comparison: benchmark_stats.Comparison, min_change: float, min_seconds: float) -> bool:
+    """Significant, and large enough to matter both relative to the stage and in seconds."""
+    return (comparison.significant and abs(comparison.change) >= min_change
+            and abs(comparison.median_b - comparison.median_a) >= min_seconds)
+
+def detect_shifts(scenario: str, stage: str, series: List[Tuple[Dict[str, Any], float]],
+                  alpha: float = 0.01, min_segment: int = 5, min_change: float = 0.1,
+                  min_seconds: float = 0.1) -> List[Shift]:
+    """
+    Shifts in the level of a stage. A change point counts if the segments on either side
+    also differ significantly and their medians differ by at least min_change and min_seconds.
+    """
+    values = [value for _, value in series]
+    points = benchmark_stats.change_points(values, alpha, min_segment)
+    bounds = [0] + [index for index, _ in points] + [len(values)]
+
+    shifts = []
+    for number, (index, p_value) in enumerate(points, start=1):
+        before = values[bounds[number - 1]:index]
+        after = values[index:bounds[number + 1]]
+        comparison = benchmark_stats.compare(before, after, stage)
+        if not is_relevant(comparison, min_change, min_seconds):
+            continue
+        shifts.append(Shift(scenario=scenario, stage=stage, index=index, p_value=p_value,
+                            comparison=comparison, last_before=series[index - 1][0], first_after=series[index][0]))
+    if shifts:
+        # Later change points too small to report leave the level where this one set it
+        shifts[-1].latest = True
+    return shifts
+
+def rolling_check(scenario: str, stage: str, series: List[Tuple[Dict[str, Any], float]],
+                  window: int = 10, baseline: int = 30) -> Optional[RollingCheck]:
+    """Compare the latest window runs to the baseline runs before them. None if there are too few runs."""
+    values = [value for _, value in series]
+    if len(values) < window + min(baseline, 5):
+        return None
+    recent = values[-window:]
+    previous = values[max(0, len(values) - window - baseline):-window]
+    return RollingCheck(scenario=scenario, stage=stage, window=window, baseline=len(previous),
+                        comparison=benchmark_stats.compare(previous, recent, stage))
+
+def trend_line(values: List[float], width: int = 40) -> str:
+    """The series as a line of characters, each the median of a bucket of runs."""
+    if not values:
+        return ""
+    buckets = [values[len(values) * i // width:len(values) * (i + 1) // width] for i in range(min(width, len(values)))]
+    medians = [statistics.median(bucket) for bucket in buckets if bucket]
+    low, high = min(medians), max(medians)
+    if high == low:
+        return TREND_LEVELS[len(TREND_LEVELS) // 2] * len(medians)
+    return "".join(TREND_LEVELS[round((median - low) / (high - low) * (len(TREND_LEVELS) - 1))] for median in medians)
+
+def describe_run(run: Dict[str, Any]) -> str:
+    return f"run {run['id']} ({run['timestamp']}, {run['commit'] or 'unknown commit'})"
+
+def describe_shift(shift: Shift) -> str:
+    comparison = shift.comparison
+    kind = "slower" if shift.regression else "faster"
+    return (f"{comparison.change:+.1%} {kind} ({comparison.median_a:.3f}s -> {comparison.median_b:.3f}s), "
+            f"between {describe_run(shift.last_before)} and {describe_run(shift.first_after)}, "
+            f"p={shift.p_value:.2g}")
+
+def describe_rolling(check: RollingCheck) -> str:
+    comparison = check.comparison
+    marker = " *" if comparison.significant else ""
+    return (f"latest {check.window} vs previous {check.baseline}: {comparison.change:+.1%} "
+            f"(difference {comparison.ci_low:+.3f}s to {comparison.ci_high:+.3f}s, p={comparison.p_value:.2g}){marker}")
+
+def analyse(store: ResultsStore, scenario: Optional[str] = None, since: Optional[str] = None,
+            stages: Optional[List[str]] = None, alpha: float = 0.01, min_segment: int = 5,
+            min_change: float = 0.1, min_seconds: float = 0.1, window: int = 10, baseline: int = 30,
+            check: bool = False) -> List[Any]:
+    """
+    Look for shifts and recent slowdowns in every stage of every scenario and print them.
+    Returns the regressions a check fails on: slowdowns that set the level of the latest runs,
+    and significant slowdowns of the latest runs against the rolling baseline.
+    """
+    runs = store.runs(scenario=scenario, since=since)
+    by_scenario: Dict[str, List[Dict[str, Any]]] = {}
+    for run in runs:
+        by_scenario.setdefault(run['scenario'], []).append(run)
+
+    regressions: List[Any] = []
+    for scenario_name, scenario_runs in by_scenario.items():
+        series_by_stage = stage_series(scenario_runs)
+        if not check:
+            print(f"\n{scenario_name}: {len(scenario_runs)} runs from {scenario_runs[0]['timestamp']} "
+                  f"to {scenario_runs[-1]['timestamp']}")
+        for stage, series in series_by_stage.items():
+            if stages and stage not in stages:
+                continue
+            values = [value for _, value in series]
+            shifts = detect_shifts(scenario_name, stage, series, alpha, min_segment, min_change, min_seconds)
+            rolling = rolling_check(scenario_name, stage, series, window, baseline)
+
+            stage_regressions = [shift for shift in shifts if shift.latest and shift.regression]
+            if rolling is not None and rolling.regression and is_relevant(rolling.comparison, min_change, min_seconds):
+                stage_regressions.append(rolling)
+            regressions.extend(stage_regressions)
+
+            if check:
+                for regression in stage_regressions:
+                    detail = describe_shift(regression) if isinstance(regression, Shift) else describe_rolling(regression)
+                    print(f"REGRESSION {scenario_name} {stage}: {detail}")
+                continue
+
+            print(f"  {stage:<32}{len(values):>5}{statistics.median(values):>10.3f}s  [{trend_line(values)}]")
+            for shift in shifts:
+                marker = "  REGRESSION" if shift in stage_regressions else ""
+                print(f"      shift {describe_shift(shift)}{marker}")
+            if rolling is not None:
+                marker = "  REGRESSION" if rolling in stage_regressions else ""
+                print(f"      {describe_rolling(rolling)}{marker}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Change point and regression detection over the stored benchmark runs')
+    parser.add_argument('-d', '--db', type=str, default=DEFAULT_DB,
+                        help=f'Results database (default: {DEFAULT_DB})')
+    parser.add_argument('-s', '--scenario', type=str, default=None, help='Only this scenario (default: all)')
+    parser.add_argument('--since', type=str, default=None, help='Only runs started on or after this ISO date')
+    parser.add_argument('--stage', action='append', default=None, help='Only this stage, can be repeated')
+    parser.add_argument('--alpha', type=float, default=0.01,
+                        help='Significance level of the change point test (default: 0.01)')
+    parser.add_argument('--min-change', type=float, default=0.1,
+                        help='Smallest relative change of the median that is reported (default: 0.1)')
+    parser.add_argument('--min-seconds', type=float, default=0.1,
+                        help='Smallest change of the median in seconds that is reported (default: 0.1)')
+    parser.add_argument('--min-segment', type=int, default=5,
+                        help='Fewest runs on either side of a change point (default: 5)')
+    parser.add_argument('-w', '--window', type=int, default=10,
+                        help='Latest runs compared to the rolling baseline (default: 10)')
+    parser.add_argument('-b', '--baseline', type=int, default=30,
+                        help='Runs before the window forming the rolling baseline (default: 30)')
+    parser.add_argument('--check', action='store_true',
+                        help='Only print regressions and exit with status 1 if there are any')
+    args = parser.parse_args()
+
+    with ResultsStore(args.db) as store:
+        regressions = analyse(store, args.scenario, args.since, args.stage, args.alpha, args.min_segment,
+                              args.min_change, args.min_seconds, args.window, args.baseline, args.check)
+    if args.check:
+        print(f"{len(regressions)} regressions found")
+        if regressions:
+            sys.exit(1)
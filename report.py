@@ -0,0 +1,354 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from pipeline import StageResult, critical_path, OK, FAILED
+from results_store import ResultsStore, DEFAULT_DB
+from html import escape
+import benchmark_stats
+import statistics
+import argparse
+import math
+
+class ReportError(Exception):
+    """Custom exception for report generation errors."""
+    pass
+
+# The measurement the stages are ranked against
+TOTAL = "round_trip_time"
+
+# Measurements main.py derives from several stages, they are not stages themselves
+DERIVED = ("physical_to_ndt_delay", "ndt_to_physical_delay", TOTAL)
+
+# GNS3 server resource samples drawn under the waterfall, all in percent
+RESOURCE_METRICS = (("cpu_percent", "CPU"), ("iowait_percent", "I/O wait"),
+                    ("mem_used_percent", "memory"), ("disk_busy_percent", "disk busy"))
+
+@dataclass
+class Bar:
+    label: str
+    # Seconds from the start of the run
+    start: float
+    duration: float
+    # critical, stage, device or failed
+    kind: str
+
+@dataclass
+class StageRanking:
+    stage: str
+    n: int
+    median: float
+    stdev: float
+    # Share of the round_trip_time variance that moves with the stage
+    share: float
+    # Share of the runs with a trace where the stage was on the critical path
+    critical: float
+
+def stage_results(spans: List[Dict[str, Any]]) -> Dict[str, StageResult]:
+    """Rebuild the pipeline's stage results from the stage spans of a trace."""
+    results = {}
+    for span in spans:
+        attributes = span.get('attributes') or {}
+        if attributes.get('kind') != "stage" or span.get('start') is None:
+            continue
+        results[span['name']] = StageResult(
+            name=span['name'], status=OK if span.get('status') == "ok" else FAILED,
+            start=span['start'], end=span['start'] + (span.get('duration') or 0.0),
+            error=span.get('error'), dependencies=attributes.get('dependencies') or [])
+    return results
+
+def waterfall(spans: List[Dict[str, Any]]) -> List[Bar]:
+    """Stages of a run in start order, each followed by the per-device spans made inside it."""
+    results = stage_results(spans)
+    if not results:
+        return []
+    run_start = min(result.start for result in results.values())
+    on_path = {result.name for result in critical_path(results)}
+
+    # Per-device spans are nested at any depth below their stage
+    by_id = {span['span_id']: span for span in spans}
+    stage_ids = {span['span_id']: span['name'] for span in spans
+                 if (span.get('attributes') or {}).get('kind') == "stage"}
+    devices: Dict[str, List[Dict[str, Any]]] = {}
+    for span in spans:
+        if 'device' not in (span.get('attributes') or {}) or span.get('start') is None:
+            continue
+        parent = span.get('parent_id')
+        while parent is not None and parent not in stage_ids:
+            parent = by_id[parent].get('parent_id') if parent in by_id else None
+        if parent is not None:
+            devices.setdefault(stage_ids[parent], []).append(span)
+
+    bars = []
+    for result in sorted(results.values(), key=lambda result: result.start):
+        if result.status != OK:
+            kind = "failed"
+        else:
+            kind = "critical" if result.name in on_path else "stage"
+        bars.append(Bar(result.name, result.start - run_start, result.duration, kind))
+        for span in sorted(devices.get(result.name, []), key=lambda span: span['start']):
+            label = f"{span['attributes']['device']} ({span['name']})"
+            bars.append(Bar(label, span['start'] - run_start, span.get('duration') or 0.0,
+                            "failed" if span.get('status') != "ok" else "device"))
+    return bars
+
+def median_waterfall(traces: List[List[Dict[str, Any]]]) -> List[Bar]:
+    """Median start offset and duration of every stage over several runs."""
+    offsets: Dict[str, List[float]] = {}
+    durations: Dict[str, List[float]] = {}
+    paths: Dict[str, int] = {}
+    for spans in traces:
+        results = stage_results(spans)
+        if not results:
+            continue
+        run_start = min(result.start for result in results.values())
+        for result in results.values():
+            offsets.setdefault(result.name, []).append(result.start - run_start)
+            durations.setdefault(result.name, []).append(result.duration)
+        for result in critical_path(results):
+            paths[result.name] = paths.get(result.name, 0) + 1
+
+    bars = []
+    for name in sorted(offsets, key=lambda name: statistics.median(offsets[name])):
+        # On the critical path in at least half the runs
+        kind = "critical" if paths.get(name, 0) * 2 >= len(traces) else "stage"
+        bars.append(Bar(name, statistics.median(offsets[name]), statistics.median(durations[name]), kind))
+    return bars
+
+def critical_path_frequency(traces: List[List[Dict[str, Any]]]) -> Dict[str, float]:
+    """Share of the runs in which each stage was on the critical path."""
+    counts: Dict[str, int] = {}
+    for spans in traces:
+        for result in critical_path(stage_results(spans)):
+            counts[result.name] = counts.get(result.name, 0) + 1
+    return {name: count / len(traces) for name, count in counts.items()} if traces else {}
+
+def rank_stages(runs: List[Dict[str, Any]], frequency: Dict[str, float]) -> List[StageRanking]:
+    """Rank the stages by their share of the round_trip_time variance, over successful runs."""
+    complete = [run for run in runs if run['success'] and run['timings'].get(TOTAL) is not None]
+    stages: Dict[str, List[Tuple[float, float]]] = {}
+    for run in complete:
+        for stage, value in run['timings'].items():
+            if stage not in DERIVED and value is not None:
+                stages.setdefault(stage, []).append((value, run['timings'][TOTAL]))
+
+    ranking = []
+    for stage, pairs in stages.items():
+        values = [value for value, _ in pairs]
+        share = benchmark_stats.variance_contribution(values, [total for _, total in pairs])
+        ranking.append(StageRanking(stage=stage, n=len(values), median=statistics.median(values),
+                                    stdev=statistics.stdev(values) if len(values) > 1 else 0.0,
+                                    share=share, critical=frequency.get(stage, 0.0)))
+    ranking.sort(key=lambda rank: -rank.share if not math.isnan(rank.share) else math.inf)
+    return ranking
+
+def representative_run(runs: List[Dict[str, Any]], traces: Dict[int, List[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """The successful run with a trace whose round_trip_time is closest to the median."""
+    candidates = [run for run in runs if run['success'] and traces.get(run['id'])
+                  and run['timings'].get(TOTAL) is not None]
+    if not candidates:
+        return None
+    median = statistics.median(run['timings'][TOTAL] for run in candidates)
+    return min(candidates, key=lambda run: abs(run['timings'][TOTAL] - median))
+
+def stage_resources(results: Dict[str, StageResult], samples: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """
+    Mean of every resource metric during each stage. A sample covers the time since the
+    previous one, so a stage gets every sample whose interval overlaps it.
+    """
+    usage: Dict[str, Dict[str, float]] = {}
+    for result in results.values():
+        overlapping = [sample for previous, sample in zip([None] + samples[:-1], samples)
+                       if sample['at'] > result.start and (previous is None or previous['at'] < result.end)]
+        if not overlapping:
+            continue
+        usage[result.name] = {metric: statistics.mean(sample.get(metric, 0.0) for sample in overlapping)
+                              for metric, _ in RESOURCE_METRICS}
+    return usage
+
+def median_stage_resources(traces: List[Tuple[List[Dict[str, Any]], List[Dict[str, float]]]]) -> Dict[str, Dict[str, float]]:
+    """Median over runs of the mean resource usage during each stage, from (spans, samples) of every run."""
+    values: Dict[str, Dict[str, List[float]]] = {}
+    for spans, samples in traces:
+        for stage, usage in stage_resources(stage_results(spans), samples).items():
+            for metric, value in usage.items():
+                values.setdefault(stage, {}).setdefault(metric, []).append(value)
+    return {stage: {metric: statistics.median(series) for metric, series in metrics.items()}
+            for stage, metrics in values.items()}
+
+def _tick_step(total: float) -> float:
+    """A round tick interval giving at most ten ticks."""
+    step = 10 ** math.floor(math.log10(total)) if total > 0 else 1.0
+    for factor in (1, 2, 5, 10):
+        if total / (step * factor) <= 10:
+            return step * factor
+    return step * 10
+
+def svg_gantt(bars: List[Bar], label_width: int = 320, chart_width: int = 640, row_height: int = 18) -> str:
+    """Horizontal bar chart of bars on a shared time axis."""
+    if not bars:
+        return "<p>No stage spans recorded.</p>"
+    total = max(bar.start + bar.duration for bar in bars) or 1.0
+    scale = chart_width / total
+    height = row_height * len(bars) + 30
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{label_width + chart_width + 60}" '
+             f'height="{height}" font-family="sans-serif" font-size="11">']
+
+    step = _tick_step(total)
+    tick = 0.0
+    while tick <= total:
+        x = label_width + tick * scale
+        parts.append(f'<line x1="{x:.1f}" y1="0" x2="{x:.1f}" y2="{height - 20}" stroke="#ddd"/>'
+                     f'<text x="{x:.1f}" y="{height - 6}" text-anchor="middle">{tick:g}s</text>')
+        tick += step
+
+    for row, bar in enumerate(bars):
+        y = row * row_height
+        indent = 12 if bar.kind == "device" else 0
+        x = label_width + bar.start * scale
+        width = max(bar.duration * scale, 1.0)
+        parts.append(f'<text x="{indent}" y="{y + row_height - 5}">{escape(bar.label)}</text>'
+                     f'<rect class="{bar.kind}" x="{x:.1f}" y="{y + 3}" width="{width:.1f}" '
+                     f'height="{row_height - 6}"><title>{escape(bar.label)}: {bar.duration:.3f}s '
+                     f'at {bar.start:.3f}s</title></rect>'
+                     f'<text x="{x + width + 4:.1f}" y="{y + row_height - 5}" fill="#555">'
+                     f'{bar.duration:.2f}s</text>')
+    parts.append('</svg>')
+    return "".join(parts)
+
+def svg_resources(samples: List[Dict[str, float]], run_start: float, total: float, label_width: int = 320,
+                  chart_width: int = 640, height: int = 120) -> str:
+    """Resource usage over time, on the time axis of the waterfall drawn with the same widths."""
+    scale = chart_width / (total or 1.0)
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{label_width + chart_width + 60}" '
+             f'height="{height + 10}" font-family="sans-serif" font-size="11">']
+    for percent in (0, 50, 100):
+        y = height - percent / 100 * height + 5
+        parts.append(f'<line x1="{label_width}" y1="{y:.1f}" x2="{label_width + chart_width}" y2="{y:.1f}" '
+                     f'stroke="#ddd"/><text x="{label_width - 4}" y="{y + 4:.1f}" text-anchor="end">{percent}%</text>')
+    for row, (metric, label) in enumerate(RESOURCE_METRICS):
+        points = " ".join(f"{label_width + (sample['at'] - run_start) * scale:.1f},"
+                          f"{height - min(max(sample.get(metric, 0.0), 0.0), 100.0) / 100 * height + 5:.1f}"
+                          for sample in samples if 0 <= sample['at'] - run_start <= total)
+        parts.append(f'<line class="{metric}" x1="0" y1="{row * 16 + 10}" x2="14" y2="{row * 16 + 10}"/>'
+                     f'<text x="20" y="{row * 16 + 14}">{escape(label)}</text>'
+                     f'<polyline class="{metric}" points="{points}"/>')
+    parts.append('</svg>')
+    return "".join(parts)
+
+def _resource_table(usage: Dict[str, Dict[str, float]], order: List[str]) -> str:
+    rows = []
+    for stage in sorted(usage, key=lambda stage: order.index(stage) if stage in order else len(order)):
+        cells = "".join(f"<td>{usage[stage].get(metric, 0.0):.0f}%</td>" for metric, _ in RESOURCE_METRICS)
+        rows.append(f"<tr><td>{escape(stage)}</td>{cells}</tr>")
+    headers = "".join(f"<th>{escape(label)}</th>" for _, label in RESOURCE_METRICS)
+    return f"<table><tr><th>stage</th>{headers}</tr>" + "".join(rows) + "</table>"
+
+def _ranking_table(ranking: List[StageRanking]) -> str:
+    rows = []
+    for rank in ranking:
+        share = 0.0 if math.isnan(rank.share) else rank.share
+        width = max(0.0, min(share, 1.0)) * 200
+        rows.append(f'<tr><td>{escape(rank.stage)}</td><td>{rank.n}</td><td>{rank.median:.3f}</td>'
+                    f'<td>{rank.stdev:.3f}</td><td>{share:.1%}</td>'
+                    f'<td><svg width="200" height="10"><rect class="critical" width="{width:.1f}" '
+                    f'height="10"/></svg></td><td>{rank.critical:.0%}</td></tr>')
+    return ('<table><tr><th>stage</th><th>n</th><th>median (s)</th><th>stdev (s)</th>'
+            '<th colspan="2">share of variance</th><th>on critical path</th></tr>'
+            + "".join(rows) + '</table>')
+
+STYLE = """
+body { font-family: sans-serif; margin: 2em; color: #222; }
+table { border-collapse: collapse; font-size: 13px; }
+td, th { padding: 2px 10px; text-align: right; }
+td:first-child, th:first-child { text-align: left; }
+rect.critical { fill: #d9534f; }
+rect.stage { fill: #5b8bd0; }
+rect.device { fill: #a9c4ea; }
+rect.failed { fill: #333; }
+polyline { fill: none; }
+.cpu_percent { stroke: #d9534f; stroke-width: 2; }
+.iowait_percent { stroke: #f0ad4e; stroke-width: 2; }
+.mem_used_percent { stroke: #5b8bd0; stroke-width: 2; }
+.disk_busy_percent { stroke: #5cb85c; stroke-width: 2; }
+"""
+
+def build_report(store: ResultsStore, title: str, **filters: Any) -> str:
+    """Render the HTML report of the runs matching filters."""
+    runs = store.runs(**filters)
+    if not runs:
+        raise ReportError("No runs match the given filters")
+    traces = {run['id']: store.spans(run['id']) for run in runs if run['success']}
+    traced = [spans for spans in traces.values() if stage_results(spans)]
+    samples = {run_id: store.resource_samples(run_id) for run_id in traces}
+    frequency = critical_path_frequency(traced)
+    ranking = rank_stages(runs, frequency)
+
+    successes = sum(1 for run in runs if run['success'])
+    rate, low, high = benchmark_stats.success_rate(successes, len(runs))
+    commits = sorted({run['commit'] for run in runs if run['commit']})
+    totals = [run['timings'][TOTAL] for run in runs if run['success'] and run['timings'].get(TOTAL) is not None]
+
+    sections = [f"<h1>{escape(title)}</h1>",
+                f"<p>{len(runs)} runs from {escape(runs[0]['timestamp'])} to {escape(runs[-1]['timestamp'])}, "
+                f"{successes} successful ({rate:.0%}, 95% CI {low:.0%} - {high:.0%}). "
+                f"Commits: {escape(', '.join(commits) or 'unknown')}.</p>"]
+    if totals:
+        sections.append(f"<p>{TOTAL}: median {statistics.median(totals):.2f}s, "
+                        f"p90 {benchmark_stats.percentile(totals, 90):.2f}s over {len(totals)} runs.</p>")
+
+    sections.append(f"<h2>Stages by contribution to {TOTAL} variance</h2>"
+                    "<p>Share is cov(stage, total) / var(total). A stage that varies while running alongside "
+                    "the critical path does not move the total and gets a share near zero.</p>"
+                    + _ranking_table(ranking))
+
+    run = representative_run(runs, traces)
+    if run is not None:
+        spans = traces[run['id']]
+        path = critical_path(stage_results(spans))
+        bars = waterfall(spans)
+        sections.append(f"<h2>Waterfall of run {run['id']} ({TOTAL} {run['timings'][TOTAL]:.2f}s, "
+                        f"closest to the median)</h2>"
+                        f"<p>Critical path: {' &rarr; '.join(escape(result.name) for result in path)}</p>"
+                        + svg_gantt(bars))
+        if samples.get(run['id']):
+            sections.append("<p>GNS3 server resources during the run:</p>"
+                            + svg_resources(samples[run['id']], min(result.start for result in stage_results(spans).values()),
+                                            max(bar.start + bar.duration for bar in bars)))
+        sections.append(f"<h2>Median waterfall over {len(traced)} traced runs</h2>"
+                        "<p>Median start and duration of every stage. Red stages were on the critical path "
+                        "in at least half the runs.</p>" + svg_gantt(median_waterfall(traced)))
+    else:
+        sections.append("<p>No successful run has a stored trace, so no waterfall can be drawn.</p>")
+
+    sampled = [(spans, samples[run_id]) for run_id, spans in traces.items() if samples[run_id]]
+    if sampled:
+        order = [bar.label for bar in median_waterfall(traced)]
+        sections.append(f"<h2>GNS3 server resources per stage over {len(sampled)} sampled runs</h2>"
+                        "<p>Median over runs of the mean usage while the stage ran. A stage that is slow "
+                        "while CPU, I/O wait or disk busy is near 100% is limited by the server, not the "
+                        "NDT.</p>" + _resource_table(median_stage_resources(sampled), order))
+
+    return (f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{escape(title)}</title>"
+            f"<style>{STYLE}</style></head><body>{''.join(sections)}</body></html>")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Critical path and waterfall report of stored benchmark runs')
+    parser.add_argument('-d', '--db', type=str, default=DEFAULT_DB,
+                        help=f'Results database (default: {DEFAULT_DB})')
+    parser.add_argument('-o', '--output', type=str, default="benchmark_report.html",
+                        help='HTML report (default: benchmark_report.html)')
+    parser.add_argument('-s', '--scenario', type=str, default=None, help='Only runs of this scenario')
+    parser.add_argument('--commit', type=str, default=None, help='Only runs made at this commit')
+    parser.add_argument('--since', type=str, default=None, help='Only runs started on or after this ISO date')
+    parser.add_argument('--until', type=str, default=None, help='Only runs started before this ISO date')
+    args = parser.parse_args()
+
+    title = f"Benchmark report: {args.scenario or 'all scenarios'}"
+    with ResultsStore(args.db) as store:
+        try:
+            html = build_report(store, title, scenario=args.scenario, commit=args.commit,
+                                since=args.since, until=args.until)
+        except ReportError as e:
+            parser.exit(1, f"{e}\n")
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write(html)
+    print(f"Report written to {args.output}")
@@ -0,0 +1,162 @@
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional
+from ssh_manager import SSHConnectionManager
+import threading
+import logging
+import tracing
+import time
+import re
+
+# Span kind under which samples are written to the trace
+RESOURCE = "resource"
+
+# Whole disks, not their partitions
+DISK_PATTERN = re.compile(r"^(sd[a-z]+|vd[a-z]+|xvd[a-z]+|nvme\d+n\d+)$")
+
+# One sample per interval between @sample and @end, until the channel is closed
+SAMPLE_SCRIPT = (
+    "while :; do echo @sample; cat /proc/loadavg; head -n 1 /proc/stat; "
+    "grep -E '^(MemTotal|MemAvailable|SwapTotal|SwapFree):' /proc/meminfo; cat /proc/diskstats; "
+    "echo qemu $(pgrep -c qemu-system); echo @end; sleep {interval}; done"
+)
+
+@dataclass
+class ResourceSample:
+    # Wall clock time the sample was received, comparable with the span start times
+    timestamp: float
+    load1: float = 0.0
+    load5: float = 0.0
+    # Shares of CPU time since the previous sample, in percent
+    cpu_percent: float = 0.0
+    iowait_percent: float = 0.0
+    mem_used_percent: float = 0.0
+    mem_available_mb: float = 0.0
+    swap_used_mb: float = 0.0
+    # Summed over all disks since the previous sample
+    disk_read_mb_s: float = 0.0
+    disk_write_mb_s: float = 0.0
+    # Time the busiest disk spent doing I/O, in percent
+    disk_busy_percent: float = 0.0
+    qemu_processes: int = 0
+
+class ResourceSampler:
+    """
+    Samples load, CPU, memory, disk I/O and the number of QEMU processes of the GNS3 server
+    while a run is active. A single shell loop runs on one channel of the shared SSH
+    connection, so sampling adds no handshakes and no per-sample commands. Every sample is
+    written to the trace as a span of kind resource and kept in samples.
+    """
+
+    def __init__(self, ssh_manager: SSHConnectionManager, interval: float = 2.0):
+        """Initialize the sampler. Nothing runs until start()."""
+        self.ssh_manager = ssh_manager
+        self.interval = interval
+        self.samples: List[ResourceSample] = []
+        self.logger = logging.getLogger(__name__)
+
+        self._channel = None
+        self._thread: Optional[threading.Thread] = None
+        # /proc/stat and /proc/diskstats are counters, rates need the previous reading
+        self._previous_cpu: Optional[List[int]] = None
+        self._previous_disks: Dict[str, List[int]] = {}
+        self._previous_time: Optional[float] = None
+
+    def start(self) -> None:
+        """Start sampling in the background."""
+        self._channel = self.ssh_manager.open_channel()
+        self._channel.exec_command(SAMPLE_SCRIPT.format(interval=self.interval))
+        self._thread = threading.Thread(target=self._follow, name="resource-sampler", daemon=True)
+        self._thread.start()
+        self.logger.debug(f"Sampling GNS3 server resources every {self.interval}s")
+
+    def stop(self) -> List[ResourceSample]:
+        """Stop sampling and return the samples taken."""
+        if self._channel is not None:
+            # Ends the remote loop and the reading thread
+            self._channel.close()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+        self.logger.debug(f"Took {len(self.samples)} resource samples")
+        return self.samples
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _follow(self) -> None:
+        lines: List[str] = []
+        try:
+            for raw in self._channel.makefile('rb'):
+                line = raw.decode('utf-8', errors='ignore').strip()
+                if line == "@sample":
+                    lines = []
+                elif line == "@end":
+                    self._record(self.parse(lines, time.time()))
+                else:
+                    lines.append(line)
+        except (OSError, EOFError) as e:
+            # The channel is closed by stop()
+            self.logger.debug(f"Resource sampling ended: {str(e)}")
+
+    def _record(self, sample: Optional[ResourceSample]) -> None:
+        if sample is None:
+            return
+        self.samples.append(sample)
+        tracing.event("gns3_resources", RESOURCE, **{key: value for key, value in asdict(sample).items()
+                                                     if key != 'timestamp'})
+
+    def parse(self, lines: List[str], timestamp: float) -> Optional[ResourceSample]:
+        """
+        Turn one block of the sample script's output into a sample.
+        The first block only primes the counters and returns None.
+        """
+        sample = ResourceSample(timestamp=timestamp)
+        memory: Dict[str, float] = {}
+        cpu: Optional[List[int]] = None
+        disks: Dict[str, List[int]] = {}
+
+        for line in lines:
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0] == "cpu":
+                cpu = [int(value) for value in fields[1:]]
+            elif fields[0].endswith(":") and fields[0][:-1] in ("MemTotal", "MemAvailable", "SwapTotal", "SwapFree"):
+                memory[fields[0][:-1]] = float(fields[1]) / 1024
+            elif fields[0] == "qemu":
+                sample.qemu_processes = int(fields[1]) if len(fields) > 1 and fields[1].isdigit() else 0
+            elif len(fields) >= 14 and DISK_PATTERN.match(fields[2]):
+                # Sectors read, sectors written and milliseconds spent doing I/O
+                disks[fields[2]] = [int(fields[5]), int(fields[9]), int(fields[12])]
+            elif len(fields) == 5 and "/" in fields[3]:
+                # /proc/loadavg: 1, 5 and 15 minute load, running/total tasks, last PID
+                sample.load1, sample.load5 = float(fields[0]), float(fields[1])
+
+        if memory.get('MemTotal'):
+            sample.mem_available_mb = memory.get('MemAvailable', 0.0)
+            sample.mem_used_percent = 100 * (1 - sample.mem_available_mb / memory['MemTotal'])
+        sample.swap_used_mb = memory.get('SwapTotal', 0.0) - memory.get('SwapFree', 0.0)
+
+        previous_cpu, previous_disks, previous_time = self._previous_cpu, self._previous_disks, self._previous_time
+        self._previous_cpu, self._previous_disks, self._previous_time = cpu, disks, timestamp
+        if previous_cpu is None or cpu is None or previous_time is None:
+            return None
+
+        # user nice system idle iowait irq softirq steal
+        deltas = [now - before for now, before in zip(cpu, previous_cpu)]
+        total = sum(deltas[:8]) or 1
+        sample.cpu_percent = 100 * (total - deltas[3] - deltas[4]) / total
+        sample.iowait_percent = 100 * deltas[4] / total
+
+        elapsed = max(timestamp - previous_time, 1e-6)
+        for name, (read, written, busy) in disks.items():
+            if name not in previous_disks:
+                continue
+            before = previous_disks[name]
+            sample.disk_read_mb_s += (read - before[0]) * 512 / 1e6 / elapsed
+            sample.disk_write_mb_s += (written - before[1]) * 512 / 1e6 / elapsed
+            sample.disk_busy_percent = max(sample.disk_busy_percent, min(100.0, (busy - before[2]) / 10 / elapsed))
+        return sample
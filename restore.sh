@@ -1,17 +1,28 @@
-# Example usage: ./backup.sh admin admin https://1.2.3.4 mybackup.formatType
+# Example usage: ./restore.sh admin admin https://1.2.3.4 mybackup.json
+# Pass - as the password to read it from the first line of stdin, keeping it out of the process list
+set -e
 username=$1 #The username to user for authentication (admin)
 password=$2 #The password to use for authentication (admin)
+if [ "$password" = "-" ]; then
+    IFS= read -r password
+fi
 address=$3 #The network location of the target, i.e https://1.2.3.4
 file=$4 #path to file to restore (.json)
+# Per-run files so several restores can run at the same time
+workdir=$(mktemp -d)
+trap 'rm -rf "$workdir"' EXIT
 echo "Attempting to get backup from $address."
 echo "Authenticating..."
-curl -X POST $address -k -b cookies -c cookies -H "Content-Type: application/x-www-form-urlencoded" -d "action=login&restore_action=environment&autorefresh=0&command=auth&uname=$username&pass=$password" > login.html
-sidCookie=$(grep sid login.html -m 1 | sed "s/.*&amp;sid/sid/g" | sed 's/".*//g')
+# printf is a builtin, so the form with the password only reaches curl through its stdin
+printf '%s' "action=login&restore_action=environment&autorefresh=0&command=auth&uname=$username&pass=$password" | \
+    curl -sS -f -X POST $address -k -b "$workdir/cookies" -c "$workdir/cookies" -H "Content-Type: application/x-www-form-urlencoded" -d @- > "$workdir/login.html"
+sidCookie=$(grep sid "$workdir/login.html" -m 1 | sed "s/.*&amp;sid/sid/g" | sed 's/".*//g')
+if [ -z "$sidCookie" ]; then
+    echo "Failed to extract session id from $address" >&2
+    exit 1
+fi
 echo "Session id is $sidCookie"
 echo "Getting backup.."
-curl -X POST $address -k -b $sidCookie -c cookies -H "Content-Type: multipart/form-data" -F 'action=backup' -F 'command=restore' -F "restore_file=@$file"
+curl -sS -f -X POST $address -k -b $sidCookie -c "$workdir/cookies" -H "Content-Type: multipart/form-data" -F 'action=backup' -F 'command=restore' -F "restore_file=@$file"
 echo "Backup complete"
 echo "Firmware upgrade complete"
-
-rm cookies
-rm login.html
\ No newline at end of file
@@ -0,0 +1,84 @@
+from typing import Dict, Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from data_model import Device, DeviceResult
+from ssh_manager import SSHConnectionManager, SSHError
+from backup_manifest import remote_backup_path
+import logging
+import tracing
+import os
+import time
+
+class RestoreExecutor:
+    """Restores device configurations on the GNS3 server concurrently."""
+
+    def __init__(self, ssh_manager: SSHConnectionManager, max_workers: Optional[int] = None):
+        """Initialize the restore executor."""
+        self.ssh_manager = ssh_manager
+        self.config = ssh_manager.config.get('configuration', {})
+        # OpenSSH allows 10 sessions per connection by default (MaxSessions)
+        self.max_workers = max_workers or self.config.get('max_concurrent_restores', 8)
+        self.timeout = self.config.get('restore_timeout', 120)
+        self.username = self.config.get('username', 'admin')
+        self.password = self.config.get('password', 'admin')
+        self.logger = logging.getLogger(__name__)
+
+    def _find_config_file(self, remote_dir: str) -> str:
+        """Return the filename of the newest backup in a remote directory."""
+        result = self.ssh_manager.exec_command(f"ls -t {remote_dir}*.json | head -1", timeout=self.timeout)
+        error = result.stderr.strip()
+        if error:
+            raise FileNotFoundError(f"Error finding config file: {error}")
+
+        config_file = result.stdout.strip()
+        if not config_file:
+            raise FileNotFoundError(f"No config file found in {remote_dir}")
+
+        return os.path.basename(config_file)
+
+    @tracing.traced("restore_device")
+    def restore_device(self, folder_path: str, device: Device, backup_path: Optional[str] = None) -> DeviceResult:
+        """
+        Restore the newest backup of a single device with restore.sh.
+        backup_path is the manifest entry of the device; without it the newest file is looked up remotely.
+        """
+        report = DeviceResult(device_id=device.id, name=device.name)
+        start_time = time.perf_counter()
+
+        try:
+            if backup_path:
+                remote_file = remote_backup_path(folder_path, backup_path)
+            else:
+                remote_dir = f"~/NDT/project_files/{folder_path}/Configuration\\ Backups/{device.id}/"
+                remote_file = remote_dir + self._find_config_file(remote_dir)
+            report.details['config_file'] = remote_file
+
+            # The password goes in on stdin, arguments show up in the process list of the server
+            command = f'~/restore.sh {self.username} - {device.mdns_hostname()} {remote_file}'
+            self.logger.debug(f'Executing command: {command}')
+            result = self.ssh_manager.exec_command(command, timeout=self.timeout,
+                                                   input=f"{self.password}\n".encode('utf-8'))
+
+            report.details['output'] = result.stdout
+            if result.exit_status != 0:
+                report.error = result.stderr.strip() or f"restore.sh exited with status {result.exit_status}"
+            else:
+                report.success = True
+        except (FileNotFoundError, SSHError, OSError) as e:
+            # socket.timeout from a stuck restore is an OSError
+            report.error = str(e) or type(e).__name__
+
+        report.duration = time.perf_counter() - start_time
+        if report.success:
+            self.logger.info(f"Restored configuration on {device.name} in {report.duration:.4f}s")
+        else:
+            self.logger.error(f"Failed to restore configuration on {device.name}: {report.error}")
+        return report
+
+    def restore_all(self, folder_path: str, devices: List[Device],
+                    manifest: Optional[Dict[str, str]] = None) -> List[DeviceResult]:
+        """Restore all devices in parallel and return one result per device."""
+        manifest = manifest or {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(tracing.propagate(self.restore_device), folder_path, device, manifest.get(device.id))
+                       for device in devices]
+            return [future.result() for future in futures]
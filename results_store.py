@@ -0,0 +1,311 @@
+from typing import Any, Dict, Iterable, List, Optional
+from datetime import datetime
+import tracing
+import platform
+import argparse
+import hashlib
+import subprocess
+import sqlite3
+import socket
+import json
+import csv
+import os
+
+DEFAULT_DB = "benchmark_results.db"
+
+# Applied in order, PRAGMA user_version records how many have run.
+# Append new migrations, never edit one that has shipped.
+MIGRATIONS = [
+    # 1: runs with stage timings in long format, so a new stage needs no schema change
+    """
+    CREATE TABLE runs (
+        id INTEGER PRIMARY KEY,
+        scenario TEXT NOT NULL DEFAULT 'default',
+        commit_hash TEXT,
+        started_at TEXT NOT NULL,
+        success INTEGER NOT NULL,
+        error TEXT,
+        warmup INTEGER NOT NULL DEFAULT 0,
+        iteration INTEGER,
+        trace_file TEXT,
+        -- Where an imported run came from, so importing twice adds nothing
+        source TEXT,
+        source_key TEXT
+    );
+    CREATE TABLE stage_timings (
+        run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+        stage TEXT NOT NULL,
+        duration REAL NOT NULL,
+        PRIMARY KEY (run_id, stage)
+    );
+    CREATE INDEX runs_scenario_started ON runs(scenario, started_at);
+    CREATE INDEX runs_started ON runs(started_at);
+    CREATE INDEX runs_commit ON runs(commit_hash);
+    CREATE UNIQUE INDEX runs_source ON runs(source, source_key);
+    CREATE INDEX stage_timings_stage ON stage_timings(stage, duration);
+    """,
+    # 2: spans of the run trace and the environment the run was made in
+    """
+    CREATE TABLE spans (
+        run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+        span_id TEXT NOT NULL,
+        parent_id TEXT,
+        name TEXT NOT NULL,
+        start REAL,
+        duration REAL,
+        status TEXT,
+        error TEXT,
+        attributes TEXT,
+        PRIMARY KEY (run_id, span_id)
+    );
+    CREATE INDEX spans_name ON spans(name);
+    CREATE TABLE environment (
+        run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+        key TEXT NOT NULL,
+        value TEXT,
+        PRIMARY KEY (run_id, key)
+    );
+    """,
+    # 3: GNS3 server resource samples in long format, one row per metric and point in time
+    """
+    CREATE TABLE resource_samples (
+        run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+        at REAL NOT NULL,
+        metric TEXT NOT NULL,
+        value REAL,
+        PRIMARY KEY (run_id, at, metric)
+    );
+    """,
+]
+
+def collect_environment(config_path: Optional[str] = None) -> Dict[str, str]:
+    """Describe the machine and configuration a run is made with."""
+    environment = {
+        'hostname': socket.gethostname(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+    }
+    if config_path and os.path.exists(config_path):
+        with open(config_path, 'rb') as f:
+            environment['config_sha256'] = hashlib.sha256(f.read()).hexdigest()
+        environment['config_path'] = config_path
+    return environment
+
+def current_commit() -> Optional[str]:
+    """Short hash of the checked out commit, with a + if the tree has local changes."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("+" if dirty else "")
+
+class ResultsStore:
+    """SQLite store of benchmark runs, their stage timings, trace spans and environment."""
+
+    def __init__(self, path: str = DEFAULT_DB):
+        """Open the store, creating or migrating the schema as needed."""
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.migrate()
+
+    def migrate(self) -> int:
+        """Apply pending migrations. Returns the schema version."""
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        for index in range(version, len(MIGRATIONS)):
+            # One transaction per migration, a failed one leaves the previous version intact
+            self.connection.executescript(
+                f"BEGIN;\n{MIGRATIONS[index]}\nPRAGMA user_version = {index + 1};\nCOMMIT;")
+        return len(MIGRATIONS)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add_run(self, success: bool, timings: Dict[str, Optional[float]], scenario: str = "default",
+                error: Optional[str] = None, commit: Optional[str] = None, started_at: Optional[str] = None,
+                warmup: bool = False, iteration: Optional[int] = None, trace_file: Optional[str] = None,
+                environment: Optional[Dict[str, str]] = None, source: Optional[str] = None,
+                source_key: Optional[str] = None) -> Optional[int]:
+        """
+        Store a run and return its ID. Timings without a value are left out.
+        Returns None if a run with the same source and source_key is already stored.
+        """
+        started_at = started_at or datetime.now().isoformat(timespec='seconds')
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO runs (scenario, commit_hash, started_at, success, error, warmup, "
+                "iteration, trace_file, source, source_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (scenario, commit, started_at, int(bool(success)), error, int(bool(warmup)),
+                 iteration, trace_file, source, source_key))
+            if cursor.rowcount == 0:
+                return None
+            run_id = cursor.lastrowid
+            self.connection.executemany(
+                "INSERT INTO stage_timings (run_id, stage, duration) VALUES (?, ?, ?)",
+                [(run_id, stage, float(duration)) for stage, duration in timings.items() if duration is not None])
+            if environment:
+                self.connection.executemany(
+                    "INSERT INTO environment (run_id, key, value) VALUES (?, ?, ?)",
+                    [(run_id, key, str(value)) for key, value in environment.items()])
+        if trace_file and os.path.exists(trace_file):
+            self.add_spans(run_id, tracing.read_trace(trace_file))
+        return run_id
+
+    def add_spans(self, run_id: int, spans: Iterable[Dict[str, Any]]) -> None:
+        """Store the spans of a run's trace. Resource samples go to resource_samples instead."""
+        rows, samples = [], []
+        for span in spans:
+            attributes = span.get('attributes') or {}
+            if attributes.get('kind') == "resource":
+                samples.extend((run_id, span.get('start'), metric, value) for metric, value in attributes.items()
+                               if metric != 'kind' and isinstance(value, (int, float)))
+                continue
+            rows.append((run_id, span['span_id'], span.get('parent_id'), span['name'], span.get('start'),
+                         span.get('duration'), span.get('status'), span.get('error'), json.dumps(attributes)))
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO spans (run_id, span_id, parent_id, name, start, duration, status, error, "
+                "attributes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO resource_samples (run_id, at, metric, value) VALUES (?, ?, ?, ?)", samples)
+
+    def next_run_number(self) -> int:
+        return (self.connection.execute("SELECT MAX(id) FROM runs").fetchone()[0] or 0) + 1
+
+    def runs(self, scenario: Optional[str] = None, commit: Optional[str] = None, since: Optional[str] = None,
+             until: Optional[str] = None, include_warmup: bool = False) -> List[Dict[str, Any]]:
+        """
+        Runs matching the filters, oldest first, each with its timings as {'stage': seconds}.
+        since and until are ISO dates or timestamps.
+        """
+        conditions, parameters = [], []
+        if scenario is not None:
+            conditions.append("scenario = ?")
+            parameters.append(scenario)
+        if commit is not None:
+            # Short and full hashes, with or without the local changes marker
+            conditions.append("commit_hash LIKE ?")
+            parameters.append(f"{commit}%")
+        if since is not None:
+            conditions.append("started_at >= ?")
+            parameters.append(since)
+        if until is not None:
+            conditions.append("started_at < ?")
+            parameters.append(until)
+        if not include_warmup:
+            conditions.append("warmup = 0")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        rows = self.connection.execute(f"SELECT * FROM runs {where} ORDER BY started_at, id", parameters).fetchall()
+        runs = {row['id']: {
+            'id': row['id'],
+            'scenario': row['scenario'],
+            'commit': row['commit_hash'],
+            'timestamp': row['started_at'],
+            'success': bool(row['success']),
+            'error': row['error'],
+            'warmup': bool(row['warmup']),
+            'iteration': row['iteration'],
+            'trace_file': row['trace_file'],
+            'timings': {},
+        } for row in rows}
+        if runs:
+            timings = self.connection.execute(
+                f"SELECT run_id, stage, duration FROM stage_timings WHERE run_id IN "
+                f"(SELECT id FROM runs {where})", parameters)
+            for run_id, stage, duration in timings:
+                runs[run_id]['timings'][stage] = duration
+        return list(runs.values())
+
+    def wide_rows(self, **filters: Any) -> List[Dict[str, Any]]:
+        """Runs as flat rows with one column per stage, i.e for pandas.DataFrame."""
+        rows = []
+        for run in self.runs(**filters):
+            row = {key: value for key, value in run.items() if key != 'timings'}
+            row.update(run['timings'])
+            rows.append(row)
+        return rows
+
+    def spans(self, run_id: int) -> List[Dict[str, Any]]:
+        """The trace spans of a run."""
+        rows = self.connection.execute("SELECT * FROM spans WHERE run_id = ? ORDER BY start", (run_id,))
+        return [dict(row, attributes=json.loads(row['attributes'] or "{}")) for row in rows]
+
+    def resource_samples(self, run_id: int) -> List[Dict[str, float]]:
+        """The GNS3 server resource samples of a run, oldest first, each as {'at': time, 'metric': value}."""
+        samples: Dict[float, Dict[str, float]] = {}
+        rows = self.connection.execute(
+            "SELECT at, metric, value FROM resource_samples WHERE run_id = ? ORDER BY at", (run_id,))
+        for at, metric, value in rows:
+            samples.setdefault(at, {'at': at})[metric] = value
+        return list(samples.values())
+
+    def environment(self, run_id: int) -> Dict[str, str]:
+        rows = self.connection.execute("SELECT key, value FROM environment WHERE run_id = ?", (run_id,))
+        return {key: value for key, value in rows}
+
+    def import_csv(self, csv_path: str, scenario: str = "default") -> int:
+        """
+        Import a benchmark_results.csv written by the old run_benchmark.
+        Every column besides the metadata is a stage. Returns the number of runs added.
+        """
+        added = 0
+        source = f"csv:{os.path.basename(csv_path)}"
+        with open(csv_path, 'r', newline='') as f:
+            for row in csv.DictReader(f):
+                timings = {}
+                for column, value in row.items():
+                    if column in ('run_number', 'timestamp', 'success', 'error') or value in (None, ''):
+                        continue
+                    try:
+                        timings[column] = float(value)
+                    except ValueError:
+                        continue
+                started_at = row.get('timestamp') or ""
+                # "2025-05-05 18:52:45" sorts together with the ISO timestamps of new runs
+                started_at = started_at.replace(' ', 'T')
+                run_id = self.add_run(success=row.get('success') == 'True', timings=timings, scenario=scenario,
+                                      error=row.get('error') or None, started_at=started_at,
+                                      source=source, source_key=row.get('run_number') or started_at)
+                if run_id is not None:
+                    added += 1
+        return added
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark results store')
+    parser.add_argument('-d', '--db', type=str, default=DEFAULT_DB,
+                        help=f'Results database (default: {DEFAULT_DB})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import-csv', help='Import a CSV written by the old run_benchmark')
+    import_parser.add_argument('csv', type=str, help='i.e benchmark_results.csv')
+    import_parser.add_argument('-s', '--scenario', type=str, default="default",
+                               help='Scenario to file the runs under (default: default)')
+
+    list_parser = subparsers.add_parser('list', help='List stored runs')
+    list_parser.add_argument('-s', '--scenario', type=str, default=None)
+    list_parser.add_argument('-c', '--commit', type=str, default=None)
+    list_parser.add_argument('--since', type=str, default=None, help='ISO date, i.e 2025-05-01')
+
+    args = parser.parse_args()
+    with ResultsStore(args.db) as store:
+        if args.command == 'import-csv':
+            added = store.import_csv(args.csv, args.scenario)
+            print(f"Imported {added} runs from {args.csv} into {args.db}")
+        else:
+            for run in store.runs(scenario=args.scenario, commit=args.commit, since=args.since):
+                status = "ok" if run['success'] else f"failed ({run['error']})"
+                total = run['timings'].get('round_trip_time')
+                total = f"{total:.1f}s" if total is not None else "-"
+                print(f"{run['id']:>5}  {run['timestamp']}  {run['scenario']:<24} {run['commit'] or '-':<10} "
+                      f"{total:>8}  {status}")
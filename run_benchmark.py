@@ -1,9 +1,26 @@
 import subprocess
+import threading
 import re
-import csv
 import os
 import time
 from datetime import datetime
+from results_store import ResultsStore, DEFAULT_DB, collect_environment, current_commit
+from main import NetworkDigitalTwin, setup_logging
+from profiling import PROFILE_DIR_ENV
+import tracing
+
+# One span trace per run, written by main.py through NDT_TRACE_FILE
+TRACE_DIR = "benchmark_traces"
+
+# Profiles of the profiled stages, one folder per run
+PROFILE_DIR = "benchmark_profiles"
+
+# Seconds a cancelled in-process run gets to stop before its twin is given up
+STOP_TIMEOUT = 60
+
+class AbandonedRunError(Exception):
+    """A timed out in-process run did not stop, so its twin cannot be used again."""
+    pass
 
 def extract_timing_data(output_text):
     """Extract timing information from the script output."""
@@ -21,225 +38,340 @@ def extract_timing_data(output_text):
     
     return timing_results
 
-def run_benchmark(output_file="benchmark_results.csv"):
-    """Run the main.py script indefinitely and collect timing data."""
+def extract_trace_timings(trace_file):
+    """
+    Extract stage durations and derived metrics from the span trace of a run.
+    Unlike the log lines, stages that failed keep their duration.
+    Returns the timings and a list of the stages that failed.
+    """
+    timing_results = {}
+    failed_stages = []
+    if not os.path.exists(trace_file):
+        return timing_results, failed_stages
+
+    for span in tracing.read_trace(trace_file):
+        kind = span['attributes'].get('kind')
+        if kind == 'stage':
+            timing_results[span['name']] = span['duration']
+            if span['status'] != tracing.OK:
+                failed_stages.append(f"{span['name']} ({span['error']})")
+        elif kind == 'metric':
+            timing_results[span['name']] = span['attributes']['value']
+
+    return timing_results, failed_stages
+
+# Measurements a complete run reports, a run missing any of them is unsuccessful
+MEASUREMENT_FIELDS = [
+    'scanning_physical_network',
+    'creating_folder_and_unzipping',
+    'parsing_xml_and_validating',
+    'checking_existing_project',
+    'building_topology',
+    'creating_links',
+    'connecting_to_server',
+    'transferring_files',
+    'starting_devices',
+    'setting_configuration',
+    'physical_to_ndt_delay',
+    'scanning_virtual_network',
+    'backup_ndt',
+    'transferring_backup_file',
+    'extracting_backup_file',
+    'parsing_ndt_xml',
+    'matching_devices',
+    'applying_config',
+    'ndt_to_physical_delay',
+    'round_trip_time'
+]
+
+# Keys of the timing data that are not measurements
+METADATA_FIELDS = ['run_number', 'timestamp', 'success', 'error']
+
+def new_trace_file(run_count, trace_dir=TRACE_DIR):
+    """Path of the trace of a run, a leftover from an earlier benchmark is removed."""
+    os.makedirs(trace_dir, exist_ok=True)
+    trace_file = os.path.join(trace_dir, f"run_{run_count}.jsonl")
+    if os.path.exists(trace_file):
+        os.remove(trace_file)
+    return trace_file
+
+def evaluate_run(timing_data, run_count, timed_out, timeout, failed_stages):
+    """
+    Decide whether a run succeeded and record success and error in its timing data.
+    A run succeeds if it finished in time, no stage failed and every measurement has a value.
+    """
+    # Check for success (all measurement fields must have values)
+    missing_fields = []
+    for field in MEASUREMENT_FIELDS:
+        if field not in timing_data or timing_data[field] is None:
+            missing_fields.append(field)
     
-    # Configuration variables
-    TIMEOUT = 600  # 10 minutes static timeout
-    SUCCESS_DELAY = 60  # Wait 60 seconds after successful run
-    FAILURE_DELAY = 5   # Wait 5 seconds after failed run
+    run_successful = False
     
-    print(f"Starting benchmark - running indefinitely until manually stopped")
-    print(f"Results will be saved to {output_file}")
-    print(f"Configuration: Timeout={TIMEOUT}s, Success delay={SUCCESS_DELAY}s, Failure delay={FAILURE_DELAY}s")
-    
-    # Define a fixed order for the CSV columns
-    fixed_fieldnames = [
-        'run_number', 
-        'timestamp', 
-        'success', 
-        'error',
-        'scanning_physical_network',
-        'creating_folder_and_unzipping',
-        'parsing_xml_and_validating',
-        'checking_existing_project',
-        'building_topology',
-        'creating_links',
-        'connecting_to_server',
-        'transferring_files',
-        'starting_devices',
-        'setting_configuration',
-        'physical_to_ndt_delay',
-        'scanning_virtual_network',
-        'backup_ndt',
-        'transferring_backup_file',
-        'extracting_backup_file',
-        'parsing_ndt_xml',
-        'matching_devices',
-        'applying_config',
-        'ndt_to_physical_delay',
-        'round_trip_time'
-    ]
-    
-    # Initialize run counter
-    run_count = 0
-    
-    # Check if the output file already exists
-    file_exists = os.path.isfile(output_file)
-    
-    # Open the CSV file for writing (or appending if it exists)
-    mode = 'a' if file_exists else 'w'
-    with open(output_file, mode, newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fixed_fieldnames)
+    if timed_out:
+        print(f"Run {run_count} timed out and will be discarded")
+        timing_data['success'] = False
+        timing_data['error'] = f"Exceeded timeout of {timeout} seconds"
+    elif failed_stages:
+        print(f"Run {run_count} failed in {', '.join(failed_stages)}")
+        timing_data['success'] = False
+        timing_data['error'] = f"Failed stages: {', '.join(failed_stages)}"
+    elif not missing_fields:
+        # All fields have values - run was successful
+        timing_data['success'] = True
+        run_successful = True
         
-        # Write header only if creating a new file
-        if not file_exists:
-            writer.writeheader()
-        
-        # If we're appending to an existing file, get the last run number
-        if file_exists:
-            with open(output_file, 'r') as existing_file:
-                reader = csv.reader(existing_file)
-                # Count rows (excluding header)
-                rows = sum(1 for row in reader) - 1
-                run_count = rows
-                print(f"Continuing from previous run - {run_count} runs already recorded")
+        # Print simple success message without the problematic format strings
+        print(f"Run completed successfully with all measurement fields populated")
+    else:
+        # Run was unsuccessful - missing some fields
+        print(f"Run {run_count} did not complete properly (missing {len(missing_fields)} measurement fields)")
+        print(f"Missing fields: {', '.join(missing_fields)}")
+        timing_data['success'] = False
+        timing_data['error'] = f"Missing fields: {', '.join(missing_fields)}"
+    
+    return run_successful
+
+def run_main(run_count, timeout=600, config_path=None, trace_dir=TRACE_DIR, profile_stages=(),
+             profile_mode=None, profile_dir=PROFILE_DIR):
+    """
+    Run main.py once in a new process and collect its timing data. Every run pays for
+    interpreter startup, imports, configuration loading and new connections.
+    Returns the timing data, including success and error, and whether the run succeeded.
+    """
+    # Create a timestamp for this run
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    # Create temporary file for capturing stderr output
+    stderr_file = f"stderr_run_{run_count}.txt"
+    
+    trace_file = new_trace_file(run_count, trace_dir)
+    
+    command = ["python3", "main.py"]
+    if config_path:
+        command += ["--config", config_path]
+    for stage in profile_stages:
+        command += ["--profile", stage]
+    if profile_mode:
+        command += ["--profile-mode", profile_mode]
+    
+    # Record start time
+    start_time = time.time()
+    
+    # Run the main.py process with stderr redirection only
+    with open(stderr_file, 'w') as f_err:
+        print(f"Starting main.py with timeout of {timeout} seconds")
         
-        # Run indefinitely until interrupted
+        # Run the process with a timeout
         try:
-            while True:
-                run_count += 1
-                
-                # Create a timestamp for this run
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                
-                print(f"\nRun {run_count} - {timestamp}")
-                
-                try:
-                    # Create temporary file for capturing stderr output
-                    stderr_file = f"stderr_run_{run_count}.txt"
-                    
-                    # Record start time
-                    start_time = time.time()
-                    
-                    # Run the main.py process with stderr redirection only
-                    with open(stderr_file, 'w') as f_err:
-                        print(f"Starting main.py with timeout of {TIMEOUT} seconds")
-                        
-                        # Run the process with a timeout
-                        try:
-                            process = subprocess.Popen(
-                                ["python3", "main.py"],
-                                stdout=subprocess.DEVNULL,  # Discard stdout
-                                stderr=f_err,
-                                text=True
-                            )
-                            
-                            # Monitor the process with timeout
-                            timed_out = False
-                            while process.poll() is None:
-                                # Check if timeout exceeded
-                                if time.time() - start_time > TIMEOUT:
-                                    print(f"Run exceeded timeout of {TIMEOUT} seconds - terminating")
-                                    process.terminate()
-                                    try:
-                                        process.wait(timeout=5)  # Give it 5 seconds to terminate gracefully
-                                    except subprocess.TimeoutExpired:
-                                        process.kill()  # Force kill if it doesn't terminate
-                                    timed_out = True
-                                    break
-                                
-                                # Sleep to avoid high CPU usage
-                                time.sleep(1)
-                        
-                        except Exception as e:
-                            print(f"Error running process: {e}")
-                            timed_out = True
-                    
-                    # Read the stderr output file
-                    with open(stderr_file, 'r') as f:
-                        stderr_data = f.read()
-                    
-                    # Print a brief summary of the output
-                    #if stderr_data:
-                    #    print(f"STDERR (last 300 chars): {stderr_data[-300:] if len(stderr_data) > 300 else stderr_data}")
-                    
-                    # Extract timing data from stderr only
-                    timing_data = extract_timing_data(stderr_data)
-                    
-                    # Add run metadata
-                    timing_data['run_number'] = run_count
-                    timing_data['timestamp'] = timestamp
-                    
-                    # Check for success (all measurement fields must have values)
-                    # Metadata fields that aren't actual measurements
-                    metadata_fields = ['run_number', 'timestamp', 'success', 'error']
-                    
-                    # Get list of measurement fields (all fields except metadata)
-                    measurement_fields = [field for field in fixed_fieldnames if field not in metadata_fields]
-                    
-                    # Check if all measurement fields have values
-                    missing_fields = []
-                    for field in measurement_fields:
-                        if field not in timing_data or timing_data[field] is None:
-                            missing_fields.append(field)
-                    
-                    run_successful = False
-                    
-                    if timed_out:
-                        print(f"Run {run_count} timed out and will be discarded")
-                        timing_data['success'] = False
-                        timing_data['error'] = f"Exceeded timeout of {TIMEOUT} seconds"
-                    elif not missing_fields:
-                        # All fields have values - run was successful
-                        timing_data['success'] = True
-                        run_successful = True
-                        
-                        # Print simple success message without the problematic format strings
-                        print(f"Run completed successfully with all measurement fields populated")
-                    else:
-                        # Run was unsuccessful - missing some fields
-                        print(f"Run {run_count} did not complete properly (missing {len(missing_fields)} measurement fields)")
-                        print(f"Missing fields: {', '.join(missing_fields)}")
-                        timing_data['success'] = False
-                        timing_data['error'] = f"Missing fields: {', '.join(missing_fields)}"
-                    
-                    # Make sure all fields are present in the data
-                    for field in fixed_fieldnames:
-                        if field not in timing_data:
-                            timing_data[field] = None
-                    
-                    # Write to CSV
-                    writer.writerow(timing_data)
-                    csvfile.flush()  # Ensure data is written to disk
-                    
-                    # Clean up temporary files
+            process = subprocess.Popen(
+                command,
+                stdout=subprocess.DEVNULL,  # Discard stdout
+                stderr=f_err,
+                text=True,
+                env=dict(os.environ, **{tracing.TRACE_FILE_ENV: trace_file,
+                                        PROFILE_DIR_ENV: os.path.join(profile_dir, f"run_{run_count}")})
+            )
+            
+            # Monitor the process with timeout
+            timed_out = False
+            while process.poll() is None:
+                # Check if timeout exceeded
+                if time.time() - start_time > timeout:
+                    print(f"Run exceeded timeout of {timeout} seconds - terminating")
+                    process.terminate()
                     try:
-                        os.remove(stderr_file)
-                    except:
-                        pass  # Ignore errors in cleanup
-                    
-                except Exception as e:
-                    print(f"Error during run {run_count}: {e}")
-                    writer.writerow({
-                        'run_number': run_count,
-                        'timestamp': timestamp,
-                        'success': False,
-                        'error': str(e)
-                    })
-                    csvfile.flush()  # Ensure data is written to disk
+                        process.wait(timeout=5)  # Give it 5 seconds to terminate gracefully
+                    except subprocess.TimeoutExpired:
+                        process.kill()  # Force kill if it doesn't terminate
+                    timed_out = True
+                    break
                 
-                # Wait between runs based on success/failure
-                if run_successful:
-                    print(f"Waiting {SUCCESS_DELAY} seconds before next run (successful run)...")
-                    time.sleep(SUCCESS_DELAY)
-                else:
-                    print(f"Waiting {FAILURE_DELAY} seconds before next run (failed run)...")
-                    time.sleep(FAILURE_DELAY)
+                # Sleep to avoid high CPU usage
+                time.sleep(1)
         
-        except KeyboardInterrupt:
-            print("\nBenchmark stopped by user")
+        except Exception as e:
+            print(f"Error running process: {e}")
+            timed_out = True
+    
+    # Read the stderr output file
+    with open(stderr_file, 'r') as f:
+        stderr_data = f.read()
+    
+    # Print a brief summary of the output
+    #if stderr_data:
+    #    print(f"STDERR (last 300 chars): {stderr_data[-300:] if len(stderr_data) > 300 else stderr_data}")
+    
+    # Extract timing data from stderr, the trace adds stages that failed
+    timing_data = extract_timing_data(stderr_data)
+    trace_timings, failed_stages = extract_trace_timings(trace_file)
+    timing_data.update(trace_timings)
+    
+    # Add run metadata
+    timing_data['run_number'] = run_count
+    timing_data['timestamp'] = timestamp
+    
+    run_successful = evaluate_run(timing_data, run_count, timed_out, timeout, failed_stages)
     
-    print(f"\nBenchmark complete. Results saved to {output_file}")
+    # Clean up temporary files
+    try:
+        os.remove(stderr_file)
+    except:
+        pass  # Ignore errors in cleanup
+    
+    return timing_data, run_successful
+
+def run_in_process(twin, run_count, timeout=600, trace_dir=TRACE_DIR, profile_dir=PROFILE_DIR,
+                   stop_timeout=STOP_TIMEOUT):
+    """
+    Run the pipeline of an already created NetworkDigitalTwin once and collect its timing data.
+    The twin's clients and connections are kept from earlier runs. Same return value as run_main.
+    A run that times out is cancelled and waited for. Raises AbandonedRunError if it has not
+    stopped after stop_timeout seconds, as it would still be cleaning up the files, using the
+    connections and writing spans of the next run.
+    """
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    trace_file = new_trace_file(run_count, trace_dir)
+    tracing.configure(trace_file)
+    
+    print(f"Starting in-process run with timeout of {timeout} seconds")
+    outcome = {}
+    def run():
+        try:
+            outcome['result'] = twin.run(os.path.join(profile_dir, f"run_{run_count}"))
+        except Exception as e:
+            outcome['exception'] = e
+    worker = threading.Thread(target=run, name=f"run_{run_count}", daemon=True)
+    worker.start()
+    worker.join(timeout)
+    
+    timed_out = worker.is_alive()
+    if timed_out:
+        print(f"Run exceeded timeout of {timeout} seconds - cancelling")
+        # Threads cannot be killed. Closing the connections makes blocked stages fail fast,
+        # the next run reconnects.
+        twin.cancel()
+        twin.disconnect()
+        worker.join(stop_timeout)
+        if worker.is_alive():
+            tracing.get_tracer().close()
+            raise AbandonedRunError(f"Run {run_count} did not stop within {stop_timeout}s of being cancelled")
+    tracing.get_tracer().close()
+    
+    timing_data = {}
+    result = outcome.get('result')
+    if result is not None:
+        timing_data.update(result.timings)
+    # The trace adds stages that failed
+    trace_timings, failed_stages = extract_trace_timings(trace_file)
+    timing_data.update(trace_timings)
+    if 'exception' in outcome:
+        failed_stages.append(f"run ({outcome['exception']})")
+    
+    timing_data['run_number'] = run_count
+    timing_data['timestamp'] = timestamp
+    run_successful = evaluate_run(timing_data, run_count, timed_out, timeout, failed_stages)
+    return timing_data, run_successful
+
+def run_benchmark(db_path=DEFAULT_DB, timeout=600, success_delay=60, failure_delay=5,
+                  scenario="default", config_path=None, cold=False, profile_stages=(), profile_mode=None):
+    """
+    Run main.py indefinitely and store the timing data of every run.
+    Runs are made in this process with one NetworkDigitalTwin, so clients and connections
+    are reused. With cold set every run starts a new main.py process instead.
+    profile_stages are profiled in every run, see profiling.StageProfiler.
+    """
+    
+    print(f"Starting benchmark - running indefinitely until manually stopped")
+    print(f"Results will be saved to {db_path}")
+    print(f"Configuration: Timeout={timeout}s, Success delay={success_delay}s, Failure delay={failure_delay}s, "
+          f"Mode={'cold' if cold else 'warm'}")
+    
+    store = ResultsStore(db_path)
+    commit = current_commit()
+    environment = collect_environment(config_path or "config.yaml")
+    environment['mode'] = "cold" if cold else "warm"
+    twin = None
+    if not cold:
+        setup_logging()
+        twin = NetworkDigitalTwin(config_path or "config.yaml")
+        twin.profiler.stages.update(profile_stages)
+        if profile_mode:
+            twin.profiler.mode = profile_mode
+    
+    # Run indefinitely until interrupted
+    try:
+        while True:
+            run_count = store.next_run_number()
+            run_successful = False
+            started_at = datetime.now().isoformat(timespec='seconds')
+            
+            print(f"\nRun {run_count} - {started_at}")
+            
+            try:
+                if cold:
+                    timing_data, run_successful = run_main(run_count, timeout, config_path,
+                                                           profile_stages=profile_stages, profile_mode=profile_mode)
+                else:
+                    timing_data, run_successful = run_in_process(twin, run_count, timeout)
+                timings = {name: value for name, value in timing_data.items() if name not in METADATA_FIELDS}
+                store.add_run(run_successful, timings, scenario=scenario, error=timing_data.get('error'),
+                              commit=commit, started_at=started_at, environment=environment,
+                              trace_file=os.path.join(TRACE_DIR, f"run_{run_count}.jsonl"))
+                
+            except AbandonedRunError as e:
+                print(f"{e}. Stopping the warm session, restart it or use --cold")
+                store.add_run(False, {}, scenario=scenario, error=str(e), commit=commit,
+                              started_at=started_at, environment=environment)
+                break
+            except Exception as e:
+                print(f"Error during run {run_count}: {e}")
+                store.add_run(False, {}, scenario=scenario, error=str(e), commit=commit,
+                              started_at=started_at, environment=environment)
+            
+            # Wait between runs based on success/failure
+            if run_successful:
+                print(f"Waiting {success_delay} seconds before next run (successful run)...")
+                time.sleep(success_delay)
+            else:
+                print(f"Waiting {failure_delay} seconds before next run (failed run)...")
+                time.sleep(failure_delay)
+    
+    except KeyboardInterrupt:
+        print("\nBenchmark stopped by user")
+    finally:
+        if twin is not None:
+            # An abandoned run still holds the twin, its connections are already closed
+            twin.close()
+        store.close()
+    
+    print(f"\nBenchmark complete. Results saved to {db_path}")
 
 if __name__ == "__main__":
     import argparse
     
     parser = argparse.ArgumentParser(description='Run main.py benchmark indefinitely')
-    parser.add_argument('-o', '--output', type=str, default="benchmark_results.csv",
-                        help='Output CSV file (default: benchmark_results.csv)')
+    parser.add_argument('-d', '--db', type=str, default=DEFAULT_DB,
+                        help=f'Results database (default: {DEFAULT_DB})')
+    parser.add_argument('-n', '--scenario', type=str, default="default",
+                        help='Scenario the runs are stored under (default: default)')
+    parser.add_argument('-c', '--config', type=str, default=None,
+                        help='Configuration file passed to main.py (default: config.yaml)')
     parser.add_argument('-s', '--success-delay', type=int, default=60,
                         help='Seconds to wait after successful run (default: 60)')
     parser.add_argument('-f', '--failure-delay', type=int, default=5,
                         help='Seconds to wait after failed run (default: 5)')
     parser.add_argument('-t', '--timeout', type=int, default=600,
                         help='Timeout in seconds for each run (default: 600)')
+    parser.add_argument('--cold', action='store_true',
+                        help='Start a new main.py process for every run, measuring startup and connection setup')
+    parser.add_argument('--profile', action='append', default=[], metavar='STAGE',
+                        help=f'Profile this stage in every run, can be repeated. Written to {PROFILE_DIR}/run_<n>')
+    parser.add_argument('--profile-mode', choices=['sampling', 'deterministic'], default=None,
+                        help='Profiler to use (default: profiling.mode in the configuration)')
     
     args = parser.parse_args()
     
-    # Update the global delay variables if provided via command line
-    SUCCESS_DELAY = args.success_delay
-    FAILURE_DELAY = args.failure_delay
-    TIMEOUT = args.timeout
-    
-    run_benchmark(output_file=args.output)
\ No newline at end of file
+    run_benchmark(db_path=args.db, timeout=args.timeout, success_delay=args.success_delay,
+                  failure_delay=args.failure_delay, scenario=args.scenario, config_path=args.config,
+                  cold=args.cold, profile_stages=args.profile, profile_mode=args.profile_mode)
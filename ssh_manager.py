@@ -0,0 +1,200 @@
+from dataclasses import dataclass
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from scp import SCPClient
+import paramiko
+import threading
+import select
+import socket
+import tracing
+import logging
+import time
+import yaml
+
+class SSHError(Exception):
+    """Custom exception for SSH connection errors."""
+    pass
+
+@dataclass
+class CommandResult:
+    host: str
+    command: str
+    exit_status: int
+    stdout: str
+    stderr: str
+    duration: float
+
+class SSHConnectionManager:
+    """
+    Keeps one authenticated SSH transport per host and hands out channels on it.
+    Every command runs on its own channel, so concurrent users share a single
+    TCP connection and key exchange. Dropped transports are reconnected on demand.
+    """
+
+    def __init__(self, config_path: str = "config.yaml"):
+        """Initialize the connection manager with configuration."""
+        self.config = self._load_config(config_path)
+        ssh_config = self.config.get('ssh', {})
+        self.host = ssh_config.get('host', self.config['gns3_server']['host'])
+        self.username = ssh_config.get('username')
+        self.port = ssh_config.get('port', 22)
+        self.logger = logging.getLogger(__name__)
+
+        self._clients: Dict[str, paramiko.SSHClient] = {}
+        self._lock = threading.Lock()
+        self.command_timings: List[CommandResult] = []
+
+    def _load_config(self, config_path: str) -> Dict[str, Any]:
+        """Load configuration from a YAML file."""
+        try:
+            with open(config_path, 'r') as file:
+                return yaml.safe_load(file)
+        except Exception as e:
+            raise SSHError(f"Failed to load configuration: {str(e)}")
+
+    def _connect(self, host: str) -> paramiko.SSHClient:
+        """Open and authenticate a new connection to host."""
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.load_system_host_keys()
+
+        self.logger.debug(f"Connecting to {self.username}@{host}:{self.port}")
+        try:
+            client.connect(hostname=host, port=self.port, username=self.username)
+        except Exception as e:
+            client.close()
+            raise SSHError(f"Failed to connect to {host}: {str(e)}")
+
+        # Keep idle connections alive between pipeline stages
+        client.get_transport().set_keepalive(30)
+        self.logger.info(f"Connected to SSH server {host}")
+        return client
+
+    def get_transport(self, host: Optional[str] = None) -> paramiko.Transport:
+        """Return the shared transport for host, reconnecting if it has dropped."""
+        host = host or self.host
+        with self._lock:
+            client = self._clients.get(host)
+            transport = client.get_transport() if client else None
+            if transport is None or not transport.is_active():
+                if client:
+                    self.logger.warning(f"SSH connection to {host} lost, reconnecting")
+                    client.close()
+                client = self._connect(host)
+                self._clients[host] = client
+                transport = client.get_transport()
+            return transport
+
+    def connect(self, host: Optional[str] = None) -> None:
+        """Establish the connection to host ahead of first use."""
+        self.get_transport(host)
+
+    def open_channel(self, host: Optional[str] = None) -> paramiko.Channel:
+        """Open a new session channel on the shared transport."""
+        try:
+            return self.get_transport(host).open_session()
+        except paramiko.SSHException:
+            # The transport can die between the liveness check and open_session
+            with self._lock:
+                client = self._clients.pop(host or self.host, None)
+                if client:
+                    client.close()
+        try:
+            return self.get_transport(host).open_session()
+        except paramiko.SSHException as e:
+            # i.e ChannelException once MaxSessions channels are open
+            raise SSHError(f"Failed to open a channel to {host or self.host}: {str(e) or type(e).__name__}")
+
+    @staticmethod
+    def mask(command: str, secret_args: Iterable[int] = ()) -> str:
+        """
+        The command with the arguments at the positions in secret_args replaced, for logging.
+        Position 0 is the program. Only those positions are masked, as a password such as "admin"
+        is often also the username or part of a path.
+        """
+        secret_args = set(secret_args)
+        if not secret_args:
+            return command
+        return " ".join("***" if index in secret_args else arg for index, arg in enumerate(command.split(" ")))
+
+    def _read_output(self, channel: paramiko.Channel, timeout: Optional[float]) -> Tuple[bytes, bytes]:
+        """
+        Read stdout and stderr of a command until both are closed. They are drained together,
+        since a command blocks once the window of the stream nobody reads is full.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        stdout: List[bytes] = []
+        stderr: List[bytes] = []
+        while True:
+            if channel.recv_ready():
+                stdout.append(channel.recv(65536))
+            elif channel.recv_stderr_ready():
+                stderr.append(channel.recv_stderr(65536))
+            elif channel.eof_received or channel.closed:
+                # Both streams end with the EOF, anything sent before it has been read above
+                return b"".join(stdout), b"".join(stderr)
+            elif deadline is not None and time.monotonic() >= deadline:
+                raise socket.timeout(f"No end of output within {timeout}s")
+            else:
+                # The channel's pipe becomes readable on data on either stream and on EOF
+                wait = 0.1 if deadline is None else max(0.0, min(0.1, deadline - time.monotonic()))
+                select.select([channel], [], [], wait)
+
+    def exec_command(self, command: str, host: Optional[str] = None, timeout: Optional[float] = None,
+                     input: Optional[bytes] = None, secret_args: Iterable[int] = ()) -> CommandResult:
+        """
+        Run a command on its own channel and wait for it to finish. input is streamed to its stdin.
+        The arguments at the positions in secret_args are masked wherever the command is logged or kept.
+        """
+        host = host or self.host
+        start_time = time.perf_counter()
+
+        # Only the program is recorded, arguments may hold device passwords
+        with tracing.span("ssh_command", host=host, program=command.split(' ', 1)[0]) as command_span:
+            channel = self.open_channel(host)
+            try:
+                channel.settimeout(timeout)
+                channel.exec_command(command)
+                if input is not None:
+                    channel.sendall(input)
+                    channel.shutdown_write()
+                stdout_bytes, stderr_bytes = self._read_output(channel, timeout)
+                stdout = stdout_bytes.decode('utf-8', errors='ignore')
+                stderr = stderr_bytes.decode('utf-8', errors='ignore')
+                exit_status = channel.recv_exit_status()
+            except paramiko.SSHException as e:
+                raise SSHError(f"Command {command.split(' ', 1)[0]} failed on {host}: {str(e) or type(e).__name__}")
+            finally:
+                channel.close()
+            command_span.set_attribute("exit_status", exit_status)
+
+        result = CommandResult(host, self.mask(command, secret_args), exit_status, stdout, stderr,
+                               time.perf_counter() - start_time)
+        with self._lock:
+            self.command_timings.append(result)
+        self.logger.debug(f"Command '{result.command}' on {host} finished with status {exit_status} in {result.duration:.4f}s")
+        return result
+
+    def open_shell(self, host: Optional[str] = None) -> paramiko.Channel:
+        """Open an interactive shell channel on the shared transport."""
+        channel = self.open_channel(host)
+        channel.get_pty()
+        channel.invoke_shell()
+        return channel
+
+    def scp(self, host: Optional[str] = None) -> SCPClient:
+        """Return an SCP client running over the shared transport."""
+        return SCPClient(self.get_transport(host))
+
+    def close(self) -> None:
+        """Close all connections."""
+        with self._lock:
+            for host, client in self._clients.items():
+                client.close()
+                self.logger.debug(f"Closed SSH connection to {host}")
+            self._clients.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
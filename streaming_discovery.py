@@ -0,0 +1,107 @@
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+from weconfig import WECONFIG
+from xmlTranslate import xml_info
+import subprocess
+import threading
+import logging
+import zipfile
+import time
+import io
+import os
+
+# Fields a device needs before a GNS3 node can be created for it
+REQUIRED_FIELDS = ("name", "family", "model", "base_mac")
+
+class StreamingDiscovery:
+    """
+    Runs WeConfig discover and reports devices while it is still running.
+    The partially written project is re-read whenever WeConfig prints progress or
+    poll_interval has passed, and every device that is complete enough to build a node
+    for is reported once. A device that only shows up in the final project is reported
+    when discovery ends, so the result is never less than that of run_scan.
+    """
+
+    def __init__(self, project_path: str, adapter: str, poll_interval: float = 0.5):
+        """Initialize the discovery. Nothing runs until devices() is iterated."""
+        self.project_path = project_path
+        self.adapter = adapter
+        self.poll_interval = poll_interval
+        self.process: Optional[subprocess.Popen] = None
+        self.logger = logging.getLogger(__name__)
+
+        self._progress = threading.Event()
+        self._reported: Set[str] = set()
+        self._last_read: Optional[Tuple[float, int]] = None
+
+    def start(self) -> None:
+        """Start WeConfig discover and the thread following its output."""
+        # A project left over from an earlier run would be reported as discovered
+        if os.path.exists(self.project_path):
+            os.remove(self.project_path)
+        self.process = subprocess.Popen([WECONFIG, "discover", "--adapterNameOrId", self.adapter,
+                                         "--useMdns", "--useIpConfig", "-p", self.project_path],
+                                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        text=True, errors='replace')
+        threading.Thread(target=self._follow_output, daemon=True).start()
+
+    def _follow_output(self) -> None:
+        for line in self.process.stdout:
+            self.logger.debug(f"WeConfig: {line.rstrip()}")
+            self._progress.set()
+        self._progress.set()
+
+    def _read_project(self) -> Dict[str, Dict[str, Any]]:
+        """Parse the devices of the project as far as it has been written. Returns {} if it cannot be read yet."""
+        try:
+            stat = os.stat(self.project_path)
+            if self._last_read == (stat.st_mtime, stat.st_size):
+                return {}
+            # Read in one go, WeConfig may rewrite the file while it is parsed
+            with open(self.project_path, 'rb') as f:
+                data = f.read()
+            with zipfile.ZipFile(io.BytesIO(data), 'r') as zip_ref:
+                with zip_ref.open("Project.xml") as project_xml:
+                    xml = xml_info(project_xml)
+                    xml.findDevices()
+        except Exception as e:
+            # Not written yet, locked by WeConfig or cut off in the middle
+            self.logger.debug(f"Project not readable yet: {str(e)}")
+            return {}
+        self._last_read = (stat.st_mtime, stat.st_size)
+        return xml.device_list
+
+    def _new_devices(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for device_id, device_data in self._read_project().items():
+            if device_id in self._reported:
+                continue
+            if not all(device_data.get(name) for name in REQUIRED_FIELDS):
+                continue
+            self._reported.add(device_id)
+            self.logger.info(f"Discovered {device_data['name']} ({device_data['base_mac']})")
+            yield device_id, device_data
+
+    def devices(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Yield (device ID, xml_info device entry) for every device as it is discovered.
+        Returns once WeConfig has exited and the final project has been read.
+        """
+        if self.process is None:
+            self.start()
+        start_time = time.perf_counter()
+
+        while self.process.poll() is None:
+            self._progress.wait(self.poll_interval)
+            self._progress.clear()
+            yield from self._new_devices()
+
+        # The final project is complete even if nothing changed since the last read
+        self._last_read = None
+        yield from self._new_devices()
+        self.logger.info(f"Discovery finished with {len(self._reported)} devices after "
+                         f"{time.perf_counter() - start_time:.4f}s (exit {self.process.returncode})")
+
+    def run(self) -> int:
+        """Run the discovery to the end without reporting devices. Returns WeConfig's exit status."""
+        for _ in self.devices():
+            pass
+        return self.process.returncode
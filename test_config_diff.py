@@ -0,0 +1,37 @@
+from config_diff import ConfigDiffer, normalize_config, DEFAULT_VOLATILE_PATHS
+import json
+
+def write_backup(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_text(json.dumps(data), encoding='utf-8')
+    return str(path)
+
+def backup(ntp_server="10.0.0.1", created="2025-05-05 18:52:45"):
+    return {
+        "created": created,
+        "config": {
+            "hostname": "RedFox-1",
+            "time": {"ntp": {"server": ntp_server}, "date": "auto"},
+        },
+    }
+
+def test_metadata_header_is_ignored(tmp_path):
+    physical = write_backup(tmp_path, "physical.json", backup(created="2025-05-05 18:52:45"))
+    ndt = write_backup(tmp_path, "ndt.json", backup(created="2025-06-01 09:00:00"))
+    assert not ConfigDiffer().compare(ndt, physical).changed
+
+def test_change_under_nested_time_key_is_detected(tmp_path):
+    physical = write_backup(tmp_path, "physical.json", backup(ntp_server="10.0.0.1"))
+    ndt = write_backup(tmp_path, "ndt.json", backup(ntp_server="10.0.0.2"))
+    diff = ConfigDiffer().compare(ndt, physical)
+    assert diff.changed
+    assert diff.differences == ['config.time.ntp.server: "10.0.0.1" -> "10.0.0.2"']
+
+def test_nested_keys_named_like_volatile_paths_are_kept():
+    normalized = normalize_config(backup(), DEFAULT_VOLATILE_PATHS)
+    assert "created" not in normalized
+    assert normalized["config"]["time"]["date"] == "auto"
+
+def test_volatile_paths_match_full_path():
+    data = {"header": {"created": 1, "version": 2}, "created": 3}
+    assert normalize_config(data, ["header.created"]) == {"header": {"version": 2}, "created": 3}
@@ -0,0 +1,25 @@
+import json
+import pytest
+
+# confirmation.py needs the SSH dependencies
+for module in ("paramiko", "scp"):
+    pytest.importorskip(module)
+from confirmation import config_hostname
+
+def write_backup(tmp_path, data):
+    path = tmp_path / "backup.json"
+    path.write_text(json.dumps(data), encoding='utf-8')
+    return str(path)
+
+def test_system_hostname_is_read_from_its_path(tmp_path):
+    backup = write_backup(tmp_path, {
+        "ietf-syslog:syslog": {"actions": {"remote": {"destination": [{"udp": {"hostname": "log-server"}}]}}},
+        "ietf-system:system": {"hostname": "RedFox-1", "ntp": {"server": [{"hostname": "ntp-server"}]}},
+    })
+    assert config_hostname(backup) == "RedFox-1"
+
+def test_hostname_of_other_sections_is_ignored(tmp_path):
+    backup = write_backup(tmp_path, {
+        "ietf-system:system": {"radius": {"server": [{"hostname": "radius-server"}]}},
+    })
+    assert config_hostname(backup) is None
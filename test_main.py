@@ -0,0 +1,53 @@
+from unittest.mock import MagicMock
+from pipeline import StageResult, OK
+import pytest
+
+# main.py needs the full runtime dependencies
+for module in ("paramiko", "scp", "requests", "randomname"):
+    pytest.importorskip(module)
+import main
+
+class StubPipeline:
+    """Stage results of a finished run, in place of running the stages."""
+
+    def __init__(self, results):
+        self.results = results
+        self.start_time = 0.0
+
+    def run(self):
+        pass
+
+    def timings(self):
+        return {name: result.duration for name, result in self.results.items()}
+
+    def critical_path_report(self):
+        return "Critical path: stub"
+
+def stage(name, start, end, dependencies=()):
+    return StageResult(name=name, status=OK, start=start, end=end, dependencies=list(dependencies))
+
+def test_run_derives_delays_from_the_stage_results(monkeypatch):
+    monkeypatch.setattr(main, "cleanup_all_files", lambda ssh_manager: None)
+    results = {
+        "scanning_physical_network": stage("scanning_physical_network", 0, 6),
+        "starting_devices": stage("starting_devices", 0, 7),
+        "setting_configuration": stage("setting_configuration", 7, 9,
+                                       ["scanning_physical_network", "starting_devices"]),
+        "scanning_virtual_network": stage("scanning_virtual_network", 9, 10, ["setting_configuration"]),
+        "applying_config": stage("applying_config", 10, 13, ["scanning_virtual_network"]),
+    }
+    twin = main.NetworkDigitalTwin.__new__(main.NetworkDigitalTwin)
+    twin.ssh_manager = MagicMock(command_timings=[])
+    twin.profiler = MagicMock()
+    twin.resource_sampling_config = {}
+    twin.metrics = None
+    twin.build_pipeline = lambda: StubPipeline(results)
+
+    result = twin.run()
+
+    assert result.success
+    # Only the second starting_devices held up setting_configuration
+    assert result.timings["physical_to_ndt_delay"] == 8
+    assert result.timings["ndt_to_physical_delay"] == 4
+    assert result.timings["round_trip_time"] == 12
+    assert result.critical_path == "Critical path: stub"
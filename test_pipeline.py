@@ -0,0 +1,41 @@
+from pipeline import StageResult, critical_path, time_on_path, OK
+
+def stage(name, start, end, dependencies=()):
+    return StageResult(name=name, status=OK, start=start, end=end, dependencies=list(dependencies))
+
+def test_critical_path_ends_at_end_stage():
+    results = {
+        "scan": stage("scan", 0, 4),
+        "starting_devices": stage("starting_devices", 0, 3),
+        "setting_configuration": stage("setting_configuration", 4, 6, ["scan", "starting_devices"]),
+        "backup": stage("backup", 6, 10, ["setting_configuration"]),
+    }
+    path = critical_path(results, "setting_configuration")
+    assert [result.name for result in path] == ["scan", "setting_configuration"]
+
+def test_time_on_path_is_full_duration_in_a_serial_run():
+    results = {
+        "scan": stage("scan", 0, 2),
+        "starting_devices": stage("starting_devices", 2, 7, ["scan"]),
+        "setting_configuration": stage("setting_configuration", 7, 9, ["starting_devices"]),
+    }
+    path = critical_path(results, "setting_configuration")
+    assert time_on_path(results, path, "starting_devices", 0) == 5
+
+def test_time_on_path_counts_only_the_delay_beyond_other_dependencies():
+    results = {
+        "scan": stage("scan", 0, 6),
+        "starting_devices": stage("starting_devices", 0, 7),
+        "setting_configuration": stage("setting_configuration", 7, 9, ["scan", "starting_devices"]),
+    }
+    path = critical_path(results, "setting_configuration")
+    assert time_on_path(results, path, "starting_devices", 0) == 1
+
+def test_time_on_path_is_zero_off_the_path():
+    results = {
+        "scan": stage("scan", 0, 8),
+        "starting_devices": stage("starting_devices", 0, 7),
+        "setting_configuration": stage("setting_configuration", 8, 9, ["scan", "starting_devices"]),
+    }
+    path = critical_path(results, "setting_configuration")
+    assert time_on_path(results, path, "starting_devices", 0) == 0
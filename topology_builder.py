@@ -2,6 +2,7 @@ from typing import Dict, Any, List
 from data_model import Device
 from api_interactions import GNS3ApiClient, GNS3ApiError
 import logging
+import tracing
 import yaml
 import random
 
@@ -59,82 +60,89 @@ class TopologyBuilder:
         project = self.api_client.create_project(project_name)
         return project['project_id']
     
-    def build_devices(self, device_list: List[Device], project_id: str) -> Dict[str, str]:
-        """Create nodes in GNS3 based on device list."""
+    @tracing.traced("build_device")
+    def build_device(self, device: Device, project_id: str) -> str:
+        """Create and MAC-configure the GNS3 node of a single device. Returns the node ID."""
+        tracing.set_attribute("device_id", device.id)
+        tracing.set_attribute("device", device.name)
         # Get position scaling factors
         position_scale = self.config['project'].get('position_scale', {})
         scale_x = position_scale.get('x', 1)
         scale_y = position_scale.get('y', 1)
+
+        # Get appropriate template for this device
+        template_id = self._get_template_for_device(device)
         
-        node_mapping = {}  # Map device IDs to GNS3 node IDs
+        # Use device position or default to (0,0)
+        position = device.position if device.position else (random.randint(-100, 100), random.randint(-100, 100)) #TODO add random position generator if no position is given
+        # Scale position using separate factors for x and y
+        position = (int(position[0] * scale_x), int(position[1] * scale_y))
         
-        for device in device_list:
-            try:
-                # Get appropriate template for this device
-                template_id = self._get_template_for_device(device)
-                
-                # Use device position or default to (0,0)
-                position = device.position if device.position else (random.randint(-100, 100), random.randint(-100, 100)) #TODO add random position generator if no position is given
-                # Scale position using separate factors for x and y
-                position = (int(position[0] * scale_x), int(position[1] * scale_y))
-                
-                if device.family == "cloud":
-                    self.logger.info(f"Creating cloud node for device: {device.name}")
-                    node = self.api_client.create_cloud(
-                        project_id=project_id,
-                        name=device.name or f"{device.family}-{device.model}",
-                        template_id=template_id,
-                        position=position
-                    )
+        if device.family == "cloud":
+            self.logger.info(f"Creating cloud node for device: {device.name}")
+            node = self.api_client.create_cloud(
+                project_id=project_id,
+                name=device.name or f"{device.family}-{device.model}",
+                template_id=template_id,
+                position=position
+            )
 
-                    cloud_data_dict = {
-                        "properties": {
-                            "ports_mapping": [
-                                {
-                                    "interface": "ens33",
-                                    "name": "ens33",
-                                    "port_number": 0,
-                                    "type": "ethernet"
-                                },
-                                {
-                                    "name": "virbr0",
-                                    "port_number": 1,
-                                    "type": "ethernet",
-                                    "interface": "virbr0"
-                                }
-                            ]
+            cloud_data_dict = {
+                "properties": {
+                    "ports_mapping": [
+                        {
+                            "interface": "ens33",
+                            "name": "ens33",
+                            "port_number": 0,
+                            "type": "ethernet"
                         },
-                        "node_type": "cloud",
-                        "node_id": node['node_id'],
-                        "compute_id": "local"
-                    }
+                        {
+                            "name": "virbr0",
+                            "port_number": 1,
+                            "type": "ethernet",
+                            "interface": "virbr0"
+                        }
+                    ]
+                },
+                "node_type": "cloud",
+                "node_id": node['node_id'],
+                "compute_id": "local"
+            }
 
-                    node = self.api_client.update_node(node["project_id"], 
-                                                node["node_id"], 
-                                                cloud_data_dict)
-                else:
-                    # Create node in GNS3
-                    node = self.api_client.create_node(
-                        project_id=project_id,
-                        name=device.name or f"{device.family}-{device.model}",
-                        template_id=template_id,
-                        position=position
-                    )
+            node = self.api_client.update_node(node["project_id"], 
+                                        node["node_id"], 
+                                        cloud_data_dict)
+        else:
+            # Create node in GNS3
+            node = self.api_client.create_node(
+                project_id=project_id,
+                name=device.name or f"{device.family}-{device.model}",
+                template_id=template_id,
+                position=position
+            )
 
-                    base_mac_dict = {
-                        "properties": {
-                            "mac_address": device.base_mac
-                        }
-                    }
+            base_mac_dict = {
+                "properties": {
+                    "mac_address": device.base_mac
+                }
+            }
 
-                    # call set_mac to set the base mac of the node
-                    self.api_client.update_node(node["project_id"], 
-                                                node["node_id"], 
-                                                base_mac_dict)
+            # call set_mac to set the base mac of the node
+            self.api_client.update_node(node["project_id"], 
+                                        node["node_id"], 
+                                        base_mac_dict)
 
+        self.logger.info(f"Created node for device: {device.name} (using template: {template_id})")
+        return node['node_id']
+
+    def build_devices(self, device_list: List[Device], project_id: str) -> Dict[str, str]:
+        """Create nodes in GNS3 based on device list."""
+        node_mapping = {}  # Map device IDs to GNS3 node IDs
+        
+        for device in device_list:
+            try:
                 # Store mapping
-                node_mapping[device.id] = node['node_id']
-                self.logger.info(f"Created node for device: {device.name} (using template: {template_id})")
+                node_mapping[device.id] = self.build_device(device, project_id)
             except GNS3ApiError as e:
                 self.logger.error(f"Failed to create node for device {device.name}: {str(e)}")
         
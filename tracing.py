@@ -0,0 +1,199 @@
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from data_model import DeviceResult
+import functools
+import threading
+import logging
+import json
+import time
+import uuid
+import os
+
+# Environment variable naming the JSONL file spans are exported to
+TRACE_FILE_ENV = "NDT_TRACE_FILE"
+
+OK = "ok"
+ERROR = "error"
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    # Wall clock start for correlating runs, perf_counter based duration for accuracy
+    start: float = 0.0
+    end: Optional[float] = None
+    duration: Optional[float] = None
+    status: str = OK
+    error: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    thread: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, error: str) -> None:
+        self.status = ERROR
+        self.error = error
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+# Called with every span that ends, whether or not it is written, on every tracer
+_listeners: List[Callable[[Span], None]] = []
+
+class Tracer:
+    """
+    Records nested spans and writes each one as a JSON line when it ends, so a run
+    that fails halfway still leaves the spans it finished. Without a path spans are
+    tracked but not written. Parents follow contextvars, so work handed to a thread
+    pool must be wrapped with propagate() to stay in its parent span.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """Initialize the tracer, appending to path if given."""
+        self.trace_id = uuid.uuid4().hex
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(path, 'a', encoding='utf-8')
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """Run the block in a child span of the current span. Exceptions are recorded and re-raised."""
+        parent = _current_span.get()
+        current = Span(name=name, trace_id=self.trace_id, span_id=uuid.uuid4().hex[:16],
+                       parent_id=parent.span_id if parent else None, start=time.time(),
+                       attributes=attributes, thread=threading.current_thread().name)
+        token = _current_span.set(current)
+        start_time = time.perf_counter()
+        try:
+            yield current
+        except BaseException as e:
+            current.set_error(str(e) or type(e).__name__)
+            raise
+        finally:
+            current.duration = time.perf_counter() - start_time
+            current.end = current.start + current.duration
+            _current_span.reset(token)
+            self.export(current)
+
+    def event(self, name: str, kind: str, **attributes: Any) -> None:
+        """Record a point in time as a zero length span of the given kind."""
+        parent = _current_span.get()
+        now = time.time()
+        self.export(Span(name=name, trace_id=self.trace_id, span_id=uuid.uuid4().hex[:16],
+                         parent_id=parent.span_id if parent else None, start=now, end=now, duration=0.0,
+                         attributes={"kind": kind, **attributes}, thread=threading.current_thread().name))
+
+    def metric(self, name: str, value: float, **attributes: Any) -> None:
+        """Record a derived measurement, such as a delay spanning several stages, as a zero length span."""
+        self.event(name, "metric", value=value, **attributes)
+
+    def export(self, span: Span) -> None:
+        for listener in list(_listeners):
+            try:
+                listener(span)
+            except Exception as e:
+                self.logger.error(f"Span listener failed on {span.name}: {str(e)}")
+        if self._file is None:
+            return
+        line = json.dumps(asdict(span), default=str)
+        with self._lock:
+            # Spans of abandoned threads may end after the tracer is closed
+            if self._file is None:
+                return
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+_tracer = Tracer(os.environ.get(TRACE_FILE_ENV))
+
+def configure(path: Optional[str] = None) -> Tracer:
+    """Replace the global tracer. path defaults to the NDT_TRACE_FILE environment variable."""
+    global _tracer
+    _tracer.close()
+    _tracer = Tracer(path or os.environ.get(TRACE_FILE_ENV))
+    return _tracer
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+def span(name: str, **attributes: Any):
+    """Context manager for a span on the global tracer."""
+    return _tracer.span(name, **attributes)
+
+def metric(name: str, value: float, **attributes: Any) -> None:
+    """Record a derived measurement on the global tracer."""
+    _tracer.metric(name, value, **attributes)
+
+def event(name: str, kind: str, **attributes: Any) -> None:
+    """Record a point in time on the global tracer."""
+    _tracer.event(name, kind, **attributes)
+
+def add_listener(listener: Callable[[Span], None]) -> None:
+    """Call listener with every span that ends, i.e to derive metrics from them."""
+    _listeners.append(listener)
+
+def remove_listener(listener: Callable[[Span], None]) -> None:
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+def set_attribute(key: str, value: Any) -> None:
+    """Set an attribute on the current span, if there is one."""
+    current = _current_span.get()
+    if current is not None:
+        current.set_attribute(key, value)
+
+def propagate(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap func to run in the caller's context, keeping spans nested across thread pools."""
+    context = copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # A context can only be entered by one thread at a time, so every call gets its own copy
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+def traced(name: str, **attributes: Any) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorator running the function in a span. The outcome of a returned DeviceResult is recorded on it."""
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _tracer.span(name, **attributes) as current:
+                result = func(*args, **kwargs)
+                if isinstance(result, DeviceResult):
+                    current.set_attribute("device_id", result.device_id)
+                    current.set_attribute("device", result.name)
+                    current.set_attribute("success", result.success)
+                    if result.error:
+                        current.set_error(result.error)
+                return result
+        return wrapper
+    return decorator
+
+def read_trace(path: str) -> List[Dict[str, Any]]:
+    """Load the spans of a JSONL trace file. A line cut off by a killed run is skipped."""
+    spans = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                continue
+    return spans
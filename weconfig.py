@@ -0,0 +1,102 @@
+from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from data_model import DeviceResult
+from xmlTranslate import xml_info
+from backup_manifest import BACKUP_DIR
+import subprocess
+import tempfile
+import logging
+import tracing
+import zipfile
+import shutil
+import time
+import os
+
+# On Oskar's computer, the path to the new WeConfig is:
+# ~\AppData\Local\WeConfig-dev-cli\current\WeConfig.exe
+
+# On the server, the path to the new WeConfig is the same
+WECONFIG = os.path.join("..", "Publish", "WeConfig.exe" if os.name == 'nt' else "WeConfig")
+
+logger = logging.getLogger(__name__)
+
+def run_scan(path, adapterNameorId = "Wi-Fi"):
+    subprocess.run([WECONFIG, "discover", "--adapterNameOrId",
+                    adapterNameorId, "--useMdns", "--useIpConfig", "-p", path])
+
+def run_backup(path, ip):
+    subprocess.run([WECONFIG, "backup", "-s", ip, "-p", path])
+
+def discovered_addresses(project_path: str) -> Dict[str, str]:
+    """Return device ID -> ManagementIpAddress for every device in a .nprj project."""
+    with zipfile.ZipFile(project_path, 'r') as zip_ref:
+        with zip_ref.open("Project.xml") as project_xml:
+            xml = xml_info(project_xml)
+            xml.findDevices()
+
+    return {device_id: device['ip_address'] for device_id, device in xml.device_list.items()
+            if device.get('ip_address')}
+
+def _merge_backups(source_path: str, target_path: str) -> int:
+    """Copy the backup entries of one .nprj into another. Returns the number of entries added."""
+    with zipfile.ZipFile(target_path, 'r') as target:
+        existing = {name.replace('\\', '/') for name in target.namelist()}
+
+    added = 0
+    with zipfile.ZipFile(source_path, 'r') as source, zipfile.ZipFile(target_path, 'a', zipfile.ZIP_DEFLATED) as target:
+        for entry in source.infolist():
+            name = entry.filename.replace('\\', '/')
+            if name.startswith(f"{BACKUP_DIR}/") and not entry.is_dir() and name not in existing:
+                target.writestr(name, source.read(entry))
+                existing.add(name)
+                added += 1
+    return added
+
+def run_targeted_backup(path: str, addresses: Optional[Dict[str, str]] = None,
+                        max_workers: int = 4, timeout: float = 60) -> List[DeviceResult]:
+    """
+    Back up only the devices found by run_scan instead of probing a whole subnet.
+    Each device is backed up by its own WeConfig process into a copy of the project,
+    and the resulting backups are merged into the project at path.
+    addresses maps device IDs to IP addresses and defaults to the devices in the project.
+    """
+    addresses = addresses if addresses is not None else discovered_addresses(path)
+    work_dir = tempfile.mkdtemp(prefix="weconfig_backup_")
+
+    @tracing.traced("weconfig_backup")
+    def backup_device(device_id: str, ip: str) -> DeviceResult:
+        report = DeviceResult(device_id=device_id, name=ip)
+        start_time = time.perf_counter()
+        device_project = os.path.join(work_dir, f"{device_id}.nprj")
+        try:
+            shutil.copyfile(path, device_project)
+            completed = subprocess.run([WECONFIG, "backup", "-s", f"{ip}/32", "-p", device_project],
+                                       capture_output=True, text=True, timeout=timeout)
+            if completed.returncode != 0:
+                report.error = completed.stderr.strip() or f"WeConfig exited with status {completed.returncode}"
+            else:
+                report.success = True
+        except subprocess.TimeoutExpired:
+            report.error = f"Timed out after {timeout}s"
+        except OSError as e:
+            report.error = str(e)
+        report.duration = time.perf_counter() - start_time
+        return report
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(tracing.propagate(backup_device), device_id, ip) for device_id, ip in addresses.items()]
+            results = [future.result() for future in futures]
+
+        # Merge one at a time, the project archive is not safe for concurrent writers
+        for result in results:
+            if result.success:
+                added = _merge_backups(os.path.join(work_dir, f"{result.device_id}.nprj"), path)
+                result.details['backups'] = added
+                logger.info(f"Backed up {result.device_id} ({result.name}) in {result.duration:.4f}s")
+            else:
+                logger.error(f"Failed to back up {result.device_id} ({result.name}): {result.error}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return results
@@ -0,0 +1,200 @@
+from typing import Dict, Any, Callable, Optional, Tuple
+from urllib3.exceptions import InsecureRequestWarning
+import requests
+import threading
+import warnings
+import logging
+import yaml
+import os
+import re
+
+class WeOSWebError(Exception):
+    """Custom exception for WeOS web interface errors."""
+    pass
+
+class WeOSWebClient:
+    """Authenticated session against the web interface of a single WeOS device."""
+
+    SID_PATTERN = re.compile(r'&amp;(sid[^"]*)')
+
+    def __init__(self, address: str, username: str = "admin", password: str = "admin",
+                 verify: Any = False, timeout: float = 30):
+        """Initialize the client. address is the base URL of the device, i.e https://1.2.3.4"""
+        self.address = address
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.verify = verify
+        self.sid: Optional[str] = None
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        if verify is False:
+            # WeOS ships self-signed certificates. Installed once for the process, as
+            # warnings.catch_warnings() per request is not thread-safe. Adding it again is a no-op.
+            warnings.filterwarnings('ignore', category=InsecureRequestWarning)
+
+    def set_password(self, password: str) -> None:
+        """Use password from now on, logging in again before the next request."""
+        with self._lock:
+            if password != self.password:
+                self.password = password
+                self.sid = None
+
+    def login(self) -> None:
+        """Authenticate and keep the session id in memory."""
+        login_data = {
+            'action': 'login',
+            'restore_action': 'environment',
+            'autorefresh': '0',
+            'command': 'auth',
+            'uname': self.username,
+            'pass': self.password
+        }
+
+        self.logger.debug(f"Authenticating to {self.address}")
+        try:
+            response = self.session.post(self.address, data=login_data, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            raise WeOSWebError(f"Login to {self.address} failed: {str(e)}")
+
+        # The session id is only handed out inside the returned page, i.e "&amp;sid=12345"
+        match = self.SID_PATTERN.search(response.text)
+        if not match:
+            raise WeOSWebError(f"Failed to extract session ID from {self.address}")
+
+        self.sid = match.group(1)
+        if '=' in self.sid:
+            name, value = self.sid.split('=', 1)
+            self.session.cookies.set(name, value)
+        self.logger.debug(f"Session id for {self.address} is {self.sid}")
+
+    def _session_expired(self, response: requests.Response) -> bool:
+        """An expired session is answered with an error status or the login form."""
+        if response.status_code in (401, 403):
+            return True
+        content_type = response.headers.get('Content-Type', '')
+        return 'text/html' in content_type and 'name="uname"' in response.text
+
+    def _post(self, build_request: Callable[[], Tuple[Dict[str, Any], Callable[[], None]]],
+              stream: bool = False, timeout: Optional[float] = None) -> requests.Response:
+        """
+        POST with the current session, logging in first if needed and once more if it has expired.
+        timeout overrides the client's timeout for this request.
+        build_request returns the keyword arguments for the request and a cleanup function,
+        so an uploaded file can be reopened for the retry.
+        """
+        with self._lock:
+            if self.sid is None:
+                self.login()
+
+            for attempt in range(2):
+                kwargs, cleanup = build_request()
+                try:
+                    response = self.session.post(self.address, timeout=timeout or self.timeout,
+                                                 stream=stream, **kwargs)
+                except requests.exceptions.RequestException as e:
+                    raise WeOSWebError(f"Request to {self.address} failed: {str(e)}")
+                finally:
+                    cleanup()
+
+                if attempt == 0 and self._session_expired(response):
+                    self.logger.debug(f"Session for {self.address} expired, re-authenticating")
+                    response.close()
+                    self.login()
+                    continue
+                break
+
+        if response.status_code != 200:
+            raise WeOSWebError(f"Request to {self.address} failed with status code "
+                               f"{response.status_code}: {response.text[:100]}")
+        return response
+
+    def backup(self, file_path: str) -> None:
+        """Download the device configuration to file_path."""
+        def build_request():
+            return {'files': {'action': (None, 'backup'), 'command': (None, 'backup')}}, lambda: None
+
+        response = self._post(build_request, stream=True)
+        try:
+            with open(file_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=65536):
+                    f.write(chunk)
+        finally:
+            response.close()
+
+    def restore(self, file_path: str, timeout: Optional[float] = None) -> requests.Response:
+        """Upload file_path as the new device configuration. timeout overrides the client's timeout."""
+        def build_request():
+            f = open(file_path, 'rb')
+            return {'data': {'action': 'backup', 'command': 'restore'},
+                    'files': {'restore_file': (os.path.basename(file_path), f, 'application/octet-stream')}}, f.close
+
+        return self._post(build_request, timeout=timeout)
+
+    def close(self) -> None:
+        """Close the HTTP session."""
+        self.session.close()
+
+class WeOSSessionPool:
+    """Keeps one authenticated WeOSWebClient per device, shared by backup and restore calls."""
+
+    def __init__(self, username: str = "admin", password: str = "admin",
+                 verify: Any = False, timeout: float = 30):
+        """Initialize the pool with the default credentials and TLS settings for new clients."""
+        self.username = username
+        self.password = password
+        self.verify = verify
+        self.timeout = timeout
+        self._clients: Dict[Tuple[str, str], WeOSWebClient] = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def from_config(cls, config_path: str = "config.yaml") -> "WeOSSessionPool":
+        """Create a pool from the device credentials and the weos section of config.yaml."""
+        try:
+            with open(config_path, 'r') as file:
+                config = yaml.safe_load(file)
+        except Exception as e:
+            raise WeOSWebError(f"Failed to load configuration: {str(e)}")
+
+        configuration = config.get('configuration', {})
+        weos_config = config.get('weos', {})
+        return cls(username=configuration.get('username', 'admin'),
+                   password=configuration.get('password', 'admin'),
+                   verify=weos_config.get('verify_tls', False),
+                   timeout=weos_config.get('timeout', 30))
+
+    def get(self, address: str, username: Optional[str] = None, password: Optional[str] = None) -> WeOSWebClient:
+        """
+        Return the client for address and username, creating it on first use.
+        A client asked for with another password logs in again with it.
+        """
+        username = username or self.username
+        password = password or self.password
+        with self._lock:
+            client = self._clients.get((address, username))
+            if client is None:
+                client = WeOSWebClient(address, username, password, self.verify, self.timeout)
+                self._clients[(address, username)] = client
+            elif client.password != password:
+                self.logger.debug(f"Password for {username}@{address} changed, logging in again")
+                client.set_password(password)
+            return client
+
+    def backup(self, address: str, file_path: str) -> None:
+        """Download the configuration of the device at address."""
+        self.get(address).backup(file_path)
+
+    def restore(self, address: str, file_path: str, timeout: Optional[float] = None) -> requests.Response:
+        """Restore file_path on the device at address."""
+        return self.get(address).restore(file_path, timeout)
+
+    def close(self) -> None:
+        """Close all sessions."""
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()